@@ -0,0 +1,199 @@
+import math
+from array import array
+
+from epoch import EpochAssembler, nan
+from messages import NmeaMessage
+
+# Values of the GGA fix quality field: 0 invalid, 1 GPS, 2 DGPS, ... 8 simulation.
+n_fix_qualities = 9
+
+# Mean radius of the earth, to turn the spread of the coordinates into metres.
+earth_radius = 6371008.8
+
+
+class RunningStatistics:
+    """
+    Count, mean and standard deviation of a stream of values in constant memory, with Welford's algorithm.
+
+    >>> stats = RunningStatistics()
+    >>> for value in [2., 4., 4., 4., 5., 5., 7., 9.]:
+    ...     stats.add(value)
+    >>> stats.n, stats.mean, stats.std
+    (8, 5.0, 2.0)
+    """
+    __slots__ = ['n', 'mean', '_m2']
+
+    def __init__(self):
+        self.n = 0
+        self.mean = nan
+        self._m2 = 0.
+
+    def add(self, value):
+        self.n += 1
+        if self.n == 1:
+            self.mean = value
+            return
+        delta = value - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        """
+        Population standard deviation, or nan if there are no values.
+        """
+        return math.sqrt(self._m2 / self.n) if self.n else nan
+
+
+class WindowSummary:
+    """
+    The aggregate of the fixes in one window [start, end).
+
+    Positions are only taken from fixes that have one. The spread of the positions is given in metres to the east,
+    to the north and up.
+    """
+    __slots__ = [
+        'start', 'end', 'n_fixes',
+        'latitude', 'longitude', 'altitude',
+        'max_speed', 'fix_quality_counts',
+    ]
+
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end
+        self.n_fixes = 0
+        self.latitude = RunningStatistics()
+        self.longitude = RunningStatistics()
+        self.altitude = RunningStatistics()
+        self.max_speed = nan
+        self.fix_quality_counts = array('I', [0] * n_fix_qualities)
+
+    def add(self, fix):
+        self.n_fixes += 1
+        if 0 <= fix.fix_quality < n_fix_qualities:
+            self.fix_quality_counts[fix.fix_quality] += 1
+        if fix.latitude == fix.latitude and fix.longitude == fix.longitude:
+            self.latitude.add(fix.latitude)
+            self.longitude.add(fix.longitude)
+        if fix.altitude == fix.altitude:
+            self.altitude.add(fix.altitude)
+        if fix.speed == fix.speed and not fix.speed <= self.max_speed:
+            self.max_speed = fix.speed
+
+    @property
+    def std_north(self):
+        return math.radians(self.latitude.std) * earth_radius
+
+    @property
+    def std_east(self):
+        return math.radians(self.longitude.std) * earth_radius * math.cos(math.radians(self.latitude.mean))
+
+    @property
+    def std_up(self):
+        return self.altitude.std
+
+    def __str__(self):
+        return ', '.join([
+            "Window {:.2f} to {:.2f} s: {} fixes".format(self.start, self.end, self.n_fixes),
+            "{:.6f}, {:.6f}, {:.1f} m".format(self.latitude.mean, self.longitude.mean, self.altitude.mean),
+            "std {:.2f} m E, {:.2f} m N, {:.2f} m U".format(self.std_east, self.std_north, self.std_up),
+            "max speed {:.2f} m/s".format(self.max_speed),
+            "fix qualities {}".format({quality: n for quality, n in enumerate(self.fix_quality_counts) if n}),
+        ])
+
+
+class WindowAggregator:
+    """
+    Reduces the fixes of one receiver to one WindowSummary per window, in constant memory. A summary is handed out when
+    the first fix of a later window arrives (or on flush), so windows without fixes are skipped.
+
+    Fixes are placed by their POSIX time, or by their time of day if the date is not known (no RMC sentences).
+
+    >>> from epoch import FixRecord
+    >>> aggregator = WindowAggregator(length=1.0)
+    >>> summaries = []
+    >>> for i in range(25):
+    ...     fix = FixRecord()
+    ...     fix.seconds = 100 + i * 0.05  # 20 Hz
+    ...     fix.latitude = -33.9 + (i % 2) * 1e-5
+    ...     fix.longitude = 18.4
+    ...     fix.altitude = 10.
+    ...     fix.fix_quality = 1 if i % 5 else 2
+    ...     fix.speed = i / 10
+    ...     summary = aggregator.add(fix)
+    ...     if summary is not None:
+    ...         summaries.append(summary)
+    >>> s = summaries[0]
+    >>> s.start, s.end, s.n_fixes, round(s.latitude.mean, 6), round(s.std_north, 2), s.max_speed
+    (100.0, 101.0, 20, -33.899995, 0.56, 1.9)
+    >>> list(s.fix_quality_counts[:3])
+    [0, 16, 4]
+    >>> aggregator.flush().n_fixes
+    5
+    """
+
+    def __init__(self, length=1.0, offset=0.0):
+        """
+
+        :param length: Length of a window in seconds.
+
+        :param offset: Windows start at offset + k * length, e.g. length=60 and offset=0 for whole minutes. None starts
+        the first window at the first fix.
+
+        """
+        if length <= 0:
+            raise ValueError("The window length has to be positive, not {}.".format(length))
+        self.length = length
+        self.offset = offset
+        self.summary = None
+
+    def add(self, fix):
+        """
+        :param epoch.FixRecord fix:
+
+        :return: The summary of the previous window if this fix is the first of a later one, otherwise None.
+        """
+        t = fix.timestamp()
+        if t != t:
+            t = fix.seconds
+        if t != t:
+            return None  # No time at all.
+
+        completed = None
+        if self.summary is not None and not self.summary.start <= t < self.summary.end:
+            completed = self.summary
+            self.summary = None
+        if self.summary is None:
+            if self.offset is None:
+                self.offset = t
+            start = self.offset + math.floor((t - self.offset) / self.length) * self.length
+            self.summary = WindowSummary(start, start + self.length)
+        self.summary.add(fix)
+        return completed
+
+    def flush(self):
+        """
+        :return: The summary of the current window, even though it is not complete, or None if it has no fixes.
+        """
+        completed = self.summary
+        self.summary = None
+        return completed
+
+    def aggregate(self, messages):
+        """
+        :param messages: Iterable of messages, e.g. from common.interpret_messages. Anything that is not an NMEA
+        sentence is ignored.
+
+        :return: Generator that yields a summary per window, and the incomplete last one when the stream ends.
+        """
+        assembler = EpochAssembler()
+        for msg in messages:
+            if type(msg) is NmeaMessage:
+                fix = assembler.add(msg.nmea_string)
+                if fix is not None:
+                    summary = self.add(fix)
+                    if summary is not None:
+                        yield summary
+        summary = self.flush()
+        if summary is not None:
+            yield summary
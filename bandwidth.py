@@ -0,0 +1,136 @@
+from fields import BaudRateField
+
+# Typical length in bytes (including $, checksum and \r\n) of each NMEA sentence, for one fix. GSV is usually split
+# over 3 sentences.
+nmea_sentence_lengths = {
+    'GGA': 72,
+    'GSA': 66,
+    'GSV': 3 * 70,
+    'GLL': 51,
+    'RMC': 70,
+    'VTG': 42,
+    'ZDA': 38,
+}
+
+# Number of fixes between two sentences of each type (0 = off), as the receiver is configured out of the box.
+default_nmea_intervals = {
+    'GGA': 1,
+    'GSA': 1,
+    'GSV': 1,
+    'GLL': 0,
+    'RMC': 1,
+    'VTG': 1,
+    'ZDA': 0,
+}
+
+# Start bit, 8 data bits and a stop bit.
+bits_per_byte = 10
+
+# The application note says that update rates of 4 Hz or more need at least 38400 bps, regardless of the output.
+minimum_baudrate_for_update_rate = {4: 38400}
+
+
+def bytes_per_second(update_rate, nmea_intervals=None, binary_bytes_per_fix=0):
+    """
+    Estimate the output of the receiver.
+
+    >>> bytes_per_second(1)
+    460.0
+    >>> bytes_per_second(20, {'GGA': 1, 'RMC': 2})
+    2140.0
+
+    :param update_rate: Fixes per second.
+
+    :param nmea_intervals: dict mapping NMEA sentence types to the number of fixes between two sentences (0 = off).
+
+    :param binary_bytes_per_fix: Bytes of binary messages per fix.
+
+    """
+    if nmea_intervals is None:
+        nmea_intervals = default_nmea_intervals
+    per_fix = binary_bytes_per_fix
+    for sentence, interval in nmea_intervals.items():
+        if interval:
+            per_fix += nmea_sentence_lengths[sentence] / interval
+    return update_rate * per_fix
+
+
+def minimum_baudrate(update_rate, nmea_intervals=None, binary_bytes_per_fix=0, utilization=0.8):
+    """
+    The lowest baud rate in BaudRateField.allowed_values that can carry the output without being used more than the
+    given fraction of the time.
+
+    >>> minimum_baudrate(1)
+    9600
+    >>> minimum_baudrate(10)
+    57600
+    >>> minimum_baudrate(20)
+    115200
+    >>> minimum_baudrate(20, {'GGA': 1}, utilization=0.5)
+    38400
+    >>> minimum_baudrate(20, binary_bytes_per_fix=200)
+    Traceback (most recent call last):
+    ...
+    ValueError: 13200 B/s at 20 Hz does not fit in 115200 bps.
+    """
+    needed = bytes_per_second(update_rate, nmea_intervals, binary_bytes_per_fix) * bits_per_byte / utilization
+    floor = 0
+    for rate, baudrate in minimum_baudrate_for_update_rate.items():
+        if update_rate >= rate:
+            floor = max(floor, baudrate)
+    for baudrate in sorted(BaudRateField.allowed_values.values()):
+        if baudrate >= needed and baudrate >= floor:
+            return baudrate
+    raise ValueError("{:.0f} B/s at {} Hz does not fit in {} bps.".format(
+        bytes_per_second(update_rate, nmea_intervals, binary_bytes_per_fix),
+        update_rate,
+        max(BaudRateField.allowed_values.values()),
+    ))
+
+
+def ensure_bandwidth(ser, update_rate, current_baudrate, nmea_intervals=None, binary_bytes_per_fix=0,
+                     utilization=0.8, permanent=True, messages=None, on_message=None):
+    """
+    Step the link up with ConfigureSerialPortMessage if it can't carry the output at the given update rate. Do this
+    before raising the update rate with ConfigurePositionUpdateRateMessage, so that the link is never oversubscribed.
+    The baud rate is never lowered.
+
+    >>> import io
+    >>> class FakeSerial(io.BytesIO):
+    ...     baudrate = 9600
+    ...     def write(self, b):
+    ...         print(b.hex())
+    >>> ser = FakeSerial(bytes.fromhex('a0a100028305860d0a'))  # ACK configure serial port
+    >>> ensure_bandwidth(ser, 20, current_baudrate=9600)
+    a0a1000405000501010d0a
+    115200
+    >>> ser.baudrate
+    115200
+    >>> ensure_bandwidth(ser, 1, current_baudrate=115200)
+    115200
+
+    :param Serial ser: The serial interface. Its baud rate is changed along with that of the receiver.
+
+    :param current_baudrate: The baud rate that the receiver uses now.
+
+    :param permanent: Whether to write the new baud rate to FLASH too.
+
+    :param messages: Iterable of interpreted messages from the GPS unit, used to look for the ACK. By default, they
+    are read from ser.
+
+    :param on_message: Called with every message that is read, e.g. print.
+
+    :return: The baud rate that the receiver uses afterwards.
+    """
+    from input_messages import ConfigureSerialPortMessage
+    from writer import BurstWriter
+
+    baudrate = minimum_baudrate(update_rate, nmea_intervals, binary_bytes_per_fix, utilization)
+    if baudrate <= current_baudrate:
+        return current_baudrate
+
+    writer = BurstWriter(ser, messages=messages, on_message=on_message)
+    writer.queue(ConfigureSerialPortMessage(rate=baudrate, permanent=permanent))
+    writer.flush()
+    ser.baudrate = baudrate
+    return baudrate
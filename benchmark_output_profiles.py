@@ -0,0 +1,13 @@
+#!/usr/bin/env python3
+
+from output_profiles import benchmark
+
+
+if __name__ == '__main__':
+    results = benchmark(n_fixes=10000)
+    for name, seconds in results.items():
+        print("{}: {:.1f} µs per fix in interpret_messages ({:.0f}% of default)".format(
+            name,
+            seconds * 1e6,
+            100 * seconds / results['default'],
+        ))
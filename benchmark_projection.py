@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+
+from projection import benchmark
+
+
+if __name__ == '__main__':
+    n_points = 10 ** 7
+    for name, nanoseconds in benchmark(n_points=n_points).items():
+        print("{}: {:.0f} ns per point ({:.1f} s for {} points)".format(
+            name,
+            nanoseconds,
+            nanoseconds * n_points / 1e9,
+            n_points,
+        ))
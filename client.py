@@ -0,0 +1,143 @@
+import contextlib
+import queue
+import threading
+
+from common import interpret_messages, read_lines
+from priority import PriorityBuffer
+
+
+class Client:
+    """
+    Full-duplex synchronous access to the GPS unit.
+
+    A reader thread drains the UART into the receive buffer of common.read_lines and decodes the frames as soon as
+    they arrive, so the UART FIFO never has to wait for the consumer. Decoded messages are detached from the receive
+    buffer and put in a bounded priority.PriorityBuffer. The consumer gets ACKs, NACKs and query responses before other
+    binary messages, and those before NMEA sentences. If the consumer falls behind and the buffer is full, messages of
+    the lowest priority are shed (and counted in messages.n_shed) rather than blocking the reader. Writes go straight
+    to the port from the calling thread and never wait for reads.
+
+    >>> import io
+    >>> ser = io.BytesIO(b'$GPGGA,1\\r\\n' + bytes.fromhex('a0a100028302810d0a'))
+    >>> with Client(ser, timeout=1) as client:
+    ...     messages = iter(client)
+    ...     sorted(str(next(messages)) for _ in range(2))
+    ["GPS acknowleges 'Query software version' (0x02)", "b'$GPGGA,1\\\\r\\\\n'"]
+    """
+
+    def __init__(self, ser, queue_size=1000, skip_nmea=False, timeout=2.0):
+        """
+
+        :param Serial ser: The serial interface. Should have a read timeout, so that the reader thread can be stopped.
+
+        :param queue_size: Maximum number of decoded messages waiting for the consumer.
+
+        :param skip_nmea: Don't decode or queue NMEA sentences.
+
+        :param timeout: Seconds to wait for a message when iterating, before raising TimeoutError.
+
+        """
+        self.ser = ser
+        self.skip_nmea = skip_nmea
+        self.timeout = timeout
+        self.messages = PriorityBuffer(maxsize=queue_size)
+        self.n_timeouts = 0
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.messages.get(timeout=self.timeout)
+            except queue.Empty:
+                raise TimeoutError("No message from the GPS unit for {} s.".format(self.timeout))
+
+    @property
+    def n_dropped(self):
+        return sum(self.messages.n_shed.values())
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._read, name='venus6-reader', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        cancel_read = getattr(self.ser, 'cancel_read', None)
+        if cancel_read is not None:
+            cancel_read()
+        self._thread.join()
+
+    def write(self, msg):
+        with self._write_lock:
+            self.ser.write(bytes(msg))
+
+    def clear(self):
+        """
+        Throw away all messages that are waiting in the queue.
+        """
+        while True:
+            try:
+                self.messages.get_nowait()
+            except queue.Empty:
+                return
+
+    def detect_baudrate(self, look_for_ack_limit, retries):
+        """
+        Like common.detect_baudrate, but changes the baud rate of the open port instead of reopening it.
+
+        >>> import io
+        >>> class FakeSerial(io.BytesIO):
+        ...     baudrate = None
+        ...     def write(self, b):
+        ...         if self.baudrate == 9600:
+        ...             self.seek(0)
+        ...             super().write(bytes.fromhex('a0a100028302810d0a'))
+        ...             self.seek(0)
+        >>> with Client(FakeSerial(), timeout=0.1) as client:
+        ...     client.detect_baudrate(look_for_ack_limit=10, retries=1)
+        Trying 4800 bps (attempt 1 of 1)...
+        Probing software version...
+        Waiting for ACK...
+        Timeout: No message from the GPS unit for 0.1 s.
+        Trying 9600 bps (attempt 1 of 1)...
+        Probing software version...
+        Waiting for ACK...
+        Got ACK after 0 messages.
+        (1, 9600)
+        """
+        from common import probe_baudrates
+
+        return probe_baudrates(self._at_baudrate, look_for_ack_limit, retries)
+
+    @contextlib.contextmanager
+    def _at_baudrate(self, baudrate):
+        # Never change the baud rate while the reader thread may be inside ser.read.
+        running = self._thread is not None and self._thread.is_alive()
+        if running:
+            self.stop()
+        self.ser.baudrate = baudrate
+        if hasattr(self.ser, 'reset_input_buffer'):
+            self.ser.reset_input_buffer()
+        self.clear()
+        if running:
+            self.start()
+        yield self.write, self
+
+    def _read(self):
+        while not self._stop.is_set():
+            try:
+                for msg in interpret_messages(read_lines(self.ser), skip_nmea=self.skip_nmea):
+                    self.messages.put(msg.detach())
+                    if self._stop.is_set():
+                        return
+            except TimeoutError:
+                self.n_timeouts += 1
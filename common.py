@@ -1,13 +1,17 @@
+import logging
+
+from diagnostics import logger
 
 byteorder = 'big'
 port = '/dev/ttyAMA0'
 baudrate = 115200
 
 
-def read_lines(ser, line_separator=b'\r\n', max_length=100):
+def read_lines(ser, line_separator=b'\r\n', max_length=100, buffer_size=4096):
     """
 
-    :param Serial ser: The serial interface. Has to have a read method which returns bytes.
+    :param Serial ser: The serial interface. Has to have a read method which returns bytes. If it also has an
+    in_waiting attribute (like pyserial's Serial), everything that is already waiting is read in one call.
 
     :param line_separator: The characters to look for to determine the end of a line. They will not be stripped or
     converted.
@@ -15,18 +19,54 @@ def read_lines(ser, line_separator=b'\r\n', max_length=100):
     :param max_length: Stop if the line gets longer than this number of bytes. NMEA messages should always be at most
     82 characters long, so 100 is a safe threshold. This helps to detect endless streams of garbage.
 
-    :return: Generator that yields one line at a time.
+    :param buffer_size: Size of the receive buffer. Lines are yielded as memoryviews into this buffer. When it is
+    full, a fresh buffer is allocated and the unfinished line is moved there. Bytes in a buffer are never overwritten,
+    so a view stays valid for as long as someone holds it, but it also keeps the whole buffer alive. Use bytes(line)
+    (or the detach method of a message) to keep a line around for longer.
+
+    :return: Generator that yields one line at a time, as a memoryview.
+
+    >>> import io
+    >>> lines = read_lines(io.BytesIO(b'$GPGGA,1\\r\\n\\xa0\\xa1\\r\\n'))
+    >>> [bytes(next(lines)) for _ in range(2)]
+    [b'$GPGGA,1\\r\\n', b'\\xa0\\xa1\\r\\n']
+    >>> next(lines)
+    Traceback (most recent call last):
+    ...
+    TimeoutError: UART Timeout
 
     """
+    buffer_size = max(buffer_size, 2 * (max_length + len(line_separator)))
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    start = 0  # Start of the current line.
+    end = 0  # End of the received data.
+    search_from = 0
     while True:
-        line = b''
-        while not line.endswith(line_separator):
-            new_byte = ser.read(1)
-            if len(new_byte) != 1:
-                raise TimeoutError("UART Timeout")
-            line += new_byte
-            if len(line) > max_length:
+        i_separator = buffer.find(line_separator, search_from, end)
+        if i_separator < 0:
+            if end - start > max_length:
                 raise TimeoutError("UART line longer than {} bytes. Maybe the baud rate is wrong?".format(max_length))
+            if end == buffer_size:
+                # Don't touch the old buffer, since there may still be views into it. Start a new one instead.
+                buffer = bytearray(buffer_size)
+                buffer[:end - start] = view[start:end]
+                view = memoryview(buffer)
+                end -= start
+                start = 0
+            search_from = max(start, end - len(line_separator) + 1)
+            new_bytes = ser.read(max(1, min(getattr(ser, 'in_waiting', 0), buffer_size - end)))
+            if len(new_bytes) == 0:
+                raise TimeoutError("UART Timeout")
+            view[end:end + len(new_bytes)] = new_bytes
+            end += len(new_bytes)
+            continue
+
+        line_end = i_separator + len(line_separator)
+        if line_end - start > max_length:
+            raise TimeoutError("UART line longer than {} bytes. Maybe the baud rate is wrong?".format(max_length))
+        line = view[start:line_end]
+        start = search_from = line_end
         yield line
 
 
@@ -38,52 +78,89 @@ def read_lines_ignoring_timeouts(ser, line_separator=b'\r\n', max_length=100, ma
                 yield line
         except TimeoutError as e:
             n_timeouts += 1
-            print("Timeout {} of {}: {}".format(
-                n_timeouts,
-                max_timeouts,
-                e
-            ))
+            logger.warning("Timeout %d of %d: %s", n_timeouts, max_timeouts, e)
     raise TimeoutError("Maximum number of timeouts reached.")
 
 
-def interpret_messages(lines, skip_nmea=False):
-    from output_messages import OutputMessage
+def interpret_messages(lines, skip_nmea=False, report=None, decoder=None):
+    """
+
+    :param lines: Iterable of lines, e.g. from read_lines.
+
+    :param skip_nmea: Don't yield NMEA sentences.
+
+    :param MalformedFrameReport report: Counts the lines that could not be interpreted and logs a summary now and
+    then. By default, a new one is made. Not used if a decoder is given.
+
+    :param Decoder decoder: Decodes the binary messages and keeps running totals. By default, a new one is made.
+
+    :return: Generator that yields one message at a time. Binary messages with an unknown message ID are yielded as
+    uninterpreted OutputMessages. Lines that can't be interpreted are skipped.
+
+    """
+    from output_messages import Decoder, INVALID
     from messages import NmeaMessage
 
+    if decoder is None:
+        decoder = Decoder(report=report)
+
     for line in lines:
-        if line.startswith(b'$'):
+        if line[:1] == b'$':
             if skip_nmea:
                 continue
             else:
                 yield NmeaMessage(line)
         else:
-            try:
-                msg = OutputMessage(line)
-                try:
-                    yield msg.interpret()
-                except ValueError:
-                    yield msg
-            except ValueError:
-                print("Failed to interpret line:", line)
-    print("interpret_messages for loop completed")
+            result = decoder.decode(line)
+            if result.kind is not INVALID:
+                yield result.message
+    logger.debug("interpret_messages for loop completed")
+
+
+def look_for_ack(messages, msg_id, limit, timeout=None):
+    """
 
+    :param messages: Iterable of interpreted messages from the GPS unit.
 
-def look_for_ack(messages, msg_id, limit):
+    :param msg_id: ID of the input message to look for an ACK of.
+
+    :param limit: Give up after this number of other messages, or None to only look at the time.
+
+    :param timeout: Give up after this number of seconds, or None to only count messages. Note that this is only
+    checked when a message arrives.
+
+    :return: The number of other messages before the ACK.
+
+    """
+    import time
     from output_messages import NackMessage, AckMessage
 
+    deadline = None if timeout is None else time.monotonic() + timeout
+    debug = logger.isEnabledFor(logging.DEBUG)
     for i, m in enumerate(messages):
-        print(m)
+        if debug:
+            logger.debug("%s", m)
         if type(m) is NackMessage:
             raise RuntimeError("Got NACK")
         if type(m) is AckMessage and m.values[0].value == msg_id:
             return i  # we got our ACK
-        if i > limit:
+        if limit is not None and i > limit:
             raise TimeoutError("No ACK after {} messages.".format(limit))
+        if deadline is not None and time.monotonic() > deadline:
+            raise TimeoutError("No ACK after {} s.".format(timeout))
     raise RuntimeError("No ACK found in messages.")
 
 
-def detect_baudrate(serial_port, look_for_ack_limit, retries):
-    import serial
+def probe_baudrates(at_baudrate, look_for_ack_limit, retries):
+    """
+    Find the baud rate of the GPS unit by sending QuerySoftwareVersionMessage at each baud rate until it is
+    acknowledged.
+
+    :param at_baudrate: Called with a baud rate. Returns a context manager that gives a (write, messages) tuple while
+    the port is at that baud rate: a function that writes bytes, and an iterable of the interpreted messages.
+
+    :return: (key of BaudRateField.allowed_values, baud rate)
+    """
     from input_messages import QuerySoftwareVersionMessage
     from fields import BaudRateField
 
@@ -92,13 +169,13 @@ def detect_baudrate(serial_port, look_for_ack_limit, retries):
         for i_try in range(retries):
             br = BaudRateField.allowed_values[i_br]
             print("Trying {} bps (attempt {} of {})...".format(br, i_try + 1, retries))
-            with serial.Serial(port=serial_port, baudrate=br, timeout=1) as ser:
+            with at_baudrate(br) as (write, messages):
                 print("Probing software version...")
-                ser.write(bytes(out_msg))
+                write(bytes(out_msg))
                 print("Waiting for ACK...")
                 try:
                     i_ackmsg = look_for_ack(
-                        messages=interpret_messages(read_lines_ignoring_timeouts(ser)),
+                        messages=messages,
                         msg_id=QuerySoftwareVersionMessage.msg_id,
                         limit=look_for_ack_limit,
                     )
@@ -108,3 +185,15 @@ def detect_baudrate(serial_port, look_for_ack_limit, retries):
                     print("Timeout: {}".format(e))
                     continue
     raise RuntimeError("Failed to determine baud rate")
+
+
+def detect_baudrate(serial_port, look_for_ack_limit, retries):
+    import contextlib
+    import serial
+
+    @contextlib.contextmanager
+    def reopen(br):
+        with serial.Serial(port=serial_port, baudrate=br, timeout=1) as ser:
+            yield ser.write, interpret_messages(read_lines_ignoring_timeouts(ser))
+
+    return probe_baudrates(reopen, look_for_ack_limit, retries)
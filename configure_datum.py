@@ -1,21 +1,24 @@
 #!/usr/bin/env python3
 
+import argparse
 import serial
-import input_messages
-import time
+import profiling
 from common import port, baudrate
+from reconcile import reconcile, print_changes
 
-msgs = [
-    input_messages.QueryDatumMessage(),
-    input_messages.ConfigureDatumMessage(datum_index=0, permanent=True),
-    input_messages.QueryDatumMessage(),
-]
+parser = argparse.ArgumentParser(description="Set the datum of the GPS unit to WGS-84, unless it already is.")
+profiling.add_arguments(parser)
 
-with serial.Serial(
-    port=port,
-    baudrate=baudrate
-) as ser:
-    for msg in msgs:
-        print(msg)
-        ser.write(bytes(msg))
-        time.sleep(1)
+
+def main():
+    with serial.Serial(
+        port=port,
+        baudrate=baudrate,
+        timeout=1
+    ) as ser:
+        print_changes(reconcile(ser, {'datum': 0}, on_message=print))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(main, args)
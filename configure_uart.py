@@ -1,29 +1,45 @@
 #!/usr/bin/env python3
 
+import argparse
+import logging
 import serial
-from common import detect_baudrate, port, look_for_ack, interpret_messages, read_lines_ignoring_timeouts
+import profiling
+from client import Client
+from common import port, look_for_ack
 from common import baudrate as desired_baudrate
 from input_messages import ConfigureSerialPortMessage
 
-i_br, current_baudrate = detect_baudrate(serial_port=port, look_for_ack_limit=50, retries=2)
-
-if current_baudrate == desired_baudrate:
-    print("Baudrate is already set to the desired value of {} bps.".format(desired_baudrate))
-    exit()
-
-print("Baudrate is set to {} bps, but the desired value is {} bps.".format(current_baudrate, desired_baudrate))
-
-msg = ConfigureSerialPortMessage(rate=desired_baudrate, permanent=True)
-with serial.Serial(port=port, baudrate=current_baudrate) as ser:
-    print("Setting baudrate to {} bps...".format(desired_baudrate))
-    ser.write(bytes(msg))
-    print("Waiting for ACK...")
-    try:
-        i_ackmsg = look_for_ack(
-            messages=interpret_messages(read_lines_ignoring_timeouts(ser)),
-            msg_id=ConfigureSerialPortMessage.msg_id,
-            limit=25,
-        )
-        print("Got ACK after {} messages.".format(i_ackmsg))
-    except TimeoutError:
-        print("Timeout.")
+parser = argparse.ArgumentParser(description="Detect the baud rate of the GPS unit, and set it to {} bps.".format(
+    desired_baudrate))
+profiling.add_arguments(parser)
+
+
+def main():
+    with serial.Serial(port=port, baudrate=desired_baudrate, timeout=1) as ser, Client(ser, skip_nmea=True) as client:
+        i_br, current_baudrate = client.detect_baudrate(look_for_ack_limit=50, retries=2)
+
+        if current_baudrate == desired_baudrate:
+            print("Baudrate is already set to the desired value of {} bps.".format(desired_baudrate))
+            return
+
+        print("Baudrate is set to {} bps, but the desired value is {} bps.".format(current_baudrate, desired_baudrate))
+
+        msg = ConfigureSerialPortMessage(rate=desired_baudrate, permanent=True)
+        print("Setting baudrate to {} bps...".format(desired_baudrate))
+        client.write(msg)
+        print("Waiting for ACK...")
+        try:
+            i_ackmsg = look_for_ack(
+                messages=client,
+                msg_id=ConfigureSerialPortMessage.msg_id,
+                limit=25,
+            )
+            print("Got ACK after {} messages.".format(i_ackmsg))
+        except TimeoutError:
+            print("Timeout.")
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
+    profiling.run(main, args)
@@ -1,21 +1,28 @@
 #!/usr/bin/env python3
 
+import argparse
 import serial
-import input_messages
-import time
+import profiling
+from bandwidth import ensure_bandwidth
 from common import port, baudrate
+from reconcile import reconcile, print_changes
 
-msgs = [
-    input_messages.QueryPositionUpdateRateMessage(),
-    input_messages.ConfigurePositionUpdateRateMessage(rate=20, permanent=True),
-    input_messages.QueryPositionUpdateRateMessage(),
-]
+parser = argparse.ArgumentParser(description="Set the position update rate to 20 Hz, raising the baud rate if needed.")
+profiling.add_arguments(parser)
 
-with serial.Serial(
-    port=port,
-    baudrate=baudrate
-) as ser:
-    for msg in msgs:
-        print(msg)
-        ser.write(bytes(msg))
-        time.sleep(1)
+update_rate = 20
+
+
+def main():
+    with serial.Serial(
+        port=port,
+        baudrate=baudrate,
+        timeout=1
+    ) as ser:
+        ensure_bandwidth(ser, update_rate, current_baudrate=baudrate, on_message=print)
+        print_changes(reconcile(ser, {'update_rate': update_rate}, on_message=print))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(main, args)
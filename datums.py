@@ -7,6 +7,29 @@ class Ellipsoid:
         self.semi_major_axis = semi_major_axis
         self.inverse_flattening = inverse_flattening
 
+    @property
+    def flattening(self):
+        return 1 / self.inverse_flattening
+
+    @property
+    def semi_minor_axis(self):
+        """
+        >>> round(ellipsoid_reference_list[23].semi_minor_axis, 4)
+        6356752.3142
+        """
+        return self.semi_major_axis * (1 - self.flattening)
+
+    @property
+    def eccentricity_squared(self):
+        return self.flattening * (2 - self.flattening)
+
+    @property
+    def mean_radius(self):
+        """
+        The IUGG mean radius (2a + b) / 3, for spherical approximations.
+        """
+        return (2 * self.semi_major_axis + self.semi_minor_axis) / 3
+
 
 class Datum:
 
@@ -32,5 +55,53 @@ datum_reference_list = {  # TODO fill in from appendix B in AN0003 (p45ff)
 }
 
 
-def convert(from_datum, to_datum, latitudes, longitudes):
-    pass  # TODO!
+def convert(from_datum, to_datum, latitudes, longitudes, altitudes=0.):
+    """
+    Transform coordinates between datums with the three-parameter shift of each datum to WGS-84: to earth-centred
+    coordinates on the ellipsoid of from_datum, shift, and back on the ellipsoid of to_datum. Good to the metres that
+    the shifts themselves are good to. Needs NumPy.
+
+    >>> lat, lon, alt = convert(datum_reference_list[42], datum_reference_list[0], -33.9, 18.4)
+    >>> round(float(lat), 6), round(float(lon), 6), round(float(alt), 2)
+    (-33.900091, 18.399356, 31.1)
+
+    :param from_datum: The Datum of the coordinates, e.g. datum_reference_list[fields.DatumIndexField(...).value].
+
+    :param to_datum: The Datum to transform them to.
+
+    :param latitudes: Degrees. A NumPy array or a scalar.
+
+    :param longitudes: Degrees. A NumPy array or a scalar.
+
+    :param altitudes: Heights above the ellipsoid of from_datum in m.
+
+    :return: (latitudes, longitudes, altitudes) in to_datum.
+    """
+    import numpy as np
+
+    # Geodetic to earth-centred, earth-fixed.
+    a = from_datum.ellipsoid.semi_major_axis
+    e2 = from_datum.ellipsoid.eccentricity_squared
+    phi = np.radians(latitudes)
+    lam = np.radians(longitudes)
+    sin_phi = np.sin(phi)
+    cos_phi = np.cos(phi)
+    radius = a / np.sqrt(1 - e2 * sin_phi * sin_phi)
+    x = (radius + altitudes) * cos_phi * np.cos(lam) + from_datum.delta_x - to_datum.delta_x
+    y = (radius + altitudes) * cos_phi * np.sin(lam) + from_datum.delta_y - to_datum.delta_y
+    z = (radius * (1 - e2) + altitudes) * sin_phi + from_datum.delta_z - to_datum.delta_z
+
+    # And back, with Bowring's method. Two iterations are good to well below a millimetre near the surface.
+    a = to_datum.ellipsoid.semi_major_axis
+    b = to_datum.ellipsoid.semi_minor_axis
+    e2 = to_datum.ellipsoid.eccentricity_squared
+    ep2 = (a * a - b * b) / (b * b)
+    p = np.hypot(x, y)
+    phi = np.arctan2(z, p * (1 - e2))
+    for _ in range(2):
+        beta = np.arctan2((1 - to_datum.ellipsoid.flattening) * np.sin(phi), np.cos(phi))
+        phi = np.arctan2(z + ep2 * b * np.sin(beta) ** 3, p - e2 * a * np.cos(beta) ** 3)
+    sin_phi = np.sin(phi)
+    radius = a / np.sqrt(1 - e2 * sin_phi * sin_phi)
+    altitudes = p * np.cos(phi) + z * sin_phi - a * a / radius
+    return np.degrees(phi), np.degrees(np.arctan2(y, x)), altitudes
@@ -0,0 +1,244 @@
+import json
+import os
+import tempfile
+import time
+
+import input_messages
+import output_messages
+from common import baudrate as default_baudrate
+from diagnostics import logger
+from reconcile import Setting, read_current, settings
+from writer import BurstWriter
+
+by_id_directory = '/dev/serial/by-id'
+
+# Values that only change with a firmware update, queried like the settings of reconcile.settings.
+identity_settings = {
+    'software_version': Setting(
+        'software_version',
+        lambda: input_messages.QuerySoftwareVersionMessage(software_type=1),
+        output_messages.SoftwareVersionMessage,
+        lambda response: {
+            'kernel': str(response.values[1]),
+            'odm': str(response.values[2]),
+            'revision': str(response.values[3]),
+        },
+        None,
+    ),
+    'software_crc': Setting(
+        'software_crc',
+        lambda: input_messages.QuerySoftwareCrcMessage(software_type=1),
+        output_messages.SoftwareCrcMessage,
+        lambda response: response.values[1].value,
+        None,
+    ),
+}
+
+
+def default_cache_path():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(cache_home, 'venus6', 'devices.json')
+
+
+def device_id(port, directory=by_id_directory):
+    """
+    A key for the receiver on a port that survives re-enumeration: the name of its link in /dev/serial/by-id (which
+    has the serial number of the USB-serial adapter) if there is one, otherwise the port itself.
+
+    >>> dev = tempfile.mkdtemp()
+    >>> directory = tempfile.mkdtemp()
+    >>> open(os.path.join(dev, 'ttyUSB3'), 'w').close()
+    >>> os.symlink(os.path.join(dev, 'ttyUSB3'), os.path.join(directory, 'usb-Prolific_1234-if00-port0'))
+    >>> device_id(os.path.join(dev, 'ttyUSB3'), directory=directory)
+    'usb-Prolific_1234-if00-port0'
+    >>> device_id(os.path.join(directory, 'usb-Prolific_1234-if00-port0'), directory=directory)
+    'usb-Prolific_1234-if00-port0'
+    >>> device_id('/dev/ttyAMA0', directory=directory)
+    '/dev/ttyAMA0'
+    """
+    if os.path.dirname(os.path.abspath(port)) == os.path.abspath(directory):
+        return os.path.basename(port)
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return port
+    target = os.path.realpath(port)
+    for name in sorted(names):
+        if os.path.realpath(os.path.join(directory, name)) == target:
+            return name
+    return port
+
+
+class DeviceCache:
+    """
+    What is known about each receiver, stored as JSON: the software version and CRC, the last working baud rate, and
+    the last known values of reconcile.settings.
+
+    >>> path = os.path.join(tempfile.mkdtemp(), 'venus6', 'devices.json')
+    >>> cache = DeviceCache(path)
+    >>> cache.get('usb-Prolific_1234-if00-port0') is None
+    True
+    >>> cache.put('usb-Prolific_1234-if00-port0', {'baudrate': 9600, 'software_crc': 39030})
+    >>> cache.save()
+    >>> DeviceCache(path).get('usb-Prolific_1234-if00-port0')['baudrate']
+    9600
+    """
+
+    def __init__(self, path=None):
+        """
+
+        :param path: Path of the JSON file. By default, venus6/devices.json in $XDG_CACHE_HOME or ~/.cache.
+
+        """
+        self.path = path if path is not None else default_cache_path()
+        self.devices = {}
+        try:
+            with open(self.path) as f:
+                self.devices = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning("Ignoring the device cache %s: %s", self.path, e)
+
+    def get(self, key):
+        return self.devices.get(key)
+
+    def put(self, key, entry):
+        self.devices[key] = dict(entry, updated=time.time())
+
+    def update(self, key, baudrate=None, configuration=None):
+        """
+        Record a new baud rate and/or changed settings of a known receiver, e.g. after reconcile.reconcile.
+
+        :param configuration: dict mapping names of reconcile.settings to their new values.
+        """
+        entry = self.devices.get(key)
+        if entry is None:
+            return
+        entry = dict(entry)
+        if baudrate is not None:
+            entry['baudrate'] = baudrate
+        if configuration:
+            entry['configuration'] = dict(entry.get('configuration', {}), **configuration)
+        self.put(key, entry)
+
+    def save(self):
+        """
+        Write the file atomically, so that a crash or a concurrent reader never sees half of it.
+        """
+        directory = os.path.dirname(self.path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.devices-', suffix='.json', dir=directory)
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.devices, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+def verify(ser, entry, timeout=1.0):
+    """
+    Check a cached entry with a single software CRC query at the cached baud rate.
+
+    :return: Whether the receiver answered with the cached CRC.
+    """
+    ser.baudrate = entry['baudrate']
+    if hasattr(ser, 'reset_input_buffer'):
+        ser.reset_input_buffer()
+    writer = BurstWriter(ser, ack_timeout=timeout, retries=0)
+    try:
+        crc = read_current(writer, ['software_crc'], timeout=timeout, registry=identity_settings)['software_crc']
+    except (TimeoutError, RuntimeError) as e:
+        logger.info("No answer at the cached baud rate of %d bps: %s", entry['baudrate'], e)
+        return False
+    if crc != entry.get('software_crc'):
+        logger.info("The software CRC changed from %s to %s.", entry.get('software_crc'), crc)
+        return False
+    return True
+
+
+def full_discovery(ser, last_baudrate=None, timeout=2.0):
+    """
+    Detect the baud rate, and query the identity and all of reconcile.settings.
+
+    :return: A new cache entry.
+    """
+    from rollout import baudrate_candidates, detect_baudrate
+
+    baudrate = detect_baudrate(ser, baudrate_candidates(last_baudrate=last_baudrate, target_baudrate=default_baudrate))
+    registry = dict(settings, **identity_settings)
+    current = read_current(BurstWriter(ser, ack_timeout=timeout), list(registry), timeout=timeout, registry=registry)
+    return {
+        'baudrate': baudrate,
+        'software_version': current.pop('software_version'),
+        'software_crc': current.pop('software_crc'),
+        'configuration': current,
+    }
+
+
+def discover(ser, port, cache, timeout=2.0):
+    """
+    Find out what receiver is on a port and at what baud rate it runs. A cached entry is trusted after one software
+    CRC query confirms it. Only if that fails does the full discovery run, and its result replaces the entry. The
+    baud rate of ser is left at that of the receiver.
+
+    >>> import io
+    >>> class FakeSerial(io.BytesIO):
+    ...     baudrate = 115200
+    ...     def write(self, b):
+    ...         print(b.hex())
+    >>> cache = DeviceCache(os.path.join(tempfile.mkdtemp(), 'devices.json'))
+    >>> cache.put('/dev/ttyS9', {'baudrate': 9600, 'software_crc': 0x9876, 'software_version': {}, 'configuration': {}})
+    >>> ser = FakeSerial(bytes.fromhex(
+    ...     'a0a100028303800d0a'  # ACK query software CRC
+    ...     'a0a10004810198766e0d0a'  # CRC 0x9876
+    ... ))
+    >>> discover(ser, '/dev/ttyS9', cache)['baudrate']
+    a0a100020301020d0a
+    9600
+    >>> ser.baudrate
+    9600
+
+    :param Serial ser: The open serial interface.
+
+    :param port: The path of ser, to look up the receiver in the cache.
+
+    :param DeviceCache cache: Updated (but not saved) when the full discovery runs.
+
+    :return: The cache entry of the receiver.
+
+    :raise RuntimeError: If the receiver does not answer at any baud rate.
+    """
+    key = device_id(port)
+    entry = cache.get(key)
+    if entry is not None:
+        t_start = time.monotonic()
+        if verify(ser, entry, timeout=min(timeout, 1.0)):
+            logger.info("%s: cached identity confirmed in %.3f s", port, time.monotonic() - t_start)
+            return entry
+    t_start = time.monotonic()
+    new_entry = full_discovery(ser, last_baudrate=None if entry is None else entry.get('baudrate'), timeout=timeout)
+    logger.info("%s: full discovery took %.3f s", port, time.monotonic() - t_start)
+    cache.put(key, new_entry)
+    return cache.get(key)
+
+
+def print_identity(port, entry):
+    """
+    >>> print_identity('/dev/ttyUSB0', {
+    ...     'baudrate': 115200, 'software_crc': 0x9876,
+    ...     'software_version': {'kernel': '1.0.1', 'odm': '1.3.14', 'revision': '07-01-18'},
+    ...     'configuration': {'datum': 0, 'update_rate': 20},
+    ... })
+    /dev/ttyUSB0: 115200 bps, kernel 1.0.1, ODM 1.3.14, revision 07-01-18, CRC 0x9876
+      datum: 0
+      update_rate: 20
+    """
+    version = entry['software_version']
+    print("{}: {} bps, kernel {}, ODM {}, revision {}, CRC 0x{:04x}".format(
+        port, entry['baudrate'], version.get('kernel'), version.get('odm'), version.get('revision'),
+        entry['software_crc']))
+    for name, value in entry.get('configuration', {}).items():
+        print("  {}: {}".format(name, value))
@@ -0,0 +1,62 @@
+import logging
+import time
+
+logger = logging.getLogger('venus6')
+
+
+class MalformedFrameReport:
+    """
+    Counts malformed frames, and logs a summary with one sample frame at most once per interval, instead of one line
+    per frame. The summary has the number of frames since the last summary, and the totals per reason. Nothing is
+    formatted, and no sample is copied, unless the logger is enabled for WARNING.
+
+    >>> import sys
+    >>> handler = logging.StreamHandler(sys.stdout)
+    >>> logger.addHandler(handler)
+    >>> report = MalformedFrameReport(interval=3600)
+    >>> report.add(b'\\xa0\\xa1garbage\\r\\n', 'Malformed message: Checksum is wrong.')
+    1 malformed frame(s) in the last 0 s (Malformed message: Checksum is wrong.: 1). Sample: b'\\xa0\\xa1garbage\\r\\n'
+    >>> report.add(b'\\xa0\\xa1garbage\\r\\n', 'Malformed message: Checksum is wrong.')
+    >>> report.total
+    2
+    >>> logger.removeHandler(handler)
+    """
+
+    def __init__(self, interval=10.0):
+        """
+
+        :param interval: Minimum number of seconds between two summaries.
+
+        """
+        self.interval = interval
+        self.total = 0
+        self.reasons = {}
+        self._count = 0
+        self._sample = None
+        self._since = time.monotonic()
+        self._next_report = 0
+
+    def add(self, line, reason):
+        self.total += 1
+        self._count += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+        if not logger.isEnabledFor(logging.WARNING):
+            return
+        if self._sample is None:
+            self._sample = bytes(line)
+        now = time.monotonic()
+        if now >= self._next_report:
+            self._report(now)
+
+    def _report(self, now):
+        logger.warning(
+            "%d malformed frame(s) in the last %.0f s (%s). Sample: %r",
+            self._count,
+            now - self._since,
+            ", ".join("{}: {}".format(reason, n) for reason, n in self.reasons.items()),
+            self._sample,
+        )
+        self._count = 0
+        self._sample = None
+        self._since = now
+        self._next_report = now + self.interval
@@ -0,0 +1,313 @@
+import calendar
+import copy
+from array import array
+
+from messages import NmeaMessage
+
+nan = float('nan')
+
+knots = 1852 / 3600.  # m/s
+
+
+def split_sentence(nmea_string):
+    """
+    Check the checksum of an NMEA sentence and split it into fields.
+
+    >>> split_sentence(b'$GPGSV,2,2,05,24,05,010,*4E\\r\\n')
+    [b'GPGSV', b'2', b'2', b'05', b'24', b'05', b'010', b'']
+    >>> split_sentence(b'$GPGSV,2,2,05,24,05,010,*4F\\r\\n') is None
+    True
+
+    :return: A list of fields as bytes, starting with the talker and sentence type, or None if the sentence is
+    malformed.
+    """
+    sentence = bytes(nmea_string).rstrip(b'\r\n')
+    i_star = sentence.rfind(b'*')
+    if sentence[:1] != b'$' or i_star < 0:
+        return None
+    body = sentence[1:i_star]
+    checksum = 0
+    for b in body:
+        checksum ^= b
+    try:
+        if int(sentence[i_star + 1:], 16) != checksum:
+            return None
+    except ValueError:
+        return None
+    return body.split(b',')
+
+
+def to_float(field):
+    return float(field) if field else nan
+
+
+def to_int(field):
+    return int(field) if field else 0
+
+
+def to_degrees(field, hemisphere):
+    """
+    >>> round(to_degrees(b'4807.0380', b'S'), 6)
+    -48.1173
+    """
+    if not field:
+        return nan
+    value = float(field)
+    degrees = int(value / 100)
+    degrees += (value - degrees * 100) / 60
+    return -degrees if hemisphere in (b'S', b'W') else degrees
+
+
+def to_seconds(field):
+    """
+    >>> to_seconds(b'123519.50')
+    45319.5
+    """
+    if not field:
+        return nan
+    value = float(field)
+    hh = int(value / 10000)
+    mm = int(value / 100) % 100
+    return hh * 3600 + mm * 60 + value % 100
+
+
+class FixRecord:
+    """
+    Everything the receiver said about one navigation epoch. Values that were not in any sentence are nan (or 0 for
+    counts).
+
+    The satellites in view are in fixed arrays (prn, elevation, azimuth and snr) of which the first
+    n_satellites_in_view elements are valid. An snr of -1 means that the satellite is not tracked. Entries that no GSV
+    sentence of the epoch filled in (e.g. because a part was lost) are 0, and their snr is -1.
+
+    >>> record = FixRecord(max_satellites=2)
+    >>> record.prn[0], record.snr[0] = 12, 40
+    >>> record.clear()
+    >>> list(record.prn), list(record.snr)
+    ([0, 0], [-1, -1])
+    """
+    __slots__ = [
+        'seconds', 'day', 'month', 'year',
+        'latitude', 'longitude', 'altitude', 'geoid_separation',
+        'fix_quality', 'fix_type', 'n_satellites_used', 'pdop', 'hdop', 'vdop',
+        'speed', 'course',
+        'n_satellites_in_view', 'prn', 'elevation', 'azimuth', 'snr',
+        'n_sentences',
+    ]
+
+    def __init__(self, max_satellites=32):
+        self.prn = array('h', [0] * max_satellites)
+        self.elevation = array('h', [0] * max_satellites)
+        self.azimuth = array('h', [0] * max_satellites)
+        self.snr = array('h', [-1] * max_satellites)
+        self.clear()
+
+    def clear(self):
+        self.seconds = nan
+        self.day = 0
+        self.month = 0
+        self.year = 0
+        self.latitude = nan
+        self.longitude = nan
+        self.altitude = nan
+        self.geoid_separation = nan
+        self.fix_quality = 0
+        self.fix_type = 0
+        self.n_satellites_used = 0
+        self.pdop = nan
+        self.hdop = nan
+        self.vdop = nan
+        self.speed = nan
+        self.course = nan
+        self.n_satellites_in_view = 0
+        # In place, so that nothing is allocated per epoch.
+        for i in range(len(self.snr)):
+            self.prn[i] = 0
+            self.elevation[i] = 0
+            self.azimuth[i] = 0
+            self.snr[i] = -1
+        self.n_sentences = 0
+
+    def copy(self):
+        """
+        The assembler reuses its record for the next epoch. Use this to keep one.
+        """
+        return copy.deepcopy(self)
+
+    def timestamp(self):
+        """
+        :return: POSIX time of the fix, or nan if the date or time is unknown.
+        """
+        if not self.year or self.seconds != self.seconds:
+            return nan
+        return calendar.timegm((self.year, self.month, self.day, 0, 0, 0)) + self.seconds
+
+    def __str__(self):
+        return "Fix at {:.2f} s: {:.6f}, {:.6f}, {:.1f} m, quality {}, {} satellites used, {} in view".format(
+            self.seconds,
+            self.latitude,
+            self.longitude,
+            self.altitude,
+            self.fix_quality,
+            self.n_satellites_used,
+            self.n_satellites_in_view,
+        )
+
+
+class EpochAssembler:
+    """
+    Fills a FixRecord with the NMEA sentences of a navigation epoch as they arrive, and hands it out when the epoch is
+    complete. Two records are allocated up front and used in turns, so nothing is allocated per epoch. A record that
+    was handed out stays as it is until the end of the next epoch. Use its copy method to keep it for longer.
+
+    The end of an epoch is learned from the stream: the first time a GGA or RMC sentence has a different time than the
+    epoch so far, the sentence type before it is remembered as the last one of an epoch. From then on, the record is
+    handed out as soon as that sentence (or the last part of it, for GSV) arrives.
+
+    >>> sentences = [
+    ...     b'$GPGGA,123519.00,4807.0380,N,01131.0000,E,1,08,0.9,545.4,M,46.9,M,,*69\\r\\n',
+    ...     b'$GPGSA,A,3,04,05,,09,12,,,24,,,,,2.5,1.3,2.1*39\\r\\n',
+    ...     b'$GPGSV,2,1,05,04,30,045,42,05,60,120,45,09,10,200,30,12,45,300,38*7D\\r\\n',
+    ...     b'$GPGSV,2,2,05,24,05,010,*4E\\r\\n',
+    ...     b'$GPRMC,123519.00,A,4807.0380,N,01131.0000,E,022.4,084.4,230394,,,A*52\\r\\n',
+    ...     b'$GPGGA,123520.00,4807.0390,N,01131.0000,E,1,08,0.9,545.5,M,46.9,M,,*63\\r\\n',
+    ... ]
+    >>> assembler = EpochAssembler()
+    >>> fixes = [fix.copy() for fix in assembler.assemble(NmeaMessage(s) for s in sentences)]
+    >>> print(fixes[0])
+    Fix at 45319.00 s: 48.117300, 11.516667, 545.4 m, quality 1, 8 satellites used, 5 in view
+    >>> fixes[0].year, fixes[0].month, fixes[0].day, fixes[0].fix_type, fixes[0].pdop
+    (1994, 3, 23, 3, 2.5)
+    >>> list(fixes[0].snr[:fixes[0].n_satellites_in_view])
+    [42, 45, 30, 38, -1]
+    >>> assembler.last_sentence_type
+    b'RMC'
+    """
+
+    def __init__(self, max_satellites=32):
+        self.record = FixRecord(max_satellites=max_satellites)
+        self._spare = FixRecord(max_satellites=max_satellites)
+        self.max_satellites = max_satellites
+        self.last_sentence_type = None
+        self.n_invalid = 0
+        self._previous_sentence_type = None
+        self._parsers = {
+            b'GGA': self._gga,
+            b'GSA': self._gsa,
+            b'GSV': self._gsv,
+            b'RMC': self._rmc,
+            b'VTG': self._vtg,
+        }
+
+    def assemble(self, messages):
+        """
+        :param messages: Iterable of messages, e.g. from common.interpret_messages. Anything that is not an NMEA
+        sentence is ignored.
+
+        :return: Generator that yields the record once per complete epoch.
+        """
+        for msg in messages:
+            if type(msg) is NmeaMessage:
+                fix = self.add(msg.nmea_string)
+                if fix is not None:
+                    yield fix
+
+    def add(self, nmea_string):
+        """
+        Add one sentence.
+
+        :return: The record if the epoch is complete, otherwise None.
+        """
+        fields = split_sentence(nmea_string)
+        if fields is None or len(fields[0]) < 5:
+            self.n_invalid += 1
+            return None
+        sentence_type = fields[0][2:]
+
+        completed = None
+        if sentence_type in (b'GGA', b'RMC') and self.record.seconds == self.record.seconds:
+            if to_seconds(fields[1]) != self.record.seconds:
+                # A new epoch started. This only happens until the last sentence type is known, or if the last
+                # sentence of an epoch got lost.
+                if self.last_sentence_type is None:
+                    self.last_sentence_type = self._previous_sentence_type
+                completed = self._complete()
+
+        parser = self._parsers.get(sentence_type)
+        try:
+            last_part = parser(fields) if parser is not None else True
+        except (ValueError, IndexError):
+            self.n_invalid += 1
+            return completed
+        self.record.n_sentences += 1
+        self._previous_sentence_type = sentence_type
+
+        if completed is not None:
+            return completed
+        if sentence_type == self.last_sentence_type and last_part:
+            return self._complete()
+        return None
+
+    def _complete(self):
+        completed = self.record
+        self.record = self._spare
+        self._spare = completed
+        self.record.clear()
+        return completed
+
+    def _gga(self, f):
+        r = self.record
+        r.seconds = to_seconds(f[1])
+        r.latitude = to_degrees(f[2], f[3])
+        r.longitude = to_degrees(f[4], f[5])
+        r.fix_quality = to_int(f[6])
+        r.n_satellites_used = to_int(f[7])
+        r.hdop = to_float(f[8])
+        r.altitude = to_float(f[9])
+        r.geoid_separation = to_float(f[11])
+        return True
+
+    def _gsa(self, f):
+        r = self.record
+        r.fix_type = to_int(f[2])
+        r.pdop = to_float(f[15])
+        r.hdop = to_float(f[16])
+        r.vdop = to_float(f[17])
+        return True
+
+    def _gsv(self, f):
+        r = self.record
+        n_parts = to_int(f[1])
+        part = to_int(f[2])
+        r.n_satellites_in_view = min(to_int(f[3]), self.max_satellites)
+        i_satellite = (part - 1) * 4
+        for i_field in range(4, len(f) - 3, 4):
+            if i_satellite >= self.max_satellites:
+                break
+            r.prn[i_satellite] = to_int(f[i_field])
+            r.elevation[i_satellite] = to_int(f[i_field + 1])
+            r.azimuth[i_satellite] = to_int(f[i_field + 2])
+            r.snr[i_satellite] = int(f[i_field + 3]) if f[i_field + 3] else -1
+            i_satellite += 1
+        return part == n_parts
+
+    def _rmc(self, f):
+        r = self.record
+        r.seconds = to_seconds(f[1])
+        if f[2] == b'A':
+            r.latitude = to_degrees(f[3], f[4])
+            r.longitude = to_degrees(f[5], f[6])
+        r.speed = to_float(f[7]) * knots
+        r.course = to_float(f[8])
+        if len(f[9]) == 6:
+            r.day = int(f[9][0:2])
+            r.month = int(f[9][2:4])
+            yy = int(f[9][4:6])
+            r.year = 2000 + yy if yy < 80 else 1900 + yy
+        return True
+
+    def _vtg(self, f):
+        r = self.record
+        r.course = to_float(f[1])
+        r.speed = to_float(f[7]) / 3.6
+        return True
@@ -17,7 +17,7 @@ class Uint8Field(Field):
     def __init__(self, value):
         super().__init__()
 
-        if type(value) is bytes:
+        if type(value) in (bytes, bytearray, memoryview):
             value = int.from_bytes(bytes=value, byteorder=byteorder, signed=False)
 
         if type(value) is bool:
@@ -51,6 +51,8 @@ class Uint16Field(Field):
     '0x0005'
     >>> Uint16Field(b'\\x0F\\x00').value
     3840
+    >>> Uint16Field(memoryview(b'\\x0F\\x00')).value
+    3840
     """
     n_bytes = 2
     allowed_values = None
@@ -58,7 +60,7 @@ class Uint16Field(Field):
     def __init__(self, value):
         super().__init__()
 
-        if type(value) is bytes:
+        if type(value) in (bytes, bytearray, memoryview):
             value = int.from_bytes(bytes=value, byteorder=byteorder, signed=False)
 
         if type(value) is bool:
@@ -99,7 +101,7 @@ class Sint16Field(Field):
     def __init__(self, value):
         super().__init__()
 
-        if type(value) is bytes:
+        if type(value) in (bytes, bytearray, memoryview):
             value = int.from_bytes(bytes=value, byteorder=byteorder, signed=False)
 
         if type(value) is bool:
@@ -138,7 +140,7 @@ class Uint32Field(Field):
     def __init__(self, value):
         super().__init__()
 
-        if type(value) is bytes:
+        if type(value) in (bytes, bytearray, memoryview):
             value = int.from_bytes(bytes=value, byteorder=byteorder, signed=False)
 
         if type(value) is bool:
@@ -440,3 +442,60 @@ class ComPortField(Uint8Field):
 
     def __str__(self):
         return type(self).allowed_values[self.value]
+
+
+class NmeaIntervalField(Uint8Field):
+    """
+    >>> str(GgaIntervalField(0))
+    'disabled'
+    >>> str(GgaIntervalField(5))
+    '5'
+    """
+    description = '0 ~ 255, 0: disable'
+
+    def __str__(self):
+        return "{}".format(self.value) if self.value else 'disabled'
+
+
+class GgaIntervalField(NmeaIntervalField):
+    name = 'GGA interval'
+
+
+class GsaIntervalField(NmeaIntervalField):
+    name = 'GSA interval'
+
+
+class GsvIntervalField(NmeaIntervalField):
+    name = 'GSV interval'
+
+
+class GllIntervalField(NmeaIntervalField):
+    name = 'GLL interval'
+
+
+class RmcIntervalField(NmeaIntervalField):
+    name = 'RMC interval'
+
+
+class VtgIntervalField(NmeaIntervalField):
+    name = 'VTG interval'
+
+
+class ZdaIntervalField(NmeaIntervalField):
+    name = 'ZDA interval'
+
+
+class MessageTypeField(Uint8Field):
+    name = 'Message type'
+    allowed_values = {0: 'no output', 1: 'NMEA message', 2: 'binary message'}
+
+    def __str__(self):
+        return type(self).allowed_values[self.value]
+
+
+class PpsModeField(Uint8Field):
+    name = '1PPS mode'
+    allowed_values = {0: 'off', 1: 'on when 3D fix', 2: 'on when 1 SV'}
+
+    def __str__(self):
+        return type(self).allowed_values[self.value]
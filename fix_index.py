@@ -0,0 +1,331 @@
+import json
+import math
+import os
+import tempfile
+
+import numpy as np
+
+from datums import convert, datum_reference_list
+from epoch import EpochAssembler
+from output_messages import GpsDatumMessage, frame_error
+
+wgs84_datum = datum_reference_list[0]
+
+meta_name = 'index.json'
+
+# A fix in the index: where it is in WGS-84, when, and where its first sentence starts in which log file.
+record_dtype = np.dtype([
+    ('time', '<f8'),
+    ('latitude', '<f8'),
+    ('longitude', '<f8'),
+    ('file', '<u4'),
+    ('offset', '<u8'),
+])
+
+# The records of a segment are sorted by cell. Each cell has a contiguous range of them.
+cell_dtype = np.dtype([
+    ('cell', '<i8'),
+    ('start', '<i8'),
+    ('count', '<i8'),
+])
+
+
+def records_with_offsets(f, chunk_size=1 << 20):
+    """
+    Split a recording into NMEA sentences and binary frames without losing track of where they are. Binary frames are
+    found by their start bytes and length, since their payload or checksum may contain \\r\\n. A frame whose length
+    does not end at \\r\\n is split at the next \\r\\n instead, like any other line.
+
+    >>> import io
+    >>> data = b'$GPGGA,1\\r\\n' + bytes.fromhex('a0a10003dc0d0adb0d0a') + b'$GPRMC\\r\\n'
+    >>> list(records_with_offsets(io.BytesIO(data), chunk_size=4))
+    [(0, b'$GPGGA,1\\r\\n'), (10, b'\\xa0\\xa1\\x00\\x03\\xdc\\r\\n\\xdb\\r\\n'), (20, b'$GPRMC\\r\\n')]
+
+    :return: Generator of (offset, record) tuples. A record ends with (and includes) \\r\\n.
+    """
+    offset = 0  # Of data[0] in the file.
+    data = b''
+    start = 0
+    at_end = False
+    while True:
+        end = None
+        if data[start:start + 2] == b'\xa0\xa1' and len(data) - start >= 4:
+            n = int.from_bytes(data[start + 2:start + 4], byteorder='big') + 7
+            if len(data) - start >= n and data[start + n - 2:start + n] == b'\r\n':
+                end = start + n
+            elif len(data) - start < n and not at_end:
+                end = -1  # Wait for the rest of the frame.
+        if end is None:
+            i_separator = data.find(b'\r\n', start)
+            end = -1 if i_separator < 0 else i_separator + 2
+        if end >= 0:
+            yield offset + start, data[start:end]
+            start = end
+            continue
+        if at_end:
+            return
+        chunk = f.read(chunk_size)
+        at_end = not chunk
+        offset += start
+        data = data[start:] + chunk
+        start = 0
+
+
+class FixIndex:
+    """
+    A persisted index of the fixes in log files (e.g. from watch --format raw), to find all fixes in a box between two
+    times without decoding the logs again.
+
+    Time is split into buckets of bucket_seconds, and each bucket is a segment: two .npy files in the directory. One
+    has the records of the fixes, sorted by grid cell (cells of cell_size degrees) and then by time. The other has a
+    row per cell with the range of its records. A query only opens the segments of its time range, and reads only the
+    records of the cells that overlap its box, through a memory map.
+
+    Positions are stored in WGS-84. Those in another datum (as announced by a GpsDatumMessage in the log, or given
+    for the whole file) are transformed with datums.convert.
+
+    >>> def sentences(time, lat, lon, date='170623'):
+    ...     lines = []
+    ...     for body in [
+    ...         'GPGGA,{}.00,{},S,{},E,1,08,1.0,10.0,M,0.0,M,,'.format(time, lat, lon),
+    ...         'GPRMC,{}.00,A,{},S,{},E,0.0,0.0,{},,,A'.format(time, lat, lon, date),
+    ...     ]:
+    ...         checksum = 0
+    ...         for b in body.encode():
+    ...             checksum ^= b
+    ...         lines.append('${}*{:02X}\\r\\n'.format(body, checksum).encode())
+    ...     return b''.join(lines)
+    >>> directory = tempfile.mkdtemp()
+    >>> log = os.path.join(directory, 'receiver.raw')
+    >>> with open(log, 'wb') as f:
+    ...     _ = f.write(sentences('120000', '3354.000', '01824.000'))  # Cape Town
+    ...     _ = f.write(sentences('120001', '3354.000', '01824.000'))
+    ...     _ = f.write(bytes.fromhex('a0a10003ae002a840d0a'))  # GPS datum: Cape
+    ...     _ = f.write(sentences('130000', '2612.000', '02802.000'))  # Johannesburg
+    ...     _ = f.write(sentences('130001', '2612.000', '02802.000'))
+    >>> index = FixIndex(os.path.join(directory, 'index'))
+    >>> index.add_file(log)
+    4
+    >>> index.save()
+    >>> t0 = 1687003200  # 2023-06-17 12:00 UTC
+    >>> [(os.path.basename(path), offset) for path, offset in index.offsets(-34.5, -33.5, 18., 19., t0, t0 + 3600)]
+    [('receiver.raw', 0), ('receiver.raw', 133)]
+    >>> fixes = FixIndex(os.path.join(directory, 'index')).query(-30., -20., 27., 29., t0, t0 + 7200)
+    >>> fixes['time'] - t0
+    array([3600., 3601.])
+    >>> round(float(fixes['latitude'][0]), 6), round(float(fixes['longitude'][0]), 6)  # Shifted from Cape to WGS-84
+    (-26.200551, 28.033019)
+    """
+
+    def __init__(self, directory, cell_size=0.1, bucket_seconds=3600):
+        """
+
+        :param directory: Where the index is (or will be) kept.
+
+        :param cell_size: Degrees of latitude and longitude per grid cell, for a new index.
+
+        :param bucket_seconds: Length of a time bucket, for a new index.
+
+        """
+        self.directory = directory
+        self.cell_size = cell_size
+        self.bucket_seconds = bucket_seconds
+        self.files = []  # dicts with path, size and mtime. The index in this list is the file number of a record.
+        try:
+            with open(os.path.join(directory, meta_name)) as f:
+                meta = json.load(f)
+            self.cell_size = meta['cell_size']
+            self.bucket_seconds = meta['bucket_seconds']
+            self.files = meta['files']
+        except FileNotFoundError:
+            pass
+        self.n_rows = int(round(180 / self.cell_size))
+        self.n_columns = int(round(360 / self.cell_size))
+        self._pending = []  # Arrays of records that are not saved yet.
+
+    def rows(self, latitudes):
+        return np.clip(np.floor((np.asarray(latitudes) + 90) / self.cell_size).astype(np.int64), 0, self.n_rows - 1)
+
+    def columns(self, longitudes):
+        return np.floor((np.asarray(longitudes) + 180) / self.cell_size).astype(np.int64) % self.n_columns
+
+    def add_fixes(self, times, latitudes, longitudes, file, offsets, datum=wgs84_datum):
+        """
+        :param times: POSIX times.
+
+        :param file: Number of the log file, in files.
+
+        :param offsets: Where each fix starts in the file.
+
+        :param datum: The datums.Datum of the positions.
+        """
+        latitudes = np.asarray(latitudes, dtype=float)
+        longitudes = np.asarray(longitudes, dtype=float)
+        if datum is not wgs84_datum:
+            latitudes, longitudes, _ = convert(datum, wgs84_datum, latitudes, longitudes)
+        records = np.empty(len(latitudes), dtype=record_dtype)
+        records['time'] = times
+        records['latitude'] = latitudes
+        records['longitude'] = longitudes
+        records['file'] = file
+        records['offset'] = offsets
+        self._pending.append(records)
+
+    def add_file(self, path, datum_index=0):
+        """
+        Decode a log file and add its fixes. Fixes without a date (no RMC sentence) or without a position are left out.
+
+        :param datum_index: The datum of the positions until the log has a GpsDatumMessage.
+
+        :return: Number of fixes added.
+
+        :raise ValueError: If the file is already in the index, but has changed since.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        for entry in self.files:
+            if entry['path'] == path:
+                if entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+                    return 0
+                raise ValueError("{} has changed since it was indexed. Build a new index.".format(path))
+        file = len(self.files)
+        self.files.append({'path': path, 'size': stat.st_size, 'mtime': stat.st_mtime})
+
+        assembler = EpochAssembler()
+        # Fixes go into runs of the same datum, to be transformed together.
+        runs = []
+        run = None
+        epoch_start = None
+        n_fixes = 0
+        with open(path, 'rb') as f:
+            for offset, line in records_with_offsets(f):
+                if line[:1] != b'$':
+                    if line[4:5] == bytes([GpsDatumMessage.msg_id]) and frame_error(line) is None:
+                        try:
+                            datum_index = GpsDatumMessage(line[4:-3]).values[0].value
+                        except AttributeError:
+                            pass  # A datum that is not in datums.datum_reference_list yet.
+                    continue
+                if epoch_start is None:
+                    epoch_start = offset
+                fix = assembler.add(line)
+                if fix is None:
+                    continue
+                t = fix.timestamp()
+                if t == t and fix.latitude == fix.latitude and fix.longitude == fix.longitude:
+                    if run is None or run[0] != datum_index:
+                        run = (datum_index, [], [], [], [])
+                        runs.append(run)
+                    run[1].append(t)
+                    run[2].append(fix.latitude)
+                    run[3].append(fix.longitude)
+                    run[4].append(epoch_start)
+                    n_fixes += 1
+                # If this sentence started a new epoch, it is already in the next record.
+                epoch_start = offset if assembler.record.n_sentences else None
+        for datum_index, times, latitudes, longitudes, offsets in runs:
+            self.add_fixes(times, latitudes, longitudes, file, offsets, datum=datum_reference_list[datum_index])
+        return n_fixes
+
+    def _segment_paths(self, bucket):
+        return (
+            os.path.join(self.directory, '{}.records.npy'.format(bucket)),
+            os.path.join(self.directory, '{}.cells.npy'.format(bucket)),
+        )
+
+    def _write(self, path, array):
+        fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.npy', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    def save(self):
+        """
+        Merge the added fixes into the segments of their time buckets. Only those segments are rewritten.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        if self._pending:
+            pending = np.concatenate(self._pending)
+            buckets = np.floor(pending['time'] / self.bucket_seconds).astype(np.int64)
+            for bucket in np.unique(buckets):
+                records_path, cells_path = self._segment_paths(bucket)
+                records = pending[buckets == bucket]
+                if os.path.exists(records_path):
+                    records = np.concatenate([np.load(records_path), records])
+                cells = self.rows(records['latitude']) * self.n_columns + self.columns(records['longitude'])
+                order = np.lexsort((records['time'], cells))
+                records = records[order]
+                cells = cells[order]
+                table_cells, starts, counts = np.unique(cells, return_index=True, return_counts=True)
+                table = np.empty(len(table_cells), dtype=cell_dtype)
+                table['cell'] = table_cells
+                table['start'] = starts
+                table['count'] = counts
+                self._write(records_path, records)
+                self._write(cells_path, table)
+            self._pending = []
+        fd, tmp_path = tempfile.mkstemp(prefix='.', suffix='.json', dir=self.directory)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'cell_size': self.cell_size, 'bucket_seconds': self.bucket_seconds, 'files': self.files}, f)
+        os.replace(tmp_path, os.path.join(self.directory, meta_name))
+
+    def query(self, lat_min, lat_max, lon_min, lon_max, t_start, t_end):
+        """
+        All saved fixes with lat_min <= latitude <= lat_max, lon_min <= longitude <= lon_max (across the antimeridian
+        if lon_min > lon_max), and t_start <= time <= t_end. Coordinates are in WGS-84.
+
+        :return: A NumPy array of records (see record_dtype), in order of time bucket, cell and time.
+        """
+        row_range = range(int(self.rows(lat_min)), int(self.rows(lat_max)) + 1)
+        first_column = int(self.columns(lon_min))
+        last_column = int(self.columns(lon_max))
+        if lon_min <= lon_max:
+            # Without wrapping, so that a box up to 180 ends in the last column rather than the first.
+            last_column = min(int(math.floor((lon_max + 180) / self.cell_size)), self.n_columns - 1)
+            column_ranges = [(min(first_column, last_column), last_column)]
+        elif first_column <= last_column:
+            column_ranges = [(0, self.n_columns - 1)]  # Nearly all the way around.
+        else:
+            column_ranges = [(first_column, self.n_columns - 1), (0, last_column)]
+
+        found = []
+        for bucket in range(int(math.floor(t_start / self.bucket_seconds)),
+                            int(math.floor(t_end / self.bucket_seconds)) + 1):
+            records_path, cells_path = self._segment_paths(bucket)
+            if not os.path.exists(cells_path):
+                continue
+            table = np.load(cells_path)
+            records = np.load(records_path, mmap_mode='r')
+            for row in row_range:
+                for first, last in column_ranges:
+                    i_first, i_last = np.searchsorted(
+                        table['cell'], [row * self.n_columns + first, row * self.n_columns + last + 1])
+                    if i_first == i_last:
+                        continue
+                    # The cells of a row are next to each other, and so are their records.
+                    i_start = table['start'][i_first]
+                    candidates = records[i_start:table['start'][i_last - 1] + table['count'][i_last - 1]]
+                    latitudes = candidates['latitude']
+                    longitudes = candidates['longitude']
+                    inside = (latitudes >= lat_min) & (latitudes <= lat_max)
+                    inside &= (candidates['time'] >= t_start) & (candidates['time'] <= t_end)
+                    if lon_min <= lon_max:
+                        inside &= (longitudes >= lon_min) & (longitudes <= lon_max)
+                    else:
+                        inside &= (longitudes >= lon_min) | (longitudes <= lon_max)
+                    found.append(np.array(candidates[inside]))
+        return np.concatenate(found) if found else np.empty(0, dtype=record_dtype)
+
+    def offsets(self, lat_min, lat_max, lon_min, lon_max, t_start, t_end):
+        """
+        Like query, but only where to find the fixes.
+
+        :return: A list of (path of the log file, offset of the first sentence of the fix) tuples, sorted.
+        """
+        records = self.query(lat_min, lat_max, lon_min, lon_max, t_start, t_end)
+        return sorted((self.files[file]['path'], int(offset)) for file, offset in zip(records['file'],
+                                                                                       records['offset']))
@@ -0,0 +1,218 @@
+import time
+
+import numpy as np
+
+from datums import ellipsoid_reference_list
+
+wgs84 = ellipsoid_reference_list[23]
+
+SPHERICAL = 'spherical'
+VINCENTY = 'vincenty'
+
+# Work on this many points at a time, so that the temporary arrays of a call on tens of millions of points stay small.
+default_chunk_size = 1 << 20
+
+
+def chunked(function, arrays, chunk_size=default_chunk_size):
+    """
+    Call function on chunks of the arrays, and put the results together.
+
+    :param function: Takes a chunk of each array and returns a tuple of arrays of the same length.
+
+    :return: The tuple of arrays that function would return for the whole arrays.
+    """
+    if np.ndim(arrays[0]) == 0 or len(arrays[0]) <= chunk_size:
+        return function(*arrays)
+    n = len(arrays[0])
+    outputs = None
+    for start in range(0, n, chunk_size):
+        results = function(*[a[start:start + chunk_size] for a in arrays])
+        if outputs is None:
+            outputs = [np.empty(n, dtype=np.result_type(result)) for result in results]
+        for output, result in zip(outputs, results):
+            output[start:start + chunk_size] = result
+    return tuple(outputs)
+
+
+def spherical_inverse(lat1, lon1, lat2, lon2, ellipsoid=wgs84):
+    """
+    Distance (haversine, on a sphere with the mean radius of the ellipsoid) and initial bearing between points. Up to
+    about 0.5% off, but fast.
+
+    All angles are in degrees, and all arguments may be NumPy arrays (or scalars) of the same shape.
+
+    >>> distance, bearing = spherical_inverse(-37.95103342, 144.42486789, -37.65282114, 143.92649554)
+    >>> round(float(distance)), round(float(bearing), 2)
+    (54926, 306.98)
+
+    :return: (distance in m, bearing in degrees clockwise from north, 0 to 360)
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    d_lambda = np.radians(np.subtract(lon2, lon1))
+    cos_phi1 = np.cos(phi1)
+    cos_phi2 = np.cos(phi2)
+    h = np.sin((phi2 - phi1) / 2) ** 2 + cos_phi1 * cos_phi2 * np.sin(d_lambda / 2) ** 2
+    distance = 2 * ellipsoid.mean_radius * np.arcsin(np.sqrt(np.minimum(h, 1)))
+    bearing = np.degrees(np.arctan2(
+        np.sin(d_lambda) * cos_phi2,
+        cos_phi1 * np.sin(phi2) - np.sin(phi1) * cos_phi2 * np.cos(d_lambda),
+    )) % 360
+    return distance, bearing
+
+
+def vincenty_inverse(lat1, lon1, lat2, lon2, ellipsoid=wgs84, tolerance=1e-12, max_iterations=200):
+    """
+    Distance and initial bearing between points on the ellipsoid, with Vincenty's inverse formula. Accurate to well
+    below a millimetre. The iteration runs on whole arrays at once. Nearly antipodal points, for which it does not
+    converge, get nan.
+
+    All angles are in degrees, and all arguments may be NumPy arrays (or scalars) of the same shape.
+
+    The example of Vincenty (1975), Flinders Peak to Buninyong:
+
+    >>> distance, bearing = vincenty_inverse(-37.95103342, 144.42486789, -37.65282114, 143.92649554)
+    >>> round(float(distance), 3), round(float(bearing), 6)
+    (54972.271, 306.86816)
+
+    :return: (distance in m, bearing in degrees clockwise from north, 0 to 360)
+    """
+    a = ellipsoid.semi_major_axis
+    b = ellipsoid.semi_minor_axis
+    f = ellipsoid.flattening
+
+    big_l = np.radians(np.subtract(lon2, lon1))
+    u1 = np.arctan((1 - f) * np.tan(np.radians(lat1)))
+    u2 = np.arctan((1 - f) * np.tan(np.radians(lat2)))
+    sin_u1 = np.sin(u1)
+    cos_u1 = np.cos(u1)
+    sin_u2 = np.sin(u2)
+    cos_u2 = np.cos(u2)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        lam = big_l
+        for _ in range(max_iterations):
+            sin_lam = np.sin(lam)
+            cos_lam = np.cos(lam)
+            sin_sigma = np.hypot(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)
+            cos_sigma = sin_u1 * sin_u2 + cos_u1 * cos_u2 * cos_lam
+            sigma = np.arctan2(sin_sigma, cos_sigma)
+            sin_alpha = np.where(sin_sigma == 0, 0., cos_u1 * cos_u2 * sin_lam / sin_sigma)
+            cos2_alpha = 1 - sin_alpha ** 2
+            # cos2_alpha is 0 on the equator.
+            cos_2sigma_m = np.where(cos2_alpha == 0, 0., cos_sigma - 2 * sin_u1 * sin_u2 / cos2_alpha)
+            c = f / 16 * cos2_alpha * (4 + f * (4 - 3 * cos2_alpha))
+            previous_lam = lam
+            lam = big_l + (1 - c) * f * sin_alpha * (
+                sigma + c * sin_sigma * (cos_2sigma_m + c * cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)))
+            change = np.abs(lam - previous_lam)
+            if not np.any(change > tolerance):
+                break
+
+        u_squared = cos2_alpha * (a ** 2 - b ** 2) / b ** 2
+        big_a = 1 + u_squared / 16384 * (4096 + u_squared * (-768 + u_squared * (320 - 175 * u_squared)))
+        big_b = u_squared / 1024 * (256 + u_squared * (-128 + u_squared * (74 - 47 * u_squared)))
+        delta_sigma = big_b * sin_sigma * (cos_2sigma_m + big_b / 4 * (
+            cos_sigma * (-1 + 2 * cos_2sigma_m ** 2)
+            - big_b / 6 * cos_2sigma_m * (-3 + 4 * sin_sigma ** 2) * (-3 + 4 * cos_2sigma_m ** 2)))
+        distance = b * big_a * (sigma - delta_sigma)
+        bearing = np.degrees(np.arctan2(cos_u2 * sin_lam, cos_u1 * sin_u2 - sin_u1 * cos_u2 * cos_lam)) % 360
+
+    not_converged = change > tolerance
+    if np.any(not_converged):
+        distance = np.where(not_converged, np.nan, distance)
+        bearing = np.where(not_converged, np.nan, bearing)
+    return distance, bearing
+
+
+inverse_methods = {
+    SPHERICAL: spherical_inverse,
+    VINCENTY: vincenty_inverse,
+}
+
+
+def legs(latitudes, longitudes, ellipsoid=wgs84, method=SPHERICAL, chunk_size=default_chunk_size):
+    """
+    Distance and bearing of each leg of a track, i.e. between consecutive fixes.
+
+    :param latitudes: Array of n latitudes in degrees.
+
+    :param longitudes: Array of n longitudes in degrees.
+
+    :param ellipsoid: One of datums.ellipsoid_reference_list.
+
+    :param method: SPHERICAL (fast) or VINCENTY (accurate).
+
+    :return: (distances in m, bearings in degrees), each an array of n - 1 values.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    inverse = inverse_methods[method]
+    return chunked(
+        lambda lat1, lon1, lat2, lon2: inverse(lat1, lon1, lat2, lon2, ellipsoid=ellipsoid),
+        [latitudes[:-1], longitudes[:-1], latitudes[1:], longitudes[1:]],
+        chunk_size=chunk_size,
+    )
+
+
+def distances(latitudes, longitudes, ellipsoid=wgs84, method=SPHERICAL, chunk_size=default_chunk_size):
+    """
+    >>> distances([0, 0, 1], [0, 1, 1], method=VINCENTY).round(3)
+    array([111319.491, 110574.389])
+
+    :return: Array of the n - 1 distances in m between consecutive fixes.
+    """
+    return legs(latitudes, longitudes, ellipsoid=ellipsoid, method=method, chunk_size=chunk_size)[0]
+
+
+def bearings(latitudes, longitudes, ellipsoid=wgs84, method=SPHERICAL, chunk_size=default_chunk_size):
+    """
+    >>> bearings([0, 0, 1], [0, 1, 1]).round(6)
+    array([90.,  0.])
+
+    :return: Array of the n - 1 initial bearings in degrees from each fix to the next.
+    """
+    return legs(latitudes, longitudes, ellipsoid=ellipsoid, method=method, chunk_size=chunk_size)[1]
+
+
+def track_length(latitudes, longitudes, ellipsoid=wgs84, method=SPHERICAL, chunk_size=default_chunk_size):
+    """
+    >>> track_length([0, 0, 1], [0, 1, 1], method=VINCENTY).round(3)
+    array([     0.   , 111319.491, 221893.879])
+
+    :return: Array of the n cumulative distances in m along the track, starting with 0.
+    """
+    d = distances(latitudes, longitudes, ellipsoid=ellipsoid, method=method, chunk_size=chunk_size)
+    return np.concatenate([[0.], np.cumsum(d)])
+
+
+def speeds(latitudes, longitudes, timestamps, ellipsoid=wgs84, method=SPHERICAL, chunk_size=default_chunk_size):
+    """
+    >>> speeds([0, 0, 1], [0, 1, 1], [0, 3600, 3600], method=VINCENTY).round(3)
+    array([30.922,    nan])
+
+    :param timestamps: Array of n times in s.
+
+    :return: Array of the n - 1 mean speeds in m/s between consecutive fixes. Legs without a positive duration get nan.
+    """
+    d = distances(latitudes, longitudes, ellipsoid=ellipsoid, method=method, chunk_size=chunk_size)
+    dt = np.diff(np.asarray(timestamps, dtype=float))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(dt > 0, d / dt, np.nan)
+
+
+def benchmark(n_points=10 ** 7, methods=(SPHERICAL, VINCENTY)):
+    """
+    Measure the time that distances takes on a random track.
+
+    :return: dict mapping each method to nanoseconds per point.
+    """
+    rng = np.random.default_rng(0)
+    latitudes = np.cumsum(rng.normal(0, 1e-4, n_points)) - 33.9
+    longitudes = np.cumsum(rng.normal(0, 1e-4, n_points)) + 18.4
+    results = {}
+    for method in methods:
+        t_start = time.perf_counter()
+        distances(latitudes, longitudes, method=method)
+        results[method] = (time.perf_counter() - t_start) / n_points * 1e9
+    return results
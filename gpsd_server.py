@@ -0,0 +1,311 @@
+import asyncio
+import json
+import math
+import time
+
+from epoch import EpochAssembler
+
+PROTOCOL_MAJOR = 3
+PROTOCOL_MINOR = 14
+
+default_port = 2947
+
+
+def iso_time(timestamp):
+    """
+    >>> iso_time(764426119.5)
+    '1994-03-23T12:35:19.500Z'
+    """
+    seconds = math.floor(timestamp)
+    return "{}.{:03d}Z".format(
+        time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(seconds)),
+        int(round((timestamp - seconds) * 1000)),
+    )
+
+
+def _put(report, key, value):
+    # gpsd leaves out what it does not know. This also keeps NaN, which is not valid JSON, out of the reports.
+    if value == value:
+        report[key] = value
+
+
+def tpv_report(fix, device):
+    """
+    A gpsd TPV (time-position-velocity) report of an epoch.
+
+    :param epoch.FixRecord fix:
+
+    :return: A dict, ready for json.dumps.
+    """
+    if fix.fix_type:
+        mode = fix.fix_type
+    elif fix.fix_quality:
+        mode = 2 if fix.altitude != fix.altitude else 3
+    else:
+        mode = 1
+    report = {'class': 'TPV', 'device': device, 'mode': mode}
+    timestamp = fix.timestamp()
+    if timestamp == timestamp:
+        report['time'] = iso_time(timestamp)
+    _put(report, 'lat', fix.latitude)
+    _put(report, 'lon', fix.longitude)
+    _put(report, 'altMSL', fix.altitude)
+    _put(report, 'altHAE', fix.altitude + fix.geoid_separation)
+    _put(report, 'geoidSep', fix.geoid_separation)
+    _put(report, 'speed', fix.speed)
+    _put(report, 'track', fix.course)
+    return report
+
+
+def sky_report(fix, device):
+    """
+    A gpsd SKY report of an epoch, with the dilutions of precision and the satellites in view.
+
+    :param epoch.FixRecord fix:
+
+    :return: A dict, ready for json.dumps.
+    """
+    report = {'class': 'SKY', 'device': device}
+    timestamp = fix.timestamp()
+    if timestamp == timestamp:
+        report['time'] = iso_time(timestamp)
+    _put(report, 'hdop', fix.hdop)
+    _put(report, 'vdop', fix.vdop)
+    _put(report, 'pdop', fix.pdop)
+    report['nSat'] = fix.n_satellites_in_view
+    report['uSat'] = fix.n_satellites_used
+    report['satellites'] = [
+        {
+            'PRN': fix.prn[i],
+            'el': fix.elevation[i],
+            'az': fix.azimuth[i],
+            'ss': max(fix.snr[i], 0),
+        }
+        for i in range(fix.n_satellites_in_view)
+    ]
+    return report
+
+
+def encode(report):
+    """
+    >>> encode({'class': 'VERSION', 'proto_major': 3})
+    b'{"class":"VERSION","proto_major":3}\\r\\n'
+    """
+    return json.dumps(report, separators=(',', ':')).encode() + b'\r\n'
+
+
+class GpsdClient:
+    """
+    One connection. Reports are written without waiting for the client, so a slow client never holds up the reader or
+    the other clients. When more than high_water bytes are waiting in its transport, reports for it are dropped (and
+    counted in n_dropped) until it has caught up to below low_water.
+
+    >>> class FakeTransport:
+    ...     size = 0
+    ...     def get_write_buffer_size(self):
+    ...         return self.size
+    >>> class FakeWriter:
+    ...     transport = FakeTransport()
+    ...     def write(self, data):
+    ...         self.transport.size += len(data)
+    >>> client = GpsdClient(FakeWriter(), high_water=15, low_water=5)
+    >>> for _ in range(4):
+    ...     client.send(b'12345678\\r\\n')
+    >>> client.n_dropped, client.writer.transport.size
+    (2, 20)
+    >>> client.writer.transport.size = 4
+    >>> client.send(b'12345678\\r\\n')
+    >>> client.n_dropped, client.writer.transport.size
+    (2, 14)
+    """
+
+    def __init__(self, writer, high_water=65536, low_water=16384):
+        self.writer = writer
+        self.high_water = high_water
+        self.low_water = low_water
+        self.watching = False
+        self.congested = False
+        self.n_dropped = 0
+
+    def send(self, data):
+        waiting = self.writer.transport.get_write_buffer_size()
+        if self.congested and waiting < self.low_water:
+            self.congested = False
+        elif not self.congested and waiting >= self.high_water:
+            self.congested = True
+        if self.congested:
+            self.n_dropped += 1
+            return
+        self.writer.write(data)
+
+
+class GpsdServer:
+    """
+    Serves the fixes of one or more receivers to any number of clients, with (a useful subset of) the gpsd JSON
+    protocol: ?VERSION;, ?DEVICES;, ?WATCH={...}; and ?POLL;. Each epoch is encoded once, in the reader thread, and
+    the same bytes are handed to every watching client.
+
+    >>> from messages import NmeaMessage
+    >>> sentences = [
+    ...     b'$GPGGA,123519.00,4807.0380,N,01131.0000,E,1,08,0.9,545.4,M,46.9,M,,*69\\r\\n',
+    ...     b'$GPGSV,1,1,01,04,30,045,42*48\\r\\n',
+    ...     b'$GPRMC,123519.00,A,4807.0380,N,01131.0000,E,022.4,084.4,230394,,,A*52\\r\\n',
+    ...     b'$GPGGA,123520.00,4807.0390,N,01131.0000,E,1,08,0.9,545.5,M,46.9,M,,*63\\r\\n',
+    ... ]
+    >>> async def example():
+    ...     server = GpsdServer(['/dev/ttyAMA0'])
+    ...     await server.start(port=0)
+    ...     reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+    ...     writer.write(b'?WATCH={"enable":true,"json":true};\\n')
+    ...     replies = [json.loads(await reader.readline())['class'] for _ in range(3)]
+    ...     await server.read('/dev/ttyAMA0', (NmeaMessage(s) for s in sentences))
+    ...     tpv = json.loads(await reader.readline())
+    ...     sky = json.loads(await reader.readline())
+    ...     writer.close()
+    ...     await server.close()
+    ...     return replies, tpv, sky
+    >>> replies, tpv, sky = asyncio.run(example())
+    >>> replies
+    ['VERSION', 'DEVICES', 'WATCH']
+    >>> tpv['time'], tpv['mode'], round(tpv['lat'], 6), tpv['altMSL']
+    ('1994-03-23T12:35:19.000Z', 3, 48.1173, 545.4)
+    >>> sky['satellites']
+    [{'PRN': 4, 'el': 30, 'az': 45, 'ss': 42}]
+    """
+
+    def __init__(self, devices, high_water=65536, low_water=16384):
+        """
+
+        :param devices: Paths of the receivers, as reported to clients.
+
+        :param high_water: Stop sending to a client when this many bytes are waiting for it.
+
+        :param low_water: Start sending again when less than this many bytes are waiting.
+
+        """
+        self.devices = list(devices)
+        self.high_water = high_water
+        self.low_water = low_water
+        self.clients = set()
+        self._handlers = set()
+        self.last_reports = {}  # device: (tpv, sky)
+        self.port = None
+        self._server = None
+        self._loop = None
+        self._version = encode({
+            'class': 'VERSION',
+            'release': 'venus6',
+            'rev': 'venus6',
+            'proto_major': PROTOCOL_MAJOR,
+            'proto_minor': PROTOCOL_MINOR,
+        })
+
+    async def start(self, host='127.0.0.1', port=default_port):
+        self._loop = asyncio.get_running_loop()
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        """
+        Stop listening, disconnect all clients and wait for their handlers to finish.
+        """
+        self._server.close()
+        for client in self.clients:
+            client.writer.close()
+        await asyncio.gather(*self._handlers)
+
+    async def serve(self, streams, host='127.0.0.1', port=default_port):
+        """
+        Start, serve until all streams have ended, and close.
+
+        :param streams: Dict of device path: iterable of messages.
+        """
+        await self.start(host=host, port=port)
+        try:
+            await asyncio.gather(*[self.read(device, messages) for device, messages in streams.items()])
+        finally:
+            await self.close()
+
+    async def read(self, device, messages):
+        """
+        Assemble the messages of one receiver into epochs and serve them, until the stream ends. The stream is read in
+        a thread, so it may block.
+
+        :param messages: Iterable of messages, e.g. from common.interpret_messages.
+        """
+        await self._loop.run_in_executor(None, self._read, device, messages)
+
+    def _read(self, device, messages):
+        for fix in EpochAssembler().assemble(messages):
+            # The record is reused for the next epoch, so encode it right away, here in the reader thread.
+            tpv = tpv_report(fix, device)
+            sky = sky_report(fix, device)
+            data = encode(tpv) + encode(sky)
+            self._loop.call_soon_threadsafe(self._publish, device, tpv, sky, data)
+
+    def _publish(self, device, tpv, sky, data):
+        self.last_reports[device] = (tpv, sky)
+        for client in self.clients:
+            if client.watching:
+                client.send(data)
+
+    async def _handle(self, reader, writer):
+        client = GpsdClient(writer, high_water=self.high_water, low_water=self.low_water)
+        self.clients.add(client)
+        handler = asyncio.current_task()
+        self._handlers.add(handler)
+        try:
+            writer.write(self._version)
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                for request in line.decode('ascii', 'replace').split(';'):
+                    request = request.strip()
+                    if request:
+                        for report in self._respond(client, request):
+                            writer.write(encode(report))
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(client)
+            self._handlers.discard(handler)
+            writer.close()
+
+    def _respond(self, client, request):
+        """
+        :return: The reports to send back for one request, like '?WATCH={"enable":true}'.
+
+        >>> GpsdServer(['/dev/ttyUSB0'])._respond(None, '?WATCH=[]')
+        [{'class': 'ERROR', 'message': 'Invalid WATCH: []'}]
+        """
+        command, _, argument = request.partition('=')
+        if command == '?VERSION':
+            return [json.loads(self._version)]
+        if command == '?DEVICES':
+            return [self._devices()]
+        if command == '?WATCH':
+            try:
+                options = json.loads(argument) if argument else {}
+            except ValueError:
+                options = None
+            if not isinstance(options, dict):
+                return [{'class': 'ERROR', 'message': "Invalid WATCH: {}".format(argument)}]
+            client.watching = bool(options.get('enable', True))
+            return [self._devices(), {'class': 'WATCH', 'enable': client.watching, 'json': client.watching}]
+        if command == '?POLL':
+            reports = self.last_reports.values()
+            return [{
+                'class': 'POLL',
+                'time': iso_time(time.time()),
+                'active': len(self.last_reports),
+                'tpv': [tpv for tpv, sky in reports],
+                'sky': [sky for tpv, sky in reports],
+            }]
+        return [{'class': 'ERROR', 'message': "Unrecognized request '{}'".format(command)}]
+
+    def _devices(self):
+        return {
+            'class': 'DEVICES',
+            'devices': [{'class': 'DEVICE', 'path': device, 'driver': 'SkyTraq Venus 6'} for device in self.devices],
+        }
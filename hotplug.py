@@ -0,0 +1,245 @@
+import ctypes
+import os
+import select
+import struct
+import time
+
+from common import baudrate as default_baudrate, read_lines
+from diagnostics import logger
+
+IN_ATTRIB = 0x00000004
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# A device node appears (IN_CREATE), gets its permissions from udev (IN_ATTRIB), or a symlink like the ones in
+# /dev/serial/by-id is moved into place (IN_MOVED_TO).
+device_events = IN_CREATE | IN_ATTRIB | IN_MOVED_TO
+
+event_header = struct.Struct('iIII')
+
+# Seconds to wait at most between two failed attempts to reopen a device.
+max_reattach_delay = 5.0
+
+
+class Inotify:
+    """
+    A minimal binding of the Linux inotify API, to wait for files to appear without polling.
+
+    >>> import tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> inotify = Inotify()
+    >>> inotify.add_watch(directory, IN_CREATE)
+    >>> inotify.read_events(timeout=0)
+    []
+    >>> open(os.path.join(directory, 'ttyUSB0'), 'w').close()
+    >>> inotify.read_events(timeout=1)
+    [('ttyUSB0', 256)]
+    >>> inotify.close()
+    """
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = {}  # watch descriptor: directory
+
+    def add_watch(self, directory, mask=device_events):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for {}".format(directory))
+        self.watches[wd] = directory
+
+    def read_events(self, timeout=None):
+        """
+        Wait for events.
+
+        :param timeout: Seconds to wait, or None to wait for ever.
+
+        :return: A list of (name, mask) tuples, or an empty list if the time is up.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        data = os.read(self.fd, 65536)
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = event_header.unpack_from(data, offset)
+            offset += event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((os.fsdecode(name), mask))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _nearest_existing_directory(path):
+    directory = os.path.dirname(os.path.abspath(path))
+    while not os.path.isdir(directory):
+        directory = os.path.dirname(directory)
+    return directory
+
+
+def wait_for_device(path, timeout=None):
+    """
+    Wait until path exists and can be opened, driven by inotify events rather than polling. Paths in directories
+    that do not exist yet, like /dev/serial/by-id/... when no USB-serial adapter is plugged in, work too.
+
+    >>> import tempfile, threading
+    >>> path = os.path.join(tempfile.mkdtemp(), 'serial', 'by-id', 'usb-venus6')
+    >>> def plug_in():
+    ...     os.makedirs(os.path.dirname(path))
+    ...     open(path, 'w').close()
+    >>> threading.Timer(0.05, plug_in).start()
+    >>> wait_for_device(path, timeout=5)
+    True
+    >>> wait_for_device(path + '-other', timeout=0.01)
+    False
+
+    :param timeout: Seconds to wait, or None to wait for ever.
+
+    :return: Whether the device is there.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    inotify = Inotify()
+    try:
+        while True:
+            # Watch before looking, so that nothing can happen unnoticed in between.
+            inotify.add_watch(_nearest_existing_directory(path))
+            if os.access(path, os.R_OK | os.W_OK):
+                return True
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            inotify.read_events(timeout=remaining)
+    finally:
+        inotify.close()
+
+
+class HotplugPort:
+    """
+    Reads lines from a serial port that may be unplugged and plugged in again. When the device disappears, it waits
+    for the kernel (through inotify) to create the device node again, reopens it, detects the baud rate, and carries
+    on. Timeouts while the device is there are treated like in common.read_lines_ignoring_timeouts.
+
+    >>> import io, tempfile, threading
+    >>> path = os.path.join(tempfile.mkdtemp(), 'ttyUSB0')
+    >>> open(path, 'w').close()
+    >>> class Unplugged(io.BytesIO):
+    ...     baudrate = 9600
+    ...     def write(self, b):
+    ...         pass
+    ...     def read(self, n=1):
+    ...         data = super().read(n)
+    ...         if not data:
+    ...             os.remove(path)
+    ...             threading.Timer(0.05, lambda: open(path, 'w').close()).start()
+    ...             raise OSError("device reports readiness to read but returned no data")
+    ...         return data
+    >>> sers = iter([
+    ...     Unplugged(b'$GPGGA,1*00\\r\\n'),
+    ...     Unplugged(bytes.fromhex('a0a100028302810d0a') + b'$GPGGA,2*00\\r\\n'),  # ACK of the baud rate detection
+    ... ])
+    >>> port = HotplugPort(path, open_port=lambda path, baudrate: next(sers))
+    >>> lines = port.lines()
+    >>> bytes(next(lines)), bytes(next(lines))
+    (b'$GPGGA,1*00\\r\\n', b'$GPGGA,2*00\\r\\n')
+    >>> port.n_reattached, port.baudrate
+    (1, 115200)
+    """
+
+    def __init__(self, port, ser=None, baudrate=default_baudrate, open_port=None, max_timeouts=2, on_reattach=None):
+        """
+
+        :param port: Path of the device node, e.g. /dev/ttyUSB0 or /dev/serial/by-id/....
+
+        :param ser: The port, if it is already open.
+
+        :param baudrate: The baud rate to open it with, and to try first after it was plugged in again.
+
+        :param open_port: Called with (port, baudrate) to open the port. By default, a pyserial Serial with a timeout
+        of 1 s.
+
+        :param max_timeouts: Raise TimeoutError after this many timeouts in a row while the device is there. None
+        means never.
+
+        :param on_reattach: Called with the new serial interface after the device came back.
+
+        """
+        self.port = port
+        self.ser = ser
+        self.baudrate = baudrate
+        self.open_port = open_port if open_port is not None else _open_serial
+        self.max_timeouts = max_timeouts
+        self.on_reattach = on_reattach
+        self.n_reattached = 0
+
+    def lines(self, line_separator=b'\r\n', max_length=100):
+        """
+        :return: Generator that yields one line at a time, like common.read_lines, across reattachments.
+        """
+        if self.ser is None:
+            self.ser = self.open_port(self.port, self.baudrate)
+        n_timeouts = 0
+        while True:
+            try:
+                for line in read_lines(ser=self.ser, line_separator=line_separator, max_length=max_length):
+                    n_timeouts = 0
+                    yield line
+            except TimeoutError as e:
+                if os.path.exists(self.port):
+                    n_timeouts += 1
+                    logger.warning("Timeout %d of %s: %s", n_timeouts, self.max_timeouts, e)
+                    if self.max_timeouts is not None and n_timeouts >= self.max_timeouts:
+                        raise TimeoutError("Maximum number of timeouts reached.")
+                    continue
+                self._reattach()
+            except OSError as e:
+                logger.warning("%s: %s", self.port, e)
+                self._reattach()
+            n_timeouts = 0
+
+    def _reattach(self):
+        from rollout import baudrate_candidates, detect_baudrate
+
+        t_start = time.monotonic()
+        try:
+            self.ser.close()
+        except OSError:
+            pass
+        logger.warning("%s is gone. Waiting for it to come back...", self.port)
+        delay = 0.01
+        while True:
+            wait_for_device(self.port)
+            ser = None
+            try:
+                ser = self.open_port(self.port, self.baudrate)
+                self.baudrate = detect_baudrate(ser, baudrate_candidates(last_baudrate=self.baudrate))
+                self.ser = ser
+                break
+            except (OSError, RuntimeError) as e:
+                # Gone again already, or udev has not finished setting it up, or the receiver does not answer yet.
+                # The device node may well be there, so wait a little longer after each failure.
+                logger.warning("%s: %s Trying again in %.2f s.", self.port, e, delay)
+                if ser is not None:
+                    try:
+                        ser.close()
+                    except OSError:
+                        pass
+                time.sleep(delay)
+                delay = min(2 * delay, max_reattach_delay)
+        self.n_reattached += 1
+        logger.warning("%s is back at %d bps after %.3f s.", self.port, self.baudrate, time.monotonic() - t_start)
+        if self.on_reattach is not None:
+            self.on_reattach(self.ser)
+
+
+def _open_serial(port, baudrate):
+    import serial
+
+    return serial.Serial(port=port, baudrate=baudrate, timeout=1)
@@ -0,0 +1,139 @@
+import queue
+import threading
+
+from messages import NmeaMessage
+
+NMEA = 'nmea'
+
+DROP_OLDEST = 'drop oldest'
+BLOCK = 'block'
+
+
+def message_key(msg):
+    """
+    The key that subscribers filter on: the message ID of binary messages, or NMEA for NMEA sentences.
+
+    >>> from output_messages import OutputMessage
+    >>> message_key(OutputMessage(bytes.fromhex('a0a100028302810d0a')))
+    131
+    >>> message_key(NmeaMessage(b'$GPGGA,1*00\\r\\n'))
+    'nmea'
+    """
+    if type(msg) is NmeaMessage:
+        return NMEA
+    return msg.get_payload()[0]
+
+
+class Subscription:
+
+    def __init__(self, msg_ids=None, queue_size=100, policy=DROP_OLDEST):
+        """
+
+        :param msg_ids: Only receive messages with these keys (see message_key). None means all messages.
+
+        :param queue_size: Maximum number of messages waiting for this subscriber.
+
+        :param policy: What to do when the queue is full. DROP_OLDEST throws away the oldest waiting message (and
+        counts it in n_dropped). BLOCK makes the hub wait for this subscriber, and with it all other subscribers.
+
+        """
+        if policy not in (DROP_OLDEST, BLOCK):
+            raise ValueError("Unknown policy '{}'. Use DROP_OLDEST or BLOCK.".format(policy))
+        self.msg_ids = None if msg_ids is None else set(msg_ids)
+        self.policy = policy
+        self.messages = queue.Queue(maxsize=queue_size)
+        self.n_dropped = 0
+
+    def __iter__(self):
+        while True:
+            msg = self.messages.get()
+            if msg is None:
+                return
+            yield msg
+
+    def get(self, timeout=None):
+        """
+        :return: The next message, or None if the hub has stopped.
+        """
+        return self.messages.get(timeout=timeout)
+
+    def put(self, msg):
+        if self.policy == BLOCK:
+            self.messages.put(msg)
+            return
+        while True:
+            try:
+                self.messages.put_nowait(msg)
+                return
+            except queue.Full:
+                try:
+                    self.messages.get_nowait()
+                    self.n_dropped += 1
+                except queue.Empty:
+                    pass
+
+
+class Hub:
+    """
+    Decodes a stream once and hands each message to every subscriber that wants it.
+
+    All subscribers get the same message object, detached from the receive buffer. They must not modify it.
+
+    >>> import io
+    >>> from common import interpret_messages, read_lines
+    >>> ser = io.BytesIO(b'$GPGGA,1*00\\r\\n' + bytes.fromhex('a0a100028302810d0a'))
+    >>> hub = Hub()
+    >>> acks = hub.subscribe(msg_ids=[0x83])
+    >>> everything = hub.subscribe()
+    >>> hub.run(interpret_messages(read_lines(ser)))
+    Traceback (most recent call last):
+    ...
+    TimeoutError: UART Timeout
+    >>> [str(m) for m in acks]
+    ["GPS acknowleges 'Query software version' (0x02)"]
+    >>> len(list(everything))
+    2
+    """
+
+    def __init__(self):
+        self.subscriptions = []
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, msg_ids=None, queue_size=100, policy=DROP_OLDEST):
+        subscription = Subscription(msg_ids=msg_ids, queue_size=queue_size, policy=policy)
+        with self._lock:
+            self.subscriptions = self.subscriptions + [subscription]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self.subscriptions = [s for s in self.subscriptions if s is not subscription]
+
+    def publish(self, msg):
+        key = message_key(msg)
+        detached = False
+        for subscription in self.subscriptions:
+            if subscription.msg_ids is None or key in subscription.msg_ids:
+                if not detached:
+                    msg.detach()
+                    detached = True
+                subscription.put(msg)
+
+    def run(self, messages):
+        """
+        Publish all messages. When the stream ends (or raises), every subscriber gets None to mark the end.
+        """
+        try:
+            for msg in messages:
+                self.publish(msg)
+        finally:
+            for subscription in self.subscriptions:
+                subscription.put(None)
+
+    def start(self, messages):
+        """
+        Run in a background thread.
+        """
+        self._thread = threading.Thread(target=self.run, args=(messages,), name='venus6-hub', daemon=True)
+        self._thread.start()
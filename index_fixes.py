@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+
+from fix_index import FixIndex
+
+
+def posix_time(text):
+    t = datetime.datetime.fromisoformat(text)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=datetime.timezone.utc)
+    return t.timestamp()
+
+
+parser = argparse.ArgumentParser(description="Index the fixes in raw logs, and find them again by place and time.")
+parser.add_argument('index', help="Directory of the index.")
+subparsers = parser.add_subparsers(dest='command', metavar='COMMAND')
+subparsers.required = True
+
+p = subparsers.add_parser('add', help="Add logs (from watch --format raw) to the index.")
+p.add_argument('logs', nargs='+', metavar='LOG')
+p.add_argument('--datum', type=int, default=0,
+               help="Index of the datum of the positions, until a log says otherwise. Default: 0 (WGS-84)")
+p.add_argument('--cell-size', type=float, default=0.1, help="Degrees per grid cell of a new index. Default: 0.1")
+p.add_argument('--bucket-seconds', type=int, default=3600, help="Seconds per time bucket of a new index. Default: 3600")
+
+p = subparsers.add_parser('find', help="Print the log and offset of each fix in a box (in WGS-84) and time range.")
+p.add_argument('lat_min', type=float)
+p.add_argument('lat_max', type=float)
+p.add_argument('lon_min', type=float)
+p.add_argument('lon_max', type=float)
+p.add_argument('start', type=posix_time, help="ISO 8601, UTC unless a time zone is given.")
+p.add_argument('end', type=posix_time, help="ISO 8601, UTC unless a time zone is given.")
+
+
+def main():
+    args = parser.parse_args()
+    if args.command == 'add':
+        index = FixIndex(args.index, cell_size=args.cell_size, bucket_seconds=args.bucket_seconds)
+        for log in args.logs:
+            print("{}: {} fixes".format(log, index.add_file(log, datum_index=args.datum)))
+        index.save()
+    else:
+        index = FixIndex(args.index)
+        for path, offset in index.offsets(args.lat_min, args.lat_max, args.lon_min, args.lon_max, args.start, args.end):
+            print("{} {}".format(path, offset))
+
+
+if __name__ == '__main__':
+    main()
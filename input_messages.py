@@ -8,10 +8,9 @@ class InputMessage(Message):
     """
 
     def __str__(self):
-        s = "GPS < Host: {}".format(type(self).name)
-        for v in self.values:
-            s += "\n  {}: {}".format(v.name, v)
-        return s
+        return "\n  ".join(
+            ["GPS < Host: {}".format(type(self).name)] + ["{}: {}".format(v.name, v) for v in self.values]
+        )
 
     def get_payload(self):
         p = type(self).msg_id.to_bytes(1, byteorder=byteorder, signed=False)
@@ -64,6 +63,12 @@ Structure:
 
 
 class QuerySoftwareCrcMessage(InputMessage):
+    """
+
+    >>> bytes(QuerySoftwareCrcMessage(software_type=0)).hex()
+    'a0a100020300030d0a'
+
+    """
     msg_id = 0x03
     name = 'Query software CRC'
     description = '''
@@ -75,12 +80,12 @@ Structure:
 <0xA0,0xA1>< PL><03>< message body><CS><0x0D,0x0A>
 '''
 
-    def __init__(self):
+    def __init__(self, software_type=1):
         super().__init__()
-        # from fields import
-        # self.values = [
-        #
-        # ]
+        from fields import SoftwareTypeField
+        self.values = [
+            SoftwareTypeField(software_type)
+        ]
 
 
 class SetFactoryDefaultsMessage(InputMessage):
@@ -123,31 +128,70 @@ Structure:
 
 
 class ConfigureNmeaMessage(InputMessage):
+    """
+    >>> bytes(ConfigureNmeaMessage(gga=1, gsa=1, gsv=1, gll=0, rmc=1, vtg=0, zda=0, permanent=False)).hex()
+    'a0a10009080101010001000000080d0a'
+    >>> print(ConfigureNmeaMessage(gga=1, gsa=0, gsv=0, gll=0, rmc=1, vtg=0, zda=0, permanent=True))
+    GPS < Host: Configure NMEA message interval
+      GGA interval: 1
+      GSA interval: disabled
+      GSV interval: disabled
+      GLL interval: disabled
+      RMC interval: 1
+      VTG interval: disabled
+      ZDA interval: disabled
+      Attributes: update to both SRAM & FLASH
+    """
     msg_id = 0x08
-    name = 'TODO'
+    name = 'Configure NMEA message interval'
     description = '''
+This is a request message which will set NMEA message configuration. This command is issued from the host to GPS
+receiver and GPS receiver should respond with an ACK or NACK. The payload length is 9 bytes.
+
+Structure:
+<0xA0,0xA1>< PL><08>< message body><CS><0x0D,0x0A>
 '''
 
-    def __init__(self):
+    def __init__(self, gga, gsa, gsv, gll, rmc, vtg, zda, permanent):
         super().__init__()
-        # from fields import
-        # self.values = [
-        #
-        # ]
+        from fields import GgaIntervalField, GsaIntervalField, GsvIntervalField, GllIntervalField, RmcIntervalField, \
+            VtgIntervalField, ZdaIntervalField, AttributesField
+        self.values = [
+            GgaIntervalField(gga),
+            GsaIntervalField(gsa),
+            GsvIntervalField(gsv),
+            GllIntervalField(gll),
+            RmcIntervalField(rmc),
+            VtgIntervalField(vtg),
+            ZdaIntervalField(zda),
+            AttributesField(permanent)
+        ]
 
 
 class ConfigureOutputMessageFormatMessage(InputMessage):
+    """
+    NOTE: The example in the application note has a payload length of 3, but the field table (and the example itself)
+    only has 2 bytes.
+
+    >>> bytes(ConfigureOutputMessageFormatMessage(message_type=0)).hex()
+    'a0a100020900090d0a'
+    """
     msg_id = 0x09
-    name = 'TODO'
+    name = 'Configure output message format'
     description = '''
+This is a request message which will change the GPS receiver output message type. This command is issued from the host
+to GPS receiver and GPS receiver should respond with an ACK or NACK. The payload length is 2 bytes.
+
+Structure:
+<0xA0,0xA1>< PL><09>< message body><CS><0x0D,0x0A>
 '''
 
-    def __init__(self):
+    def __init__(self, message_type):
         super().__init__()
-        # from fields import
-        # self.values = [
-        #
-        # ]
+        from fields import MessageTypeField
+        self.values = [
+            MessageTypeField(message_type)
+        ]
 
 
 class ConfigurePowerModeMessage(InputMessage):
@@ -425,31 +469,48 @@ class QueryNavigationModeMessage(InputMessage):
 
 
 class ConfigurePpsModeMessage(InputMessage):
+    """
+    >>> bytes(ConfigurePpsModeMessage(mode=0, permanent=False)).hex()
+    'a0a100033e00003e0d0a'
+    """
     msg_id = 0x3E
-    name = 'TODO'
+    name = 'Configure 1PPS mode'
     description = '''
+This is a request message which is issued from the host to GPS receiver to configure the system 1PPS mode. The GPS
+receiver should respond with an ACK when succeeded and should respond with an NACK when failed. The payload length is 3
+bytes.
+
+Structure:
+<0xA0,0xA1>< PL><3E>< message body><CS><0x0D,0x0A>
 '''
 
-    def __init__(self):
+    def __init__(self, mode, permanent):
         super().__init__()
-        # from fields import
-        # self.values = [
-        #
-        # ]
+        from fields import PpsModeField, AttributesField
+        self.values = [
+            PpsModeField(mode),
+            AttributesField(permanent)
+        ]
 
 
 class QueryPpsModeMessage(InputMessage):
+    """
+    >>> bytes(QueryPpsModeMessage()).hex()
+    'a0a100013f3f0d0a'
+    """
     msg_id = 0x3F
-    name = 'TODO'
+    name = 'Query 1PPS mode'
     description = '''
+This is a request message which is issued from the host to GPS receiver to query 1PPS mode. The GPS receiver should
+respond with an ACK along with 1PPS mode when succeeded and should respond with an NACK when failed. The payload length
+is 1 byte.
+
+Structure:
+<0xA0,0xA1>< PL><3F>< message body><CS><0x0D,0x0A>
 '''
 
     def __init__(self):
         super().__init__()
-        # from fields import
-        # self.values = [
-        #
-        # ]
 
 
 class UnknownMessage(InputMessage):
@@ -465,6 +526,7 @@ input_message_types = {
     0x04: SetFactoryDefaultsMessage,
     0x05: ConfigureSerialPortMessage,
     0x08: ConfigureNmeaMessage,
+    0x09: ConfigureOutputMessageFormatMessage,
     0x0c: ConfigurePowerModeMessage,
     0x0e: ConfigurePositionUpdateRateMessage,
     0x10: QueryPositionUpdateRateMessage,
@@ -0,0 +1,155 @@
+import struct
+from multiprocessing import resource_tracker, shared_memory
+
+from epoch import EpochAssembler
+from messages import NmeaMessage
+
+default_name = 'venus6-latest-fix'
+
+# The block starts and ends with a copy of the sequence number, so that one pack_into writes everything: the numbers
+# only match when no write was going on while a reader read the block.
+record_format = '<QddddddddBBBxhxxQ'
+record_size = struct.calcsize(record_format)
+sequence_end_offset = record_size - 8
+
+field_names = (
+    'timestamp', 'seconds', 'latitude', 'longitude', 'altitude', 'speed', 'course', 'hdop',
+    'fix_quality', 'fix_type', 'n_satellites_used', 'datum_index',
+)
+
+UNKNOWN_DATUM = -1
+
+# Blocks made by publishers in this process. Their readers must leave them registered with the resource tracker.
+_published_names = set()
+
+
+class LatestFixPublisher:
+    """
+    Keeps the latest fix in a multiprocessing.shared_memory block, for any number of readers in other processes (see
+    LatestFixReader). Writing an epoch is one struct.pack_into.
+
+    The datum is not in the NMEA sentences. It is taken from the last GpsDatumMessage in the stream, so query it once
+    (input_messages.QueryDatumMessage) after starting.
+
+    >>> sentences = [
+    ...     b'$GPGGA,123519.00,4807.0380,N,01131.0000,E,1,08,0.9,545.4,M,46.9,M,,*69\\r\\n',
+    ...     b'$GPRMC,123519.00,A,4807.0380,N,01131.0000,E,022.4,084.4,230394,,,A*52\\r\\n',
+    ...     b'$GPGGA,123520.00,4807.0390,N,01131.0000,E,1,08,0.9,545.5,M,46.9,M,,*63\\r\\n',
+    ... ]
+    >>> from output_messages import OutputMessage
+    >>> datum = OutputMessage(bytes.fromhex('a0a10003ae0000ae0d0a')).interpret()
+    >>> publisher = LatestFixPublisher(name='venus6-doctest-fix')
+    >>> publisher.run([datum] + [NmeaMessage(s) for s in sentences])
+    >>> reader = LatestFixReader(name='venus6-doctest-fix')
+    >>> fix = reader.read()
+    >>> fix['timestamp'], round(fix['latitude'], 6), fix['fix_quality'], fix['datum_index']
+    (764426119.0, 48.1173, 1, 0)
+    >>> reader.sequence
+    1
+    >>> reader.close()
+    >>> publisher.close(unlink=True)
+    """
+
+    def __init__(self, name=default_name, create=True):
+        """
+
+        :param name: Name of the shared memory block (under /dev/shm on Linux).
+
+        :param create: Make a new block. Otherwise, take over an existing one.
+
+        """
+        if create:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, create=True, size=record_size)
+            except FileExistsError:
+                # Left behind by a publisher that did not clean up.
+                self.shm = shared_memory.SharedMemory(name=name)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        _published_names.add(self.shm.name)
+        self.sequence = struct.unpack_from('<Q', self.shm.buf)[0]
+        self.datum_index = UNKNOWN_DATUM
+
+    def publish(self, fix):
+        """
+        :param epoch.FixRecord fix:
+        """
+        self.sequence += 1
+        struct.pack_into(
+            record_format, self.shm.buf, 0,
+            self.sequence,
+            fix.timestamp(),
+            fix.seconds,
+            fix.latitude,
+            fix.longitude,
+            fix.altitude,
+            fix.speed,
+            fix.course,
+            fix.hdop,
+            fix.fix_quality,
+            fix.fix_type,
+            fix.n_satellites_used,
+            self.datum_index,
+            self.sequence,
+        )
+
+    def run(self, messages):
+        """
+        Publish every epoch of the stream.
+
+        :param messages: Iterable of messages, e.g. from common.interpret_messages.
+        """
+        from output_messages import GpsDatumMessage
+
+        assembler = EpochAssembler()
+        for msg in messages:
+            if type(msg) is NmeaMessage:
+                fix = assembler.add(msg.nmea_string)
+                if fix is not None:
+                    self.publish(fix)
+            elif type(msg) is GpsDatumMessage:
+                self.datum_index = msg.values[0].value
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            _published_names.discard(self.shm.name)
+            self.shm.unlink()
+
+
+class LatestFixReader:
+    """
+    Reads the block of a LatestFixPublisher. Reading takes no locks and no system calls: it copies the block and tries
+    again if the publisher was writing at the same time.
+    """
+
+    def __init__(self, name=default_name):
+        try:
+            self.shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Before Python 3.13, the resource tracker would remove the block when this process ends.
+            self.shm = shared_memory.SharedMemory(name=name)
+            if self.shm.name not in _published_names:
+                resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.sequence = 0
+
+    def read(self):
+        """
+        :return: A dict with the field_names, or None if nothing has been published yet.
+        """
+        buf = self.shm.buf
+        while True:
+            # The end copy is written last, so read it first. The start copy is written first, so read it again
+            # after the data. If a write was going on or started in between, it is ahead of the end copy.
+            end = struct.unpack_from('<Q', buf, sequence_end_offset)[0]
+            values = struct.unpack_from(record_format, buf)
+            start = struct.unpack_from('<Q', buf)[0]
+            if start == end:
+                break
+        if end == 0:
+            return None
+        self.sequence = end
+        return dict(zip(field_names, values[1:-1]))
+
+    def close(self):
+        self.shm.close()
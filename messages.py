@@ -28,9 +28,23 @@ class Message:
 
 
 class NmeaMessage:
+    """
+    >>> m = NmeaMessage(memoryview(b'$GPGGA,1*00\\r\\n'))
+    >>> print(m)
+    b'$GPGGA,1*00\\r\\n'
+    >>> type(m.detach().nmea_string)
+    <class 'bytes'>
+    """
 
     def __init__(self, nmea_string):
         self.nmea_string = nmea_string
 
     def __str__(self):
-        return str(self.nmea_string)
+        return str(bytes(self.nmea_string))
+
+    def detach(self):
+        """
+        Copy the sentence out of the receive buffer, so that the message can be kept without keeping the buffer alive.
+        """
+        self.nmea_string = bytes(self.nmea_string)
+        return self
@@ -1,46 +1,119 @@
 from messages import Message
+from diagnostics import MalformedFrameReport
 import fields
 
+# Reasons why a frame is invalid.
+TOO_SHORT = 'too short'
+START_BYTES = 'start bytes'
+END_BYTES = 'end bytes'
+LENGTH = 'length'
+CHECKSUM = 'checksum'
+PAYLOAD = 'payload'
+
+reason_descriptions = {
+    TOO_SHORT: "Malformed message: Message is too short.",
+    START_BYTES: "Malformed message: Start bytes are wrong.",
+    END_BYTES: "Malformed message: End bytes are wrong.",
+    LENGTH: "Malformed message: Message length is wrong.",
+    CHECKSUM: "Malformed message: Checksum is wrong.",
+    PAYLOAD: "Malformed message: Payload does not fit the message ID.",
+}
+
+
+def frame_error(input_bytes):
+    """
+    Check the framing, length and checksum of a binary message.
+
+    >>> frame_error(bytes.fromhex('a0a100028302810d0a')) is None
+    True
+    >>> frame_error(bytes.fromhex('a0a100028302800d0a'))
+    'checksum'
+    >>> frame_error(b'\\r\\n')
+    'too short'
+
+    :return: One of the reasons above, or None if the frame is fine.
+    """
+    if len(input_bytes) < 8:
+        return TOO_SHORT
+    if input_bytes[0] != 0xa0 or input_bytes[1] != 0xa1:
+        return START_BYTES
+    if input_bytes[-1] != 0x0a or input_bytes[-2] != 0x0d:
+        return END_BYTES
+    payload_length = int.from_bytes(input_bytes[2:4], byteorder='big', signed=False)
+    if len(input_bytes) != payload_length + 7:
+        return LENGTH
+    cs = 0
+    for b in input_bytes[4:4 + payload_length]:
+        cs ^= b
+    if input_bytes[-3] != cs:
+        return CHECKSUM
+    return None
+
 
 class OutputMessage(Message):
     """
     A Message from the GPS unit to the host.
+
+    The input bytes may be a memoryview into a receive buffer (see common.read_lines). The payload and the payloads of
+    the interpreted messages are then views into the same buffer, and nothing is copied.
+
+    >>> msg = OutputMessage(memoryview(bytes.fromhex('a0a100028302810d0a'))).interpret()
+    >>> print(msg)
+    GPS acknowleges 'Query software version' (0x02)
+    >>> type(msg.payload)
+    <class 'memoryview'>
+    >>> type(msg.detach().payload)
+    <class 'bytes'>
     """
 
+    # Length of the payload of messages of this type, if known.
+    payload_length = None
+
     def __init__(self, input_bytes):
         super().__init__()
 
-        if input_bytes[0] != 0xa0 or input_bytes[1] != 0xa1:
-            raise ValueError("Malformed message: Start bytes are wrong.")
+        reason = frame_error(input_bytes)
+        if reason is not None:
+            raise ValueError(reason_descriptions[reason])
 
-        if input_bytes[-1] != 0x0a or input_bytes[-2] != 0x0d:
-            raise ValueError("Malformed message: End bytes are wrong.")
+        self.payload = input_bytes[4:-3]
 
-        payload_length = int.from_bytes(input_bytes[2:4], byteorder='big', signed=False)
-        if len(input_bytes) != payload_length + 7:
-            raise ValueError("Malformed message: Message length is wrong.")
-
-        self.payload = input_bytes[4:4 + payload_length]
-        if input_bytes[-3] != self.calculate_checksum()[0]:
-            raise ValueError("Malformed message: Checksum is wrong.")
+    @classmethod
+    def from_payload(cls, payload):
+        """
+        Make an uninterpreted message from a payload that was already checked.
+        """
+        msg = cls.__new__(cls)
+        Message.__init__(msg)
+        msg.payload = payload
+        return msg
 
     def __str__(self):
-        s = "GPS > Host: {}".format(type(self).name)
-        for v in self.values:
-            s += "\n  {}: {}".format(v.name, v)
-        return s
+        return "\n  ".join(
+            ["GPS > Host: {}".format(type(self).name)] + ["{}: {}".format(v.name, v) for v in self.values]
+        )
 
     def get_payload(self):
         return self.payload
 
+    def detach(self):
+        """
+        Copy the payload out of the receive buffer, so that the message can be kept without keeping the buffer alive.
+        """
+        self.payload = bytes(self.payload)
+        return self
+
     def interpret(self):
         payload = self.get_payload()
+        if payload[0] not in output_message_types:
+            raise ValueError("Unknown message ID 0x{:02x}.".format(payload[0]))
         return output_message_types[payload[0]](payload)
 
 
 class SoftwareVersionMessage(OutputMessage):
     msg_id = 0x80
     name = 'Software Version'
+    payload_length = 14
     description = '''
 This is a response message which provides the software version of the GPS receiver. This message is sent from the GPS
 receiver to host. The example below output the SkyTraq software version as 01.01.01-01.03.14-07.01.18 on System image.
@@ -73,8 +146,15 @@ Structure:
 
 
 class SoftwareCrcMessage(OutputMessage):
+    """
+    >>> print(OutputMessage(bytes.fromhex('a0a10004810198766e0d0a')).interpret())
+    GPS > Host: Software CRC
+      Software Type: 0x01
+      CRC: 0x9876
+    """
     msg_id = 0x81
     name = 'Software CRC'
+    payload_length = 4
     description = '''
 This is a response message which provides the software CRC of the GPS receiver. This message is sent from the GPS
 receiver to host. The payload length is 4 bytes.
@@ -82,15 +162,31 @@ receiver to host. The payload length is 4 bytes.
 Structure:
 <0xA0,0xA1>< PL><81>< message body><CS><0x0D,0x0A>
 '''
-    # fields = [
-    #     SoftwareTypeField,
-    #     CrcField
-    # ]
+
+    # noinspection PyMissingConstructor
+    def __init__(self, payload):
+        # Don't call super init.
+
+        if payload[0] != type(self).msg_id:
+            raise AttributeError("This is the wrong message class for the given payload. Expected {}, got {}.".format(
+                type(self).msg_id,
+                payload[0]
+            ))
+
+        if len(payload) != 4:
+            raise AttributeError("Payload length should be 4.")
+
+        self.payload = payload
+        self.values = [
+            fields.SoftwareTypeField(payload[1]),
+            fields.CrcField(payload[2:4]),
+        ]
 
 
 class AckMessage(OutputMessage):
     msg_id = 0x83
     name = 'ACK'
+    payload_length = 2
     description = '''
 This is a response message which is an acknowledgement to a request message. The payload length is 2 bytes.
 
@@ -129,6 +225,7 @@ Structure:
 class NackMessage(OutputMessage):
     msg_id = 0x84
     name = 'NACK'
+    payload_length = 2
     description = '''
 This is a response message which is a response to an unsuccessful request message. This is used to notify the Host that
 the request message has been rejected. The payload length is 2 bytes.
@@ -168,6 +265,7 @@ Structure:
 class PositionUpdateRateMessage(OutputMessage):
     msg_id = 0x86
     name = 'Position Update Rate'
+    payload_length = 2
     description = '''
 This is a response message to QUERY POSITION UPDATE RATE which provides the position update rate of the GPS receiver.
 This message is sent from the GPS receiver to host. The payload length is 2 bytes.
@@ -231,6 +329,7 @@ class GpsEphemerisDataMessage(OutputMessage):
 class GpsDatumMessage(OutputMessage):
     msg_id = 0xAE
     name = 'GPS datum'
+    payload_length = 3
     description = '''
 This is a response message which provides the datum information of the GPS receiver. This message is sent from the GPS
 receiver to host. The payload length is 3 bytes.
@@ -295,6 +394,7 @@ Structure:
 class GpsPositionPinningStatusMessage(OutputMessage):
     msg_id = 0xb4
     name = 'GPS position pinning status'
+    payload_length = 12
     description = '''
 NOTE: This description is incorrect in the application note.
 '''
@@ -369,10 +469,20 @@ class GpsNavigationModeMessage(OutputMessage):
 
 
 class GpsPpsModeMessage(OutputMessage):
+    """
+    >>> print(OutputMessage(bytes.fromhex('a0a10002b601b70d0a')).interpret())
+    GPS > Host: GPS 1PPS mode
+      1PPS mode: on when 3D fix
+    """
     msg_id = 0xb6
-    name = 'TODO'
+    name = 'GPS 1PPS mode'
+    payload_length = 2
     description = '''
+This is a response message to QUERY 1PPS MODE which provides the 1PPS mode of the GPS receiver. This message is sent
+from the GPS receiver to host. The payload length is 2 bytes.
 
+Structure:
+<0xA0,0xA1>< PL><B6>< message body><CS><0x0D,0x0A>
 '''
 
     # noinspection PyMissingConstructor
@@ -385,17 +495,13 @@ class GpsPpsModeMessage(OutputMessage):
                 payload[0]
             ))
 
-        # if len(payload) != :
-        #     raise AttributeError("Payload length should be .")
+        if len(payload) != 2:
+            raise AttributeError("Payload length should be 2.")
 
         self.payload = payload
-        # self.values = [
-        #
-        # ]
-
-    def __str__(self):
-        return "TODO"
-        # return "{}".format(self.values)
+        self.values = [
+            fields.PpsModeField(payload[1])
+        ]
 
 
 output_message_types = {
@@ -410,3 +516,80 @@ output_message_types = {
     0xb5: GpsNavigationModeMessage,
     0xb6: GpsPpsModeMessage,
 }
+
+
+# Kinds of DecodeResult.
+DECODED = 'decoded'
+UNKNOWN = 'unknown'
+INVALID = 'invalid'
+
+
+class DecodeResult:
+    """
+    :ivar kind: DECODED, UNKNOWN (a valid frame with a message ID that has no class yet, or with a payload that its
+    class can't make sense of, in which case reason is PAYLOAD; message is an uninterpreted OutputMessage) or INVALID
+    (message is None and reason says why).
+    """
+    __slots__ = ['kind', 'message', 'reason']
+
+    def __init__(self, kind, message=None, reason=None):
+        self.kind = kind
+        self.message = message
+        self.reason = reason
+
+
+class Decoder:
+    """
+    Decodes binary frames into a DecodeResult, without using exceptions for frames that are broken or unknown, and
+    keeps running totals per kind. Invalid frames, and valid frames that don't fit the class of their message ID, are
+    also passed on to a MalformedFrameReport.
+
+    >>> decoder = Decoder()
+    >>> print(decoder.decode(bytes.fromhex('a0a100028302810d0a')).message)
+    GPS acknowleges 'Query software version' (0x02)
+    >>> decoder.decode(bytes.fromhex('a0a10001a8a80d0a')).kind
+    'unknown'
+    >>> result = decoder.decode(bytes.fromhex('a0a100038302ff7e0d0a'))
+    >>> result.kind, result.reason, bytes(result.message.get_payload()).hex()
+    ('unknown', 'payload', '8302ff')
+    >>> decoder.decode(bytes.fromhex('a0a100028302800d0a')).reason
+    'checksum'
+    >>> decoder.totals
+    {'decoded': 1, 'unknown': 2, 'invalid': 1}
+    """
+
+    def __init__(self, report=None):
+        self.totals = {DECODED: 0, UNKNOWN: 0, INVALID: 0}
+        self.report = MalformedFrameReport() if report is None else report
+
+    def decode(self, input_bytes):
+        reason = frame_error(input_bytes)
+        if reason is not None:
+            return self._invalid(input_bytes, reason)
+
+        payload = input_bytes[4:-3]
+        message_type = output_message_types.get(payload[0])
+        if message_type is None:
+            self.totals[UNKNOWN] += 1
+            return DecodeResult(UNKNOWN, OutputMessage.from_payload(payload))
+
+        if message_type.payload_length is not None and len(payload) != message_type.payload_length:
+            return self._undecodable(input_bytes, payload)
+        try:
+            # Raises if a field has a value that is out of range, or the class is not finished yet.
+            msg = message_type(payload)
+        except (AttributeError, ValueError):
+            return self._undecodable(input_bytes, payload)
+        self.totals[DECODED] += 1
+        return DecodeResult(DECODED, msg)
+
+    def _undecodable(self, input_bytes, payload):
+        # The frame itself is fine, so pass it on uninterpreted, like one with an unknown message ID.
+        self.totals[UNKNOWN] += 1
+        self.report.add(input_bytes, PAYLOAD)
+        return DecodeResult(UNKNOWN, OutputMessage.from_payload(payload), reason=PAYLOAD)
+
+    def _invalid(self, input_bytes, reason):
+        self.totals[INVALID] += 1
+        self.report.add(input_bytes, reason)
+        return DecodeResult(INVALID, reason=reason)
@@ -0,0 +1,128 @@
+import io
+import time
+
+from bandwidth import default_nmea_intervals, nmea_sentence_lengths
+
+
+class OutputProfile:
+
+    def __init__(self, name, message_type, nmea_intervals):
+        """
+
+        :param message_type: Value of fields.MessageTypeField.
+
+        :param nmea_intervals: dict mapping NMEA sentence types to their interval (0 = off). Only used if the message
+        type is NMEA.
+
+        """
+        self.name = name
+        self.message_type = message_type
+        self.nmea_intervals = nmea_intervals
+
+    def get_messages(self, permanent):
+        """
+        >>> [m.name for m in output_profiles['minimal'].get_messages(permanent=False)]
+        ['Configure output message format', 'Configure NMEA message interval']
+        >>> [m.name for m in output_profiles['binary'].get_messages(permanent=False)]
+        ['Configure output message format']
+        """
+        from input_messages import ConfigureOutputMessageFormatMessage, ConfigureNmeaMessage
+
+        messages = [ConfigureOutputMessageFormatMessage(message_type=self.message_type)]
+        if self.message_type == 1:
+            messages.append(ConfigureNmeaMessage(
+                gga=self.nmea_intervals.get('GGA', 0),
+                gsa=self.nmea_intervals.get('GSA', 0),
+                gsv=self.nmea_intervals.get('GSV', 0),
+                gll=self.nmea_intervals.get('GLL', 0),
+                rmc=self.nmea_intervals.get('RMC', 0),
+                vtg=self.nmea_intervals.get('VTG', 0),
+                zda=self.nmea_intervals.get('ZDA', 0),
+                permanent=permanent,
+            ))
+        return messages
+
+
+output_profiles = {
+    # What the receiver sends out of the box.
+    'default': OutputProfile('default', 1, default_nmea_intervals),
+    # Only the sentences with position, time and fix quality.
+    'minimal': OutputProfile('minimal', 1, {'GGA': 1, 'RMC': 1}),
+    # Binary messages only, e.g. for watch.py, which skips NMEA anyway.
+    'binary': OutputProfile('binary', 2, {}),
+}
+
+
+def apply_output_profile(ser, name, permanent=True, messages=None, on_message=None):
+    """
+    Send the messages of an output profile, waiting for the ACK of each.
+
+    :param Serial ser: The serial interface.
+
+    :param name: Key of output_profiles.
+
+    :param permanent: Whether to write the NMEA intervals to FLASH too.
+
+    :param messages: Iterable of interpreted messages from the GPS unit. By default, they are read from ser.
+
+    :param on_message: Called with every message that is read, e.g. print.
+
+    """
+    from writer import BurstWriter
+
+    writer = BurstWriter(ser, messages=messages, on_message=on_message)
+    for msg in output_profiles[name].get_messages(permanent=permanent):
+        writer.queue(msg)
+    return writer.flush()
+
+
+def make_nmea_output(nmea_intervals, n_fixes):
+    """
+    Make fake NMEA output with sentences of typical length, as the receiver would send it for n_fixes fixes.
+
+    >>> len(make_nmea_output({'GGA': 1, 'RMC': 2}, 2))
+    214
+    """
+    output = []
+    for i_fix in range(n_fixes):
+        for sentence, interval in nmea_intervals.items():
+            if interval and i_fix % interval == 0:
+                n_parts = 3 if sentence == 'GSV' else 1
+                length = nmea_sentence_lengths[sentence] // n_parts
+                for _ in range(n_parts):
+                    start = '$GP{},'.format(sentence).encode()
+                    output.append(start + b'0' * (length - len(start) - 2) + b'\r\n')
+    return b''.join(output)
+
+
+class FakeSerial(io.BytesIO):
+    """
+    Like a serial port where all the output has already arrived.
+    """
+
+    @property
+    def in_waiting(self):
+        return len(self.getbuffer()) - self.tell()
+
+
+def benchmark(n_fixes=1000, profile_names=None):
+    """
+    Measure the CPU time that common.interpret_messages (with common.read_lines) spends per fix for each profile.
+
+    :return: dict mapping each profile name to CPU seconds per fix.
+    """
+    from common import interpret_messages, read_lines
+
+    if profile_names is None:
+        profile_names = [name for name, profile in output_profiles.items() if profile.message_type == 1]
+    results = {}
+    for name in profile_names:
+        output = make_nmea_output(output_profiles[name].nmea_intervals, n_fixes)
+        t_start = time.process_time()
+        try:
+            for _ in interpret_messages(read_lines(FakeSerial(output))):
+                pass
+        except TimeoutError:
+            pass  # End of output
+        results[name] = (time.process_time() - t_start) / n_fixes
+    return results
@@ -0,0 +1,437 @@
+import io
+import multiprocessing
+import queue
+import signal
+import struct
+import time
+from multiprocessing import shared_memory
+
+from common import read_lines
+from diagnostics import logger
+
+# Kinds of records on the result queue.
+RESULT = 'result'
+UTILIZATION = 'utilization'
+READER_TOTALS = 'reader totals'
+WORKER_DONE = 'worker done'
+
+default_ring_size = 1 << 16
+
+# The position up to which the consumer is done with the ring, modulo 2 ** 32. Four bytes, so that even a 32 bit CPU
+# writes it in one go.
+ring_header = struct.Struct('<I')
+position_mask = 0xFFFFFFFF
+
+
+class FrameRing:
+    """
+    Frames in a ring buffer in shared memory, for one producer process and one consumer process. Only the position
+    and length of a frame have to be sent to the consumer, e.g. through a multiprocessing.Queue.
+
+    Positions count bytes modulo 2 ** 32. The size is a power of two, so the offset in the ring is the position modulo
+    the size. A frame never wraps around: if it does not fit before the end, it goes to the start.
+
+    >>> producer = FrameRing(size=16, create=True)
+    >>> consumer = FrameRing(name=producer.name)
+    >>> producer.put(b'$GPGGA,1\\r\\n'), producer.put(b'$GPRMC\\r\\n')
+    (0, None)
+    >>> consumer.read(0, 10)
+    b'$GPGGA,1\\r\\n'
+    >>> consumer.release(0, 10)
+    >>> producer.put(b'$GPRMC\\r\\n')
+    16
+    >>> consumer.close()
+    >>> producer.close(unlink=True)
+    """
+
+    def __init__(self, name=None, size=default_ring_size, create=False):
+        """
+
+        :param name: Name of the shared memory block, to attach to the ring of another process.
+
+        :param size: Number of bytes for frames. Has to be a power of two.
+
+        :param create: Whether to make a new block (in the producer or the process that owns the ring).
+
+        """
+        if create:
+            if size & (size - 1):
+                raise ValueError("The size of the ring has to be a power of two, not {}.".format(size))
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=ring_header.size + size)
+            ring_header.pack_into(self.shm.buf, 0, 0)
+        else:
+            try:
+                self.shm = shared_memory.SharedMemory(name=name, track=False)
+            except TypeError:
+                # Before Python 3.13. The resource tracker is shared with the process that made the block, which also
+                # unlinks it, so the registration does no harm.
+                self.shm = shared_memory.SharedMemory(name=name)
+        self.name = self.shm.name
+        self.size = self.shm.size - ring_header.size
+        # shared_memory may round the block up to whole pages.
+        while self.size & (self.size - 1):
+            self.size &= self.size - 1
+        self.head = 0
+
+    def put(self, frame):
+        """
+        Producer side.
+
+        :return: The position of the frame, or None if the ring is full.
+        """
+        length = len(frame)
+        position = self.head
+        offset = position & (self.size - 1)
+        if offset + length > self.size:
+            position = (position + self.size - offset) & position_mask
+            offset = 0
+        tail = ring_header.unpack_from(self.shm.buf, 0)[0]
+        if (position + length - tail) & position_mask > self.size:
+            return None
+        start = ring_header.size + offset
+        self.shm.buf[start:start + length] = frame
+        self.head = (position + length) & position_mask
+        return position
+
+    def read(self, position, length):
+        """
+        Consumer side: copy a frame out of the ring.
+        """
+        start = ring_header.size + (position & (self.size - 1))
+        return bytes(self.shm.buf[start:start + length])
+
+    def release(self, position, length):
+        """
+        Consumer side: hand the space of a frame, and of all frames before it, back to the producer.
+        """
+        ring_header.pack_into(self.shm.buf, 0, (position + length) & position_mask)
+
+    def close(self, unlink=False):
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def open_serial(port, baudrate):
+    import serial
+
+    # A short timeout, so that the reader notices soon when it should stop.
+    return serial.serial_for_url(port, baudrate=baudrate, timeout=0.2)
+
+
+class Recording(io.FileIO):
+    # Lets common.read_lines read a block at a time instead of a byte at a time.
+    in_waiting = 4096
+
+
+def open_file(path, baudrate):
+    """
+    Replay a recording, e.g. from watch --format raw, instead of reading a receiver.
+    """
+    return Recording(path)
+
+
+def read_port(port_index, port, baudrate, ring_name, tasks, results, stop, open_port, replay):
+    """
+    The reader process of one port: splits the stream into lines, checks binary frames with
+    output_messages.frame_error, and puts the good ones into the ring. The decoding is left to the workers.
+
+    A receiver does not wait, so frames that do not fit into the ring are dropped. A recording does, so when
+    replaying, the reader waits for the worker instead, and stops at the end. Frames that are longer than the whole
+    ring are always dropped.
+
+    >>> import os, queue, tempfile, threading
+    >>> path = os.path.join(tempfile.mkdtemp(), 'receiver.raw')
+    >>> with open(path, 'wb') as f:
+    ...     _ = f.write(b'$GPGGA,' + b'0' * 20 + b'\\r\\n' + b'$GPRMC\\r\\n')
+    >>> ring = FrameRing(size=16, create=True)
+    >>> tasks, results = queue.Queue(), queue.Queue()
+    >>> handler = signal.getsignal(signal.SIGINT)
+    >>> read_port(0, path, None, ring.name, tasks, results, threading.Event(), open_file, replay=True)
+    >>> _ = signal.signal(signal.SIGINT, handler)
+    >>> results.get()[2:]  # Frames, dropped, invalid
+    (1, 1, 0)
+    >>> ring.close(unlink=True)
+    """
+    from output_messages import frame_error
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ring = FrameRing(name=ring_name)
+    n_frames = n_dropped = n_invalid = 0
+    try:
+        with open_port(port, baudrate) as ser:
+            while not stop.is_set():
+                try:
+                    for line in read_lines(ser):
+                        if line[:1] != b'$' and frame_error(line) is not None:
+                            n_invalid += 1
+                        else:
+                            position = ring.put(line) if len(line) <= ring.size else None
+                            while position is None and replay and len(line) <= ring.size and not stop.is_set():
+                                time.sleep(0.001)
+                                position = ring.put(line)
+                            if position is None:
+                                n_dropped += 1
+                            else:
+                                n_frames += 1
+                                tasks.put((port_index, position, len(line), time.time()))
+                        if stop.is_set():
+                            break
+                except TimeoutError:
+                    if replay:
+                        break
+    finally:
+        results.put((READER_TOTALS, port, n_frames, n_dropped, n_invalid))
+        ring.close()
+
+
+class Utilization:
+    """
+    What a worker did in an interval.
+    """
+
+    def __init__(self, worker, seconds, busy_seconds, n_frames, total_latency):
+        self.worker = worker
+        self.seconds = seconds
+        self.busy_seconds = busy_seconds
+        self.n_frames = n_frames
+        self.total_latency = total_latency
+
+    @property
+    def busy_fraction(self):
+        return self.busy_seconds / self.seconds if self.seconds > 0 else 0.
+
+    def __str__(self):
+        """
+        >>> print(Utilization(worker=1, seconds=10., busy_seconds=2.5, n_frames=2000, total_latency=4.))
+        Worker 1: 25.0% busy, 200.0 frames/s, 2.0 ms from arrival to done
+        """
+        return "Worker {}: {:.1f}% busy, {:.1f} frames/s, {:.1f} ms from arrival to done".format(
+            self.worker,
+            100 * self.busy_fraction,
+            self.n_frames / self.seconds if self.seconds > 0 else 0.,
+            1000 * self.total_latency / self.n_frames if self.n_frames else 0.,
+        )
+
+
+def work(worker, ports, ring_names, tasks, results, make_processor, report_interval):
+    """
+    A worker process: decodes the frames of its ports from their rings and hands the messages to a processor per
+    port. Anything a processor returns is sent to the parent.
+    """
+    from messages import NmeaMessage
+    from output_messages import Decoder, INVALID
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    rings = {port_index: FrameRing(name=name) for port_index, name in ring_names.items()}
+    processors = {port_index: make_processor(ports[port_index]) for port_index in ring_names}
+    decoder = Decoder()
+    t_start = t_report = time.monotonic()
+    total = Utilization(worker, 0., 0., 0, 0.)
+    interval = Utilization(worker, 0., 0., 0, 0.)
+
+    def report(utilization, now, since, final=False):
+        utilization.seconds = now - since
+        results.put((UTILIZATION, utilization, final))
+
+    try:
+        while True:
+            try:
+                task = tasks.get(timeout=max(0., t_report + report_interval - time.monotonic()))
+            except queue.Empty:
+                task = ()
+            t_busy = time.monotonic()
+            if t_busy - t_report >= report_interval:
+                report(interval, t_busy, t_report)
+                interval = Utilization(worker, 0., 0., 0, 0.)
+                t_report = t_busy
+            if task is None:
+                break
+            if not task:
+                continue
+            port_index, position, length, t_arrival = task
+            ring = rings[port_index]
+            line = ring.read(position, length)
+            ring.release(position, length)
+            if line[:1] == b'$':
+                msg = NmeaMessage(line)
+            else:
+                result = decoder.decode(line)
+                msg = None if result.kind is INVALID else result.message
+            if msg is not None:
+                for output in processors[port_index].process(msg) or ():
+                    results.put((RESULT, ports[port_index], output))
+            now = time.monotonic()
+            for utilization in (interval, total):
+                utilization.busy_seconds += now - t_busy
+                utilization.n_frames += 1
+                utilization.total_latency += time.time() - t_arrival
+        for port_index, processor in processors.items():
+            for output in processor.flush() or ():
+                results.put((RESULT, ports[port_index], output))
+        report(total, time.monotonic(), t_start, final=True)
+    finally:
+        for ring in rings.values():
+            ring.close()
+        results.put((WORKER_DONE, worker))
+
+
+class AggregatingProcessor:
+    """
+    A processor for run: the windowed summaries of aggregate.WindowAggregator, as strings.
+    """
+
+    def __init__(self, port, length=1.0, offset=0.0):
+        from aggregate import WindowAggregator
+        from epoch import EpochAssembler
+
+        self.assembler = EpochAssembler()
+        self.aggregator = WindowAggregator(length=length, offset=offset)
+
+    def process(self, msg):
+        from messages import NmeaMessage
+
+        if type(msg) is not NmeaMessage:
+            return None
+        fix = self.assembler.add(msg.nmea_string)
+        if fix is None:
+            return None
+        summary = self.aggregator.add(fix)
+        return None if summary is None else [str(summary)]
+
+    def flush(self):
+        summary = self.aggregator.flush()
+        return None if summary is None else [str(summary)]
+
+
+def run(ports, make_processor, n_workers=2, baudrates=None, ring_size=default_ring_size, report_interval=10.0,
+        on_result=None, on_utilization=None, open_port=open_serial, replay=False):
+    """
+    Read and decode many receivers with several processes, so that the decoding and processing are not limited to
+    one CPU by the GIL.
+
+    There is a reader process per port, which only splits the stream into frames and puts them into a FrameRing.
+    Each port belongs to one of n_workers worker processes, which decodes its frames (in order) and passes them to a
+    processor. Only (port, position, length, arrival time) tuples, and the results of the processors, go through
+    pipes.
+
+    >>> import functools, os, tempfile
+    >>> directory = tempfile.mkdtemp()
+    >>> paths = [os.path.join(directory, 'receiver{}.raw'.format(i)) for i in range(3)]
+    >>> def sentence(body):
+    ...     checksum = 0
+    ...     for b in body.encode():
+    ...         checksum ^= b
+    ...     return '${}*{:02X}\\r\\n'.format(body, checksum).encode()
+    >>> for i, path in enumerate(paths):
+    ...     with open(path, 'wb') as f:
+    ...         for second in range(3):
+    ...             _ = f.write(sentence('GPGGA,1200{:02d}.00,3354.000,S,01824.000,E,1,08,1.0,{}.0,M,0.0,M,,'.format(
+    ...                 second, i)))
+    ...             _ = f.write(bytes.fromhex('a0a100028302810d0a'))
+    >>> results = []
+    >>> utilizations = run(paths, functools.partial(AggregatingProcessor, length=60), n_workers=2,
+    ...                    on_result=lambda port, output: results.append((os.path.basename(port), output)),
+    ...                    open_port=open_file, replay=True)
+    >>> for port, output in sorted(results):
+    ...     print(port, output[:54])
+    receiver0.raw Window 43200.00 to 43260.00 s: 2 fixes, -33.900000, 18
+    receiver1.raw Window 43200.00 to 43260.00 s: 2 fixes, -33.900000, 18
+    receiver2.raw Window 43200.00 to 43260.00 s: 2 fixes, -33.900000, 18
+    >>> sorted((u.worker, u.n_frames) for u in utilizations)
+    [(0, 12), (1, 6)]
+
+    :param ports: The ports (or, with open_port=open_file, the recordings) to read.
+
+    :param make_processor: Picklable callable that makes the processor of a port in the worker, given the port. A
+    processor has a process method, which takes a message, and a flush method, which is called at the end. Both return
+    None or a list of small, picklable results.
+
+    :param n_workers: Number of worker processes.
+
+    :param baudrates: dict mapping ports to their baud rates. By default, common.baudrate.
+
+    :param ring_size: Bytes in the ring of each port. A power of two. Frames that do not fit are dropped (and counted).
+
+    :param report_interval: Seconds between the Utilization reports of each worker.
+
+    :param on_result: Called with (port, result) for each result of a processor.
+
+    :param on_utilization: Called with each Utilization report of a worker while it runs.
+
+    :param open_port: Picklable callable that opens a port in the reader process, given the port and baud rate.
+
+    :param replay: Whether the ports are recordings (see open_file). Then readers wait when a ring is full, and stop at
+    the end of the recording (their first timeout). Otherwise, everything runs until KeyboardInterrupt.
+
+    :return: The Utilization of each worker over the whole run.
+    """
+    from common import baudrate as default_baudrate
+
+    ports = list(ports)
+    baudrates = baudrates or {}
+    n_workers = max(1, min(n_workers, len(ports)))
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    stop = context.Event()
+    task_queues = [context.Queue() for _ in range(n_workers)]
+    rings = [FrameRing(size=ring_size, create=True) for _ in ports]
+    readers = []
+    workers = []
+    totals = []
+    try:
+        for worker, tasks in enumerate(task_queues):
+            ring_names = {i: ring.name for i, ring in enumerate(rings) if i % n_workers == worker}
+            workers.append(context.Process(
+                target=work, name='venus6-worker-{}'.format(worker),
+                args=(worker, ports, ring_names, tasks, results, make_processor, report_interval)))
+        for i, port in enumerate(ports):
+            readers.append(context.Process(
+                target=read_port, name='venus6-reader-{}'.format(i),
+                args=(i, port, baudrates.get(port, default_baudrate), rings[i].name, task_queues[i % n_workers],
+                      results, stop, open_port, replay)))
+        for process in workers + readers:
+            process.start()
+
+        n_workers_done = 0
+        stopping = False
+        while n_workers_done < len(workers):
+            try:
+                if not stopping and all(process.exitcode is not None for process in readers):
+                    # Only now are all their tasks in the queues, so the end marks come last.
+                    stopping = True
+                    for tasks in task_queues:
+                        tasks.put(None)
+                try:
+                    record = results.get(timeout=0.2)
+                except queue.Empty:
+                    if not stopping and all(process.exitcode is not None for process in workers):
+                        raise RuntimeError("All workers died.")
+                    continue
+                kind = record[0]
+                if kind == RESULT:
+                    if on_result is not None:
+                        on_result(record[1], record[2])
+                elif kind == UTILIZATION:
+                    utilization, final = record[1:]
+                    if final:
+                        totals.append(utilization)
+                    elif on_utilization is not None:
+                        on_utilization(utilization)
+                elif kind == READER_TOTALS:
+                    port, n_frames, n_dropped, n_invalid = record[1:]
+                    logger.info("%s: %d frames, %d dropped (ring full), %d invalid", port, n_frames, n_dropped,
+                                n_invalid)
+                elif kind == WORKER_DONE:
+                    n_workers_done += 1
+            except KeyboardInterrupt:
+                stop.set()
+    finally:
+        stop.set()
+        for process in readers + workers:
+            process.join(timeout=5)
+            if process.exitcode is None:
+                process.terminate()
+        for ring in rings:
+            ring.close(unlink=True)
+    return totals
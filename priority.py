@@ -0,0 +1,119 @@
+import collections
+import queue
+import threading
+import time
+
+from messages import NmeaMessage
+
+# Lower is more important.
+CONTROL = 0  # ACK, NACK and responses to queries
+NAVIGATION = 1  # Other binary messages
+NMEA = 2
+
+priority_names = {CONTROL: 'control', NAVIGATION: 'navigation', NMEA: 'NMEA'}
+
+
+def classify(msg):
+    """
+    >>> from output_messages import OutputMessage
+    >>> classify(OutputMessage(bytes.fromhex('a0a100028302810d0a')).interpret())
+    0
+    >>> classify(OutputMessage(bytes.fromhex('a0a10001a8a80d0a')))
+    1
+    >>> classify(NmeaMessage(b'$GPGGA,1*00\\r\\n'))
+    2
+    """
+    from output_messages import output_message_types
+
+    if type(msg) is NmeaMessage:
+        return NMEA
+    if msg.get_payload()[0] in output_message_types:
+        return CONTROL
+    return NAVIGATION
+
+
+class PriorityBuffer:
+    """
+    A bounded buffer of messages that hands out the most important ones first, and never blocks the producer. When
+    it is full, it sheds the oldest message of the lowest priority that it holds to make room for a more important
+    one. A new message that is not more important than anything it holds is shed itself. Shed messages are counted in
+    n_shed.
+
+    >>> from output_messages import OutputMessage
+    >>> buffer = PriorityBuffer(maxsize=2)
+    >>> buffer.put(NmeaMessage(b'$GPGGA,1*00\\r\\n'))
+    >>> buffer.put(NmeaMessage(b'$GPGGA,2*00\\r\\n'))
+    >>> buffer.put(OutputMessage(bytes.fromhex('a0a100028302810d0a')).interpret())
+    >>> print(buffer.get())
+    GPS acknowleges 'Query software version' (0x02)
+    >>> print(buffer.get())
+    b'$GPGGA,2*00\\r\\n'
+    >>> buffer.n_shed
+    {0: 0, 1: 0, 2: 1}
+    >>> buffer = PriorityBuffer(maxsize=1)
+    >>> buffer.put(OutputMessage(bytes.fromhex('a0a100028302810d0a')).interpret())
+    >>> buffer.put(NmeaMessage(b'$GPGGA,1*00\\r\\n'))
+    >>> print(buffer.get())
+    GPS acknowleges 'Query software version' (0x02)
+    >>> buffer.n_shed
+    {0: 0, 1: 0, 2: 1}
+    """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.n_shed = {priority: 0 for priority in priority_names}
+        self._queues = {priority: collections.deque() for priority in sorted(priority_names)}
+        self._size = 0
+        self._not_empty = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def put(self, msg):
+        priority = classify(msg)
+        with self._not_empty:
+            if self._size >= self.maxsize:
+                lowest = max((p for p, q in self._queues.items() if q), default=CONTROL)
+                if priority >= lowest:
+                    self.n_shed[priority] += 1
+                    return
+                self._shed(lowest)
+            self._queues[priority].append(msg)
+            self._size += 1
+            self._not_empty.notify()
+
+    def put_nowait(self, msg):
+        self.put(msg)
+
+    def get(self, timeout=None):
+        """
+        :raise queue.Empty: If no message arrives within the timeout.
+        """
+        with self._not_empty:
+            if timeout is None:
+                while not self._size:
+                    self._not_empty.wait()
+            else:
+                deadline = time.monotonic() + timeout
+                while not self._size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise queue.Empty
+                    self._not_empty.wait(remaining)
+            for q in self._queues.values():
+                if q:
+                    self._size -= 1
+                    return q.popleft()
+
+    def get_nowait(self):
+        with self._not_empty:
+            for q in self._queues.values():
+                if q:
+                    self._size -= 1
+                    return q.popleft()
+        raise queue.Empty
+
+    def _shed(self, priority):
+        self._queues[priority].popleft()
+        self._size -= 1
+        self.n_shed[priority] += 1
@@ -0,0 +1,95 @@
+import itertools
+import signal
+
+# The functions that the summary always shows, as a regular expression for pstats.
+hot_functions = r'read_lines|interpret_messages|decode|frame_error|fields\.py.*__init__'
+
+
+def add_arguments(parser):
+    """
+    Add the profiling options to an argparse.ArgumentParser.
+
+    >>> import argparse
+    >>> parser = argparse.ArgumentParser()
+    >>> add_arguments(parser)
+    >>> args = parser.parse_args(['--profile', 'both', '--profile-duration', '10'])
+    >>> args.profile, args.profile_output, args.profile_duration, args.profile_frames
+    ('both', 'venus6.prof', 10.0, None)
+    """
+    group = parser.add_argument_group('profiling')
+    group.add_argument('--profile', choices=['cpu', 'memory', 'both'],
+                       help="Run under cProfile (cpu), tracemalloc (memory) or both.")
+    group.add_argument('--profile-output', default='venus6.prof', metavar='PATH',
+                       help="Where to write the cProfile stats. The tracemalloc snapshot goes to PATH.tracemalloc.")
+    group.add_argument('--profile-duration', type=float, metavar='SECONDS',
+                       help="Stop after this many seconds.")
+    group.add_argument('--profile-frames', type=int, metavar='N',
+                       help="Stop after this many messages (only where the script reads a stream).")
+
+
+class ProfileTimeUp(Exception):
+    pass
+
+
+def _time_up(signum, frame):
+    raise ProfileTimeUp()
+
+
+def limit_frames(messages, args):
+    """
+    Stop a stream of messages after --profile-frames messages, if profiling.
+    """
+    if args.profile and args.profile_frames is not None:
+        return itertools.islice(messages, args.profile_frames)
+    return messages
+
+
+def run(main, args):
+    """
+    Call main(), under the profilers that args ask for. Afterwards, write the stats and print a summary of the hot
+    functions and the top allocation sites.
+    """
+    if not args.profile:
+        return main()
+
+    import cProfile
+    import pstats
+    import tracemalloc
+
+    cpu = args.profile in ('cpu', 'both')
+    memory = args.profile in ('memory', 'both')
+    profiler = cProfile.Profile() if cpu else None
+
+    if args.profile_duration is not None:
+        signal.signal(signal.SIGALRM, _time_up)
+        signal.setitimer(signal.ITIMER_REAL, args.profile_duration)
+    if memory:
+        tracemalloc.start(10)
+    if cpu:
+        profiler.enable()
+    try:
+        main()
+    except (ProfileTimeUp, KeyboardInterrupt):
+        pass
+    finally:
+        if cpu:
+            profiler.disable()
+        if args.profile_duration is not None:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+        snapshot = tracemalloc.take_snapshot() if memory else None
+        if memory:
+            tracemalloc.stop()
+
+    if cpu:
+        profiler.dump_stats(args.profile_output)
+        print("CPU profile written to {}".format(args.profile_output))
+        stats = pstats.Stats(profiler).strip_dirs()
+        stats.sort_stats('tottime').print_stats(10)
+        stats.sort_stats('cumulative').print_stats(hot_functions)
+    if memory:
+        path = "{}.tracemalloc".format(args.profile_output)
+        snapshot.dump(path)
+        print("Memory snapshot written to {}".format(path))
+        print("Top allocation sites:")
+        for stat in snapshot.statistics('lineno')[:10]:
+            print("  {}".format(stat))
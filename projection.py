@@ -0,0 +1,207 @@
+import time
+
+import numpy as np
+
+from datums import datum_reference_list
+from geodesy import chunked, default_chunk_size
+
+wgs84_datum = datum_reference_list[0]
+
+utm_scale_factor = 0.9996
+utm_false_easting = 500000.
+utm_false_northing_south = 10000000.
+
+
+class KruegerCoefficients:
+    """
+    The coefficients of Krüger's series for the transverse Mercator projection, to sixth order in the third flattening
+    n, as given by Karney (2011). Accurate to a few nanometres within the UTM zones.
+    """
+
+    def __init__(self, ellipsoid):
+        f = ellipsoid.flattening
+        n = f / (2 - f)
+        self.eccentricity = np.sqrt(ellipsoid.eccentricity_squared)
+        # Radius of the rectifying sphere.
+        self.rectifying_radius = ellipsoid.semi_major_axis / (1 + n) * (1 + n ** 2 / 4 + n ** 4 / 64 + n ** 6 / 256)
+        self.alpha = (
+            n / 2 - 2 * n ** 2 / 3 + 5 * n ** 3 / 16 + 41 * n ** 4 / 180 - 127 * n ** 5 / 288
+            + 7891 * n ** 6 / 37800,
+            13 * n ** 2 / 48 - 3 * n ** 3 / 5 + 557 * n ** 4 / 1440 + 281 * n ** 5 / 630 - 1983433 * n ** 6 / 1935360,
+            61 * n ** 3 / 240 - 103 * n ** 4 / 140 + 15061 * n ** 5 / 26880 + 167603 * n ** 6 / 181440,
+            49561 * n ** 4 / 161280 - 179 * n ** 5 / 168 + 6601661 * n ** 6 / 7257600,
+            34729 * n ** 5 / 80640 - 3418889 * n ** 6 / 1995840,
+            212378941 * n ** 6 / 319334400,
+        )
+
+
+# Ellipsoid index: KruegerCoefficients
+_krueger_coefficients = {}
+
+
+def krueger_coefficients(ellipsoid):
+    """
+    The coefficients are computed once per ellipsoid, on first use.
+
+    >>> krueger_coefficients(wgs84_datum.ellipsoid) is krueger_coefficients(wgs84_datum.ellipsoid)
+    True
+    """
+    coefficients = _krueger_coefficients.get(ellipsoid.index)
+    if coefficients is None:
+        coefficients = _krueger_coefficients[ellipsoid.index] = KruegerCoefficients(ellipsoid)
+    return coefficients
+
+
+def utm_zones(latitudes, longitudes):
+    """
+    The UTM zone of each point, including the exceptions for Norway and Svalbard.
+
+    >>> utm_zones([-33.9, 60., 78.], [18.4, 5., 10.])
+    array([34, 32, 33])
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    zones = (np.floor((longitudes + 180) / 6) % 60).astype(int) + 1
+    zones = np.where((latitudes >= 56) & (latitudes < 64) & (longitudes >= 3) & (longitudes < 12), 32, zones)
+    svalbard = latitudes >= 72
+    for west, east, zone in [(0, 9, 31), (9, 21, 33), (21, 33, 35), (33, 42, 37)]:
+        zones = np.where(svalbard & (longitudes >= west) & (longitudes < east), zone, zones)
+    return zones
+
+
+def to_transverse_mercator(latitudes, longitudes, central_meridians, ellipsoid):
+    """
+    :return: (x, y) in m on the projection with scale factor 1, relative to the central meridian and the equator.
+    """
+    k = krueger_coefficients(ellipsoid)
+    phi = np.radians(latitudes)
+    d_lambda = np.radians(np.subtract(longitudes, central_meridians))
+    sin_phi = np.sin(phi)
+    t = np.sinh(np.arctanh(sin_phi) - k.eccentricity * np.arctanh(k.eccentricity * sin_phi))
+    xi_prime = np.arctan2(t, np.cos(d_lambda))
+    eta_prime = np.arctanh(np.sin(d_lambda) / np.sqrt(1 + t * t))
+    # zeta = zeta' + sum(alpha_j sin(2 j zeta')) with zeta' = xi' + i eta', summed with Clenshaw's recurrence, so that
+    # only one complex sine and cosine are needed.
+    two_zeta = 2 * (xi_prime + 1j * eta_prime)
+    two_cos = 2 * np.cos(two_zeta)
+    y1 = np.zeros_like(two_zeta)
+    y2 = np.zeros_like(two_zeta)
+    for alpha in reversed(k.alpha):
+        y1, y2 = alpha + two_cos * y1 - y2, y1
+    zeta = two_zeta / 2 + np.sin(two_zeta) * y1
+    return k.rectifying_radius * zeta.imag, k.rectifying_radius * zeta.real
+
+
+def to_utm(latitudes, longitudes, datum=wgs84_datum, zone=None, chunk_size=default_chunk_size):
+    """
+    Project points to UTM.
+
+    >>> easting, northing, zones = to_utm([-33.9249, 48.1173], [18.4241, 11.516667])
+    >>> easting.round(3), northing.round(3), zones
+    (array([261881.599, 687299.6  ]), array([6243182.355, 5332401.246]), array([34, 32]))
+
+    :param latitudes: Array of latitudes in degrees, in the given datum.
+
+    :param longitudes: Array of longitudes in degrees, in the given datum.
+
+    :param datums.Datum datum: One of datums.datum_reference_list. The projection uses its ellipsoid.
+
+    :param zone: Project all points into this zone, e.g. to keep a map that crosses a zone boundary in one grid. By
+    default, each point goes into its own zone.
+
+    :return: (eastings in m, northings in m, zones). Points south of the equator have the false northing of the southern
+    hemisphere.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    ellipsoid = datum.ellipsoid
+
+    def project(lat, lon):
+        zones = utm_zones(lat, lon) if zone is None else np.full(lat.shape, zone)
+        x, y = to_transverse_mercator(lat, lon, zones * 6 - 183, ellipsoid)
+        easting = utm_false_easting + utm_scale_factor * x
+        northing = utm_scale_factor * y + np.where(lat < 0, utm_false_northing_south, 0.)
+        return easting, northing, zones
+
+    return chunked(project, [latitudes, longitudes], chunk_size=chunk_size)
+
+
+def to_ecef(latitudes, longitudes, altitudes, ellipsoid):
+    """
+    :return: (x, y, z) in m, earth-centred and earth-fixed.
+    """
+    phi = np.radians(latitudes)
+    lam = np.radians(longitudes)
+    sin_phi = np.sin(phi)
+    cos_phi = np.cos(phi)
+    e2 = ellipsoid.eccentricity_squared
+    radius = ellipsoid.semi_major_axis / np.sqrt(1 - e2 * sin_phi * sin_phi)
+    return (
+        (radius + altitudes) * cos_phi * np.cos(lam),
+        (radius + altitudes) * cos_phi * np.sin(lam),
+        (radius * (1 - e2) + altitudes) * sin_phi,
+    )
+
+
+def to_enu(latitudes, longitudes, altitudes, reference, datum=wgs84_datum, chunk_size=default_chunk_size):
+    """
+    Convert points to a local east, north, up frame.
+
+    >>> east, north, up = to_enu([0., 0.001], [0.001, 0.], [0., 0.], reference=(0., 0., 0.))
+    >>> east.round(3), north.round(3), up.round(3)
+    (array([111.319,   0.   ]), array([  0.   , 110.574]), array([-0.001, -0.001]))
+
+    :param latitudes: Array of latitudes in degrees, in the given datum.
+
+    :param longitudes: Array of longitudes in degrees, in the given datum.
+
+    :param altitudes: Array of heights above the ellipsoid in m.
+
+    :param reference: (latitude, longitude, altitude) of the origin of the frame.
+
+    :param datums.Datum datum: One of datums.datum_reference_list.
+
+    :return: (east, north, up) in m.
+    """
+    latitudes = np.asarray(latitudes, dtype=float)
+    longitudes = np.asarray(longitudes, dtype=float)
+    altitudes = np.broadcast_to(np.asarray(altitudes, dtype=float), latitudes.shape)
+    ellipsoid = datum.ellipsoid
+    lat0, lon0, h0 = reference
+    x0, y0, z0 = to_ecef(lat0, lon0, h0, ellipsoid)
+    sin_phi0 = np.sin(np.radians(lat0))
+    cos_phi0 = np.cos(np.radians(lat0))
+    sin_lambda0 = np.sin(np.radians(lon0))
+    cos_lambda0 = np.cos(np.radians(lon0))
+
+    def convert(lat, lon, h):
+        x, y, z = to_ecef(lat, lon, h, ellipsoid)
+        dx = x - x0
+        dy = y - y0
+        dz = z - z0
+        east = -sin_lambda0 * dx + cos_lambda0 * dy
+        north = -sin_phi0 * cos_lambda0 * dx - sin_phi0 * sin_lambda0 * dy + cos_phi0 * dz
+        up = cos_phi0 * cos_lambda0 * dx + cos_phi0 * sin_lambda0 * dy + sin_phi0 * dz
+        return east, north, up
+
+    return chunked(convert, [latitudes, longitudes, altitudes], chunk_size=chunk_size)
+
+
+def benchmark(n_points=10 ** 7):
+    """
+    Measure the time that to_utm and to_enu take on random points around Cape Town.
+
+    :return: dict mapping each function name to nanoseconds per point.
+    """
+    rng = np.random.default_rng(0)
+    latitudes = rng.uniform(-35, -33, n_points)
+    longitudes = rng.uniform(18, 20, n_points)
+    altitudes = rng.uniform(0, 1000, n_points)
+    results = {}
+    t_start = time.perf_counter()
+    to_utm(latitudes, longitudes)
+    results['to_utm'] = (time.perf_counter() - t_start) / n_points * 1e9
+    t_start = time.perf_counter()
+    to_enu(latitudes, longitudes, altitudes, reference=(-34., 19., 0.))
+    results['to_enu'] = (time.perf_counter() - t_start) / n_points * 1e9
+    return results
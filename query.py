@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 
+import argparse
 import serial
 import input_messages
+import profiling
 import time
 from common import port, baudrate
 
+parser = argparse.ArgumentParser(description="Send all query messages to the GPS unit. Use watch.py to see the answers.")
+profiling.add_arguments(parser)
+
 msgs = [
     input_messages.QueryPositionPinningMessage(),
     input_messages.QueryPositionUpdateRateMessage(),
@@ -16,11 +21,18 @@ msgs = [
     input_messages.QueryWaasStatusMessage(),
 ]
 
-with serial.Serial(
-    port=port,
-    baudrate=baudrate
-) as ser:
-    for msg in msgs:
-        print(msg)
-        ser.write(bytes(msg))
-        time.sleep(1)
+
+def main():
+    with serial.Serial(
+        port=port,
+        baudrate=baudrate
+    ) as ser:
+        for msg in msgs:
+            print(msg)
+            ser.write(bytes(msg))
+            time.sleep(1)
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(main, args)
@@ -0,0 +1,173 @@
+import time
+
+import input_messages
+import output_messages
+from writer import BurstWriter
+
+
+class Setting:
+
+    def __init__(self, name, query_message_type, response_type, get_value, make_configure_message):
+        self.name = name
+        self.query_message_type = query_message_type
+        self.response_type = response_type
+        self.get_value = get_value
+        self.make_configure_message = make_configure_message
+
+
+settings = {
+    'datum': Setting(
+        'datum',
+        input_messages.QueryDatumMessage,
+        output_messages.GpsDatumMessage,
+        lambda response: response.values[0].value,
+        lambda value, permanent: input_messages.ConfigureDatumMessage(datum_index=value, permanent=permanent),
+    ),
+    'update_rate': Setting(
+        'update_rate',
+        input_messages.QueryPositionUpdateRateMessage,
+        output_messages.PositionUpdateRateMessage,
+        lambda response: response.values[0].value,
+        lambda value, permanent: input_messages.ConfigurePositionUpdateRateMessage(rate=value, permanent=permanent),
+    ),
+    'position_pinning': Setting(
+        'position_pinning',
+        input_messages.QueryPositionPinningMessage,
+        output_messages.GpsPositionPinningStatusMessage,
+        lambda response: bool(response.values[0].value),
+        lambda value, permanent: input_messages.ConfigurePositionPinningMessage(enable_position_pinning=value),
+    ),
+    'pps_mode': Setting(
+        'pps_mode',
+        input_messages.QueryPpsModeMessage,
+        output_messages.GpsPpsModeMessage,
+        lambda response: response.values[0].value,
+        lambda value, permanent: input_messages.ConfigurePpsModeMessage(mode=value, permanent=permanent),
+    ),
+}
+
+
+def read_current(writer, names, timeout=2.0, registry=None):
+    """
+    Query the current values of some settings.
+
+    :param BurstWriter writer: Used to send the queries and to read the responses.
+
+    :param names: Keys of settings.
+
+    :param timeout: Seconds to wait for the responses after the last query was acknowledged.
+
+    :param registry: dict of the Settings that names refer to. By default, settings. Only their query_message_type,
+    response_type and get_value are used, so read-only values can be queried too.
+
+    :return: dict mapping each name to its current value.
+    """
+    if registry is None:
+        registry = settings
+    response_types = {registry[name].response_type: name for name in names}
+    current = {}
+
+    on_message = writer.on_message
+
+    def collect(m):
+        if type(m) in response_types:
+            current[response_types[type(m)]] = registry[response_types[type(m)]].get_value(m)
+        if on_message is not None:
+            on_message(m)
+
+    writer.on_message = collect
+    try:
+        for name in names:
+            writer.queue(registry[name].query_message_type())
+        writer.flush()
+        deadline = time.monotonic() + timeout
+        while len(current) < len(response_types) and time.monotonic() < deadline:
+            try:
+                m = next(writer.messages)
+            except StopIteration:
+                break
+            if m is not None:
+                collect(m)
+    finally:
+        writer.on_message = on_message
+
+    missing = set(names) - set(current)
+    if missing:
+        raise TimeoutError("No response for {}.".format(", ".join(sorted(missing))))
+    return current
+
+
+def diff(desired, current):
+    """
+    >>> diff({'datum': 0, 'update_rate': 20}, {'datum': 0, 'update_rate': 1})
+    {'update_rate': (1, 20)}
+
+    :return: dict mapping the name of each setting that differs to a (current, desired) tuple.
+    """
+    return {
+        name: (current[name], value)
+        for name, value in desired.items()
+        if current[name] != value
+    }
+
+
+def reconcile(ser, desired, permanent=True, messages=None, on_message=None, timeout=2.0):
+    """
+    Bring the GPS unit to the desired configuration, sending only the Configure messages for settings that differ.
+    Settings that already match are not written, which saves an ACK round trip and (if permanent) a FLASH write each.
+
+    >>> import io
+    >>> class FakeSerial(io.BytesIO):
+    ...     def write(self, b):
+    ...         print(b.hex())
+    >>> ser = FakeSerial(bytes.fromhex(
+    ...     'a0a10002832dae0d0a'  # ACK query datum
+    ...     'a0a10003ae0000ae0d0a'  # WGS-84
+    ...     'a0a100028310930d0a'  # ACK query position update rate
+    ...     'a0a100028614920d0a'  # 20 Hz
+    ...     'a0a10002830e8d0d0a'  # ACK configure position update rate
+    ... ))
+    >>> reconcile(ser, {'datum': 0, 'update_rate': 1}, permanent=False)
+    a0a100012d2d0d0a
+    a0a1000110100d0a
+    a0a100030e01000f0d0a
+    {'update_rate': (20, 1)}
+
+    :param Serial ser: The serial interface.
+
+    :param desired: dict mapping keys of settings to the desired values, e.g. {'datum': 0, 'update_rate': 20,
+    'position_pinning': False, 'pps_mode': 1}.
+
+    :param permanent: Whether to write the changes to FLASH too.
+
+    :param messages: Iterable of interpreted messages from the GPS unit. By default, they are read from ser.
+
+    :param on_message: Called with every message that is read, e.g. print.
+
+    :param timeout: Seconds to wait for the responses to the queries.
+
+    :return: dict mapping the name of each setting that was changed to a (previous, new) tuple.
+    """
+    for name in desired:
+        if name not in settings:
+            raise ValueError("Unknown setting '{}'. Known settings are: {}".format(name, ", ".join(settings)))
+
+    writer = BurstWriter(ser, messages=messages, on_message=on_message)
+    changes = diff(desired, read_current(writer, list(desired), timeout=timeout))
+    for name in changes:
+        writer.queue(settings[name].make_configure_message(desired[name], permanent))
+    writer.flush()
+    return changes
+
+
+def print_changes(changes):
+    """
+    >>> print_changes({'update_rate': (20, 1)})
+    Changed update_rate from 20 to 1.
+    >>> print_changes({})
+    Nothing to change.
+    """
+    if not changes:
+        print("Nothing to change.")
+    for name, (previous, new) in changes.items():
+        print("Changed {} from {} to {}.".format(name, previous, new))
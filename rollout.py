@@ -0,0 +1,232 @@
+import concurrent.futures
+import time
+
+from common import baudrate as default_baudrate
+from diagnostics import logger
+from fields import BaudRateField
+from writer import BurstWriter
+
+OK = 'ok'
+FAILED = 'failed'
+
+
+class DeviceResult:
+    """
+    What the rollout did to one receiver.
+    """
+
+    def __init__(self, port):
+        self.port = port
+        self.status = FAILED
+        self.detected_baudrate = None
+        self.baudrate = None
+        self.changes = {}  # name: (previous, new), like reconcile.reconcile returns
+        self.attempts = 0
+        self.seconds = 0.
+        self.error = None
+
+    def __str__(self):
+        return "{}: {}".format(self.port, self.status if self.error is None else self.error)
+
+
+def detect_baudrate(ser, candidates, ack_timeout=1.0):
+    """
+    Find the baud rate of the receiver by sending QuerySoftwareVersionMessage at each candidate rate until it is
+    acknowledged. Unlike Client.detect_baudrate, this prints nothing, so that many ports can be probed at once.
+
+    :param Serial ser: The open serial interface. Its baud rate is left at the detected rate.
+
+    :param candidates: Baud rates to try, in this order.
+
+    :return: The detected baud rate.
+
+    :raise RuntimeError: If no candidate works.
+    """
+    from input_messages import QuerySoftwareVersionMessage
+
+    for baudrate in candidates:
+        ser.baudrate = baudrate
+        if hasattr(ser, 'reset_input_buffer'):
+            ser.reset_input_buffer()
+        writer = BurstWriter(ser, ack_timeout=ack_timeout, retries=0)
+        writer.queue(QuerySoftwareVersionMessage(1))
+        try:
+            writer.flush()
+            return baudrate
+        except TimeoutError:
+            continue
+    raise RuntimeError("No ACK at any of {} bps.".format(", ".join(str(b) for b in candidates)))
+
+
+def baudrate_candidates(last_baudrate=None, target_baudrate=None):
+    """
+    The baud rates to try, most likely first: the last known one, the target of the rollout, the default, and the
+    rest.
+
+    >>> baudrate_candidates(last_baudrate=9600, target_baudrate=38400)
+    [9600, 38400, 115200, 4800, 19200, 57600]
+    """
+    candidates = []
+    for baudrate in [last_baudrate, target_baudrate, default_baudrate] + list(BaudRateField.allowed_values.values()):
+        if baudrate is not None and baudrate not in candidates:
+            candidates.append(baudrate)
+    return candidates
+
+
+def check_bandwidth(config):
+    """
+    Make sure that a baud rate and an update rate that are set together fit, like bandwidth.ensure_bandwidth does when
+    only the update rate is set.
+
+    >>> check_bandwidth({'baudrate': 115200, 'update_rate': 20})
+    >>> check_bandwidth({'baudrate': 9600, 'update_rate': 20})
+    Traceback (most recent call last):
+    ...
+    ValueError: 9600 bps is too slow for 20 Hz. Use at least 115200 bps.
+
+    :raise ValueError: If the baud rate is too low for the update rate.
+    """
+    from bandwidth import minimum_baudrate
+
+    if config.get('baudrate') is None or config.get('update_rate') is None:
+        return
+    needed = minimum_baudrate(config['update_rate'])
+    if config['baudrate'] < needed:
+        raise ValueError("{} bps is too slow for {} Hz. Use at least {} bps.".format(
+            config['baudrate'], config['update_rate'], needed))
+
+
+def configure_device(ser, config, permanent=True, last_baudrate=None, timeout=2.0):
+    """
+    Apply a configuration to one receiver. Every step waits for the ACK of the receiver.
+
+    :param config: dict with an optional 'baudrate', and any settings of reconcile.settings.
+
+    :return: (detected baud rate, baud rate afterwards, changes of the settings)
+    """
+    from bandwidth import ensure_bandwidth
+    from input_messages import ConfigureSerialPortMessage
+    from reconcile import reconcile
+
+    check_bandwidth(config)
+    target_baudrate = config.get('baudrate')
+    desired = {name: value for name, value in config.items() if name != 'baudrate'}
+
+    detected = detect_baudrate(ser, baudrate_candidates(last_baudrate, target_baudrate), ack_timeout=min(timeout, 1.0))
+    baudrate = detected
+    if target_baudrate is not None and target_baudrate != detected:
+        writer = BurstWriter(ser, ack_timeout=timeout)
+        writer.queue(ConfigureSerialPortMessage(rate=target_baudrate, permanent=permanent))
+        writer.flush()
+        ser.baudrate = baudrate = target_baudrate
+    elif target_baudrate is None and 'update_rate' in desired:
+        baudrate = ensure_bandwidth(ser, desired['update_rate'], current_baudrate=detected, permanent=permanent)
+
+    changes = reconcile(ser, desired, permanent=permanent, timeout=timeout) if desired else {}
+    if baudrate != detected:
+        changes = dict(baudrate=(detected, baudrate), **changes)
+    return detected, baudrate, changes
+
+
+def rollout(sers, config, concurrency=8, retries=2, permanent=True, last_baudrates=None, timeout=2.0):
+    """
+    Configure many receivers at once, at most concurrency at a time. A receiver that fails is tried again (from baud
+    rate detection on) up to retries times.
+
+    >>> import io
+    >>> class FakeSerial(io.BytesIO):
+    ...     baudrate = None
+    ...     def write(self, b):
+    ...         pass
+    >>> sers = {
+    ...     '/dev/ttyUSB0': FakeSerial(bytes.fromhex(
+    ...         'a0a100028302810d0a'  # ACK query software version
+    ...         'a0a100028305860d0a'  # ACK configure serial port
+    ...         'a0a10002832dae0d0a'  # ACK query datum
+    ...         'a0a10003ae0000ae0d0a'  # WGS-84
+    ...     )),
+    ...     '/dev/ttyUSB1': FakeSerial(),  # Not connected
+    ... }
+    >>> results = rollout(sers, {'baudrate': 115200, 'datum': 0}, retries=0, last_baudrates={'/dev/ttyUSB0': 9600},
+    ...                   timeout=0.1)
+    >>> [(r.port, r.status, r.detected_baudrate, r.baudrate, r.changes) for r in results]
+    [('/dev/ttyUSB0', 'ok', 9600, 115200, {'baudrate': (9600, 115200)}), ('/dev/ttyUSB1', 'failed', None, None, {})]
+
+    :param sers: dict mapping the port of each receiver to its open serial interface.
+
+    :param config: dict with an optional 'baudrate', and any settings of reconcile.settings, e.g. {'baudrate': 115200,
+    'datum': 0, 'update_rate': 20, 'position_pinning': False}.
+
+    :param concurrency: Maximum number of receivers to configure at the same time.
+
+    :param retries: Number of times to try a failed receiver again.
+
+    :param permanent: Whether to write the changes to FLASH too.
+
+    :param last_baudrates: dict mapping ports to the baud rate they last had, to try first.
+
+    :param timeout: Seconds to wait for each ACK or response.
+
+    :return: A DeviceResult for each port, in the order of sers.
+
+    :raise ValueError: If the baud rate of config is too low for its update rate (see check_bandwidth).
+    """
+    check_bandwidth(config)
+    if last_baudrates is None:
+        last_baudrates = {}
+
+    def configure(port):
+        result = DeviceResult(port)
+        t_start = time.monotonic()
+        while result.attempts <= retries:
+            result.attempts += 1
+            try:
+                detected, baudrate, changes = configure_device(
+                    sers[port], config, permanent=permanent, last_baudrate=last_baudrates.get(port), timeout=timeout)
+            except Exception as e:
+                result.error = "{}: {}".format(type(e).__name__, e)
+                logger.warning("%s: attempt %d of %d failed: %s", port, result.attempts, retries + 1, result.error)
+                continue
+            result.status = OK
+            result.error = None
+            result.detected_baudrate = detected
+            result.baudrate = baudrate
+            result.changes = changes
+            logger.info("%s: done", port)
+            break
+        result.seconds = time.monotonic() - t_start
+        return result
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='venus6-rollout') as pool:
+        return list(pool.map(configure, sers))
+
+
+def print_results(results):
+    """
+    >>> result = DeviceResult('/dev/ttyUSB0')
+    >>> result.status, result.detected_baudrate, result.baudrate, result.attempts = 'ok', 9600, 115200, 1
+    >>> result.changes = {'baudrate': (9600, 115200)}
+    >>> print_results([result])
+    Port          Status  Baud rate      Attempts  Time   Changes / error
+    /dev/ttyUSB0  ok      9600 > 115200  1         0.0 s  baudrate 9600 > 115200
+    1 of 1 receivers configured.
+    """
+    rows = [('Port', 'Status', 'Baud rate', 'Attempts', 'Time', 'Changes / error')]
+    for r in results:
+        if r.detected_baudrate is None:
+            baudrate = '?'
+        elif r.baudrate == r.detected_baudrate:
+            baudrate = str(r.baudrate)
+        else:
+            baudrate = "{} > {}".format(r.detected_baudrate, r.baudrate)
+        if r.error is not None:
+            details = r.error
+        elif r.changes:
+            details = ", ".join("{} {} > {}".format(name, previous, new) for name, (previous, new) in r.changes.items())
+        else:
+            details = 'nothing to change'
+        rows.append((r.port, r.status, baudrate, str(r.attempts), "{:.1f} s".format(r.seconds), details))
+    widths = [max(len(row[i]) for row in rows) + 2 for i in range(len(rows[0]) - 1)]
+    for row in rows:
+        print(''.join(cell.ljust(width) for cell, width in zip(row, widths)) + row[-1])
+    print("{} of {} receivers configured.".format(sum(1 for r in results if r.status == OK), len(results)))
@@ -0,0 +1,236 @@
+import json
+import threading
+import time
+
+from messages import NmeaMessage
+
+TEXT = 'text'
+JSONL = 'jsonl'
+CSV = 'csv'
+RAW = 'raw'
+
+formats = [TEXT, JSONL, CSV, RAW]
+
+
+def _key(name):
+    return name.strip().lower().replace(' ', '_')
+
+
+def _csv_quote(text):
+    return '"' + text.replace('"', '""') + '"'
+
+
+class _Template:
+    """
+    The parts of a line that are the same for every message of one type, built once per type.
+    """
+
+    def __init__(self, msg):
+        msg_type = type(msg)
+        keys = []
+        for v in msg.values:
+            key = _key(v.name)
+            # Keep the keys unique, e.g. for messages with several fields of the same type.
+            while key in keys:
+                key += '_'
+            keys.append(key)
+        self.json_name = ',"message":{}'.format(json.dumps(msg_type.name))
+        self.json_keys = ['"{}":'.format(key) for key in keys]
+        self.csv_name = _csv_quote(msg_type.name)
+
+
+# (message type, number of values): _Template
+_templates = {}
+
+
+class MessageFormatter:
+    """
+    Turns messages into lines for other programs, straight from the values of the fields, without the strings that
+    are made for people.
+
+    JSONL has an object per line, with the arrival time, the port, and the message ID, name and fields of a binary
+    message (field names in snake case), or the NMEA sentence:
+
+    >>> from output_messages import OutputMessage
+    >>> msg = OutputMessage(bytes.fromhex('a0a10004810198766e0d0a')).interpret()
+    >>> nmea = NmeaMessage(b'$GPGGA,1*00\\r\\n')
+    >>> formatter = MessageFormatter(JSONL, port='/dev/ttyUSB0')
+    >>> print(formatter.format(msg, t=1700000000.25).decode(), end='')
+    {"time":1700000000.250,"port":"/dev/ttyUSB0","id":129,"message":"Software CRC","software_type":1,"crc":39030}
+    >>> print(formatter.format(nmea, t=1700000000.25).decode(), end='')
+    {"time":1700000000.250,"port":"/dev/ttyUSB0","nmea":"$GPGGA,1*00"}
+
+    CSV has a row per message: time, port, message ID and name, and the values of the fields in the order of the
+    application note. NMEA sentences have an empty message ID and the name NMEA:
+
+    >>> formatter = MessageFormatter(CSV, port='/dev/ttyUSB0')
+    >>> print(formatter.format(msg, t=1700000000.25).decode(), end='')
+    1700000000.250,"/dev/ttyUSB0",129,"Software CRC",1,39030
+    >>> print(formatter.format(nmea, t=1700000000.25).decode(), end='')
+    1700000000.250,"/dev/ttyUSB0",,"NMEA","$GPGGA,1*00"
+
+    Raw is the frames as they came from the receiver:
+
+    >>> MessageFormatter(RAW).format(msg, t=0).hex()
+    'a0a10004810198766e0d0a'
+
+    Binary messages with an unknown message ID, or of a class that doesn't decode its fields yet, have their payload
+    in hex instead of fields:
+
+    >>> unknown = OutputMessage(bytes.fromhex('a0a10002dc01dd0d0a'))
+    >>> print(MessageFormatter(JSONL).format(unknown, t=0).decode(), end='')
+    {"time":0.000,"port":"","id":220,"message":"","payload":"dc01"}
+    >>> print(MessageFormatter(CSV).format(unknown, t=0).decode(), end='')
+    0.000,"",220,"","dc01"
+    >>> waas = OutputMessage(bytes.fromhex('a0a10002b300b30d0a')).interpret()
+    >>> print(MessageFormatter(JSONL).format(waas, t=0).decode(), end='')
+    {"time":0.000,"port":"","id":179,"message":"gps waas status","payload":"b300"}
+    >>> print(MessageFormatter(CSV).format(waas, t=0).decode(), end='')
+    0.000,"",179,"gps waas status","b300"
+    """
+
+    def __init__(self, output_format, port=''):
+        """
+
+        :param output_format: One of formats.
+
+        :param port: The port that the messages come from, to tell several receivers apart.
+
+        """
+        if output_format not in formats:
+            raise ValueError("Unknown format {}. Use one of {}.".format(output_format, ", ".join(formats)))
+        self.format = {
+            TEXT: self._text,
+            JSONL: self._jsonl,
+            CSV: self._csv,
+            RAW: self._raw,
+        }[output_format]
+        self.text_prefix = "{}: ".format(port) if port else ''
+        self.json_port = json.dumps(port)
+        self.csv_port = _csv_quote(port)
+
+    # Each method takes (message, arrival time as POSIX time) and returns the bytes of the line.
+
+    @staticmethod
+    def _template(msg):
+        key = (type(msg), len(msg.values))
+        template = _templates.get(key)
+        if template is None:
+            template = _templates[key] = _Template(msg)
+        return template
+
+    def _text(self, msg, t):
+        return "{}{}\n".format(self.text_prefix, msg).encode()
+
+    def _jsonl(self, msg, t):
+        if type(msg) is NmeaMessage:
+            return '{{"time":{:.3f},"port":{},"nmea":{}}}\n'.format(
+                t, self.json_port, json.dumps(bytes(msg.nmea_string).rstrip().decode('ascii', 'replace'))).encode()
+        head = '{{"time":{:.3f},"port":{},"id":{}'.format(t, self.json_port, msg.payload[0])
+        if not getattr(msg, 'values', None):
+            # Unknown message IDs, and classes that don't decode their fields yet.
+            return '{},"message":{},"payload":"{}"}}\n'.format(
+                head, json.dumps(type(msg).name), bytes(msg.payload).hex()).encode()
+        template = self._template(msg)
+        parts = [head, template.json_name]
+        for key, v in zip(template.json_keys, msg.values):
+            parts.append(',')
+            parts.append(key)
+            parts.append(str(v.value))
+        parts.append('}\n')
+        return ''.join(parts).encode()
+
+    def _csv(self, msg, t):
+        if type(msg) is NmeaMessage:
+            return '{:.3f},{},,"NMEA",{}\n'.format(
+                t, self.csv_port, _csv_quote(bytes(msg.nmea_string).rstrip().decode('ascii', 'replace'))).encode()
+        parts = ['{:.3f}'.format(t), self.csv_port, str(msg.payload[0])]
+        if not getattr(msg, 'values', None):
+            parts.append(_csv_quote(type(msg).name))
+            parts.append('"{}"'.format(bytes(msg.payload).hex()))
+        else:
+            parts.append(self._template(msg).csv_name)
+            parts.extend(str(v.value) for v in msg.values)
+        return (','.join(parts) + '\n').encode()
+
+    @staticmethod
+    def _raw(msg, t):
+        if type(msg) is NmeaMessage:
+            return bytes(msg.nmea_string)
+        return bytes(msg)
+
+
+class BlockWriter:
+    """
+    Collects lines and writes them in blocks: when max_bytes have piled up, or at the latest max_delay seconds after
+    the first line of a block. One write per block instead of one per line keeps a pipe or file up with many messages
+    per second. Lines of several threads are never interleaved.
+
+    >>> import io
+    >>> stream = io.BytesIO()
+    >>> with BlockWriter(stream, max_bytes=10, max_delay=60) as writer:
+    ...     writer.write(b'12345\\n')
+    ...     stream.getvalue()
+    ...     writer.write(b'67890\\n')
+    ...     stream.getvalue()
+    ...     writer.write(b'abc\\n')
+    b''
+    b'12345\\n67890\\n'
+    >>> stream.getvalue()
+    b'12345\\n67890\\nabc\\n'
+    """
+
+    def __init__(self, stream, max_bytes=1 << 16, max_delay=0.5):
+        """
+
+        :param stream: Binary file-like object, e.g. sys.stdout.buffer.
+
+        :param max_bytes: Write when the block is at least this long.
+
+        :param max_delay: Seconds that a line may wait in the block.
+
+        """
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay
+        self.buffer = bytearray()
+        self.t_first = None
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self._flush_periodically, name='venus6-block-writer', daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def write(self, data):
+        with self.lock:
+            if not self.buffer:
+                self.t_first = time.monotonic()
+            self.buffer += data
+            if len(self.buffer) >= self.max_bytes:
+                self._flush()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def close(self):
+        self.stop.set()
+        self.thread.join()
+        self.flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.stream.write(self.buffer)
+            self.stream.flush()
+            self.buffer = bytearray()
+
+    def _flush_periodically(self):
+        while not self.stop.wait(self.max_delay / 2):
+            with self.lock:
+                if self.buffer and time.monotonic() - self.t_first >= self.max_delay:
+                    self._flush()
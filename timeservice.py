@@ -0,0 +1,261 @@
+import ctypes
+import math
+import struct
+import time
+
+from epoch import split_sentence, to_seconds
+
+# The SHM refclock of ntpd and chrony looks for a SysV shared memory segment with key NTP_SHM_KEY + unit.
+NTP_SHM_KEY = 0x4e545030
+
+IPC_CREAT = 0o1000
+IPC_RMID = 0
+
+# struct shmTime from ntpd/refclock_shm.c, with native alignment. The trailing 0q pads the size like the C compiler.
+shm_time_format = '@iiqiqiiiiiII8i0q'
+shm_time_size = struct.calcsize(shm_time_format)
+
+# Values of the leap field.
+LEAP_NOWARNING = 0
+LEAP_NOTINSYNC = 3
+
+# Sentences that carry the time of a fix, and the index of the status field and its good values.
+time_sentences = {
+    b'GGA': (6, (b'1', b'2')),
+    b'RMC': (2, (b'A',)),
+}
+
+
+def _libc():
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.shmget.restype = ctypes.c_int
+    libc.shmget.argtypes = [ctypes.c_int, ctypes.c_size_t, ctypes.c_int]
+    libc.shmat.restype = ctypes.c_void_p
+    libc.shmat.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_int]
+    libc.shmdt.argtypes = [ctypes.c_void_p]
+    libc.shmctl.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_void_p]
+    return libc
+
+
+class NtpShm:
+    """
+    The SysV shared memory segment of an NTP SHM refclock, as used by ntpd (driver 28) and chrony (refclock SHM).
+
+    Units 0 and 1 are only accessible by root (mode 0600), others by everyone (mode 0666), like ntpd does it.
+
+    >>> shm = NtpShm(unit=77, key=NTP_SHM_KEY + 0x1000)
+    >>> shm.write(clock_time=1000000000.25, receive_time=1000000000.3125)
+    >>> sample = shm.read()
+    >>> sample['clock_time'], sample['receive_time'], sample['valid'], sample['count']
+    (1000000000.25, 1000000000.3125, 1, 2)
+    >>> shm.close(remove=True)
+    """
+
+    def __init__(self, unit=0, key=None, precision=-10):
+        """
+
+        :param unit: Unit number, as in the ntpd or chrony configuration.
+
+        :param key: SysV IPC key. By default NTP_SHM_KEY + unit.
+
+        :param precision: log2 of the precision of the samples in seconds. -10 is about 1 ms.
+
+        """
+        self.unit = unit
+        self.key = NTP_SHM_KEY + unit if key is None else key
+        self.precision = precision
+        self._libc = _libc()
+        self._id = self._libc.shmget(self.key, shm_time_size, IPC_CREAT | (0o600 if unit < 2 else 0o666))
+        if self._id < 0:
+            raise OSError(ctypes.get_errno(), "shmget failed for key 0x{:08x}".format(self.key))
+        self._address = self._libc.shmat(self._id, None, 0)
+        if self._address in (None, ctypes.c_void_p(-1).value):
+            raise OSError(ctypes.get_errno(), "shmat failed for key 0x{:08x}".format(self.key))
+        self.buffer = memoryview((ctypes.c_char * shm_time_size).from_address(self._address)).cast('B')
+        self._count = struct.unpack_from('@ii', self.buffer)[1]
+
+    def write(self, clock_time, receive_time, leap=LEAP_NOWARNING):
+        """
+        Publish one sample, with the count protocol of mode 1, so that a reader never uses a half written sample.
+
+        :param clock_time: The time according to the GPS, in POSIX seconds.
+
+        :param receive_time: The time according to the system clock when the GPS said so.
+
+        """
+        clock_sec = math.floor(clock_time)
+        clock_nsec = int(round((clock_time - clock_sec) * 1e9))
+        receive_sec = math.floor(receive_time)
+        receive_nsec = int(round((receive_time - receive_sec) * 1e9))
+        self._count += 1
+        struct.pack_into('@ii', self.buffer, 0, 1, self._count)
+        struct.pack_into('@i', self.buffer, struct.calcsize('@iiqiqiiii'), 0)  # valid = 0 while writing
+        struct.pack_into(
+            shm_time_format, self.buffer, 0,
+            1,  # mode
+            self._count,
+            clock_sec,
+            clock_nsec // 1000,
+            receive_sec,
+            receive_nsec // 1000,
+            leap,
+            self.precision,
+            0,  # nsamples
+            0,  # valid
+            clock_nsec,
+            receive_nsec,
+            *([0] * 8)
+        )
+        self._count += 1
+        struct.pack_into('@ii', self.buffer, 0, 1, self._count)
+        struct.pack_into('@i', self.buffer, struct.calcsize('@iiqiqiiii'), 1)
+
+    def read(self):
+        values = struct.unpack_from(shm_time_format, self.buffer)
+        return {
+            'mode': values[0],
+            'count': values[1],
+            'clock_time': values[2] + values[10] / 1e9,
+            'receive_time': values[4] + values[11] / 1e9,
+            'leap': values[6],
+            'precision': values[7],
+            'valid': values[9],
+        }
+
+    def close(self, remove=False):
+        self.buffer.release()
+        self._libc.shmdt(ctypes.c_void_p(self._address))
+        if remove:
+            self._libc.shmctl(self._id, IPC_RMID, None)
+
+
+class OffsetStatistics:
+    """
+    Running mean and standard deviation (jitter) of the offsets, with Welford's algorithm.
+
+    >>> stats = OffsetStatistics()
+    >>> for offset in [0.1, 0.2, 0.3]:
+    ...     stats.add(offset)
+    >>> round(stats.mean, 6), round(stats.jitter, 6)
+    (0.2, 0.1)
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.
+        self._m2 = 0.
+
+    def add(self, offset):
+        self.n += 1
+        delta = offset - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (offset - self.mean)
+
+    @property
+    def jitter(self):
+        return math.sqrt(self._m2 / (self.n - 1)) if self.n > 1 else 0.
+
+    def __str__(self):
+        return "{} samples, offset {:+.6f} s, jitter {:.6f} s".format(self.n, self.mean, self.jitter)
+
+
+def clock_time(seconds_of_day, receive_time):
+    """
+    Combine the time of day from the GPS with the date of the system clock, taking the day that is closest to the
+    system clock, so that midnight works out.
+
+    >>> clock_time(86399.5, 86400 * 10000 + 0.25) - 86400 * 10000
+    -0.5
+    """
+    day_start = math.floor(receive_time / 86400) * 86400
+    t = day_start + seconds_of_day
+    if t - receive_time > 43200:
+        t -= 86400
+    elif receive_time - t > 43200:
+        t += 86400
+    return t
+
+
+class TimePublisher:
+    """
+    Feeds an NTP SHM refclock from the serial stream. The arrival of the first valid time-bearing sentence (GGA or
+    RMC) of each epoch is timestamped as soon as it is read, corrected by a fixed serial offset (the time the receiver
+    needs to start sending after the top of the second, plus the transmission time), and written to the segment.
+
+    The statistics are of the corrected arrival time minus the GPS time, so when running with serial_offset=0 while
+    the system clock is disciplined by something else (e.g. the 1PPS refclock), their mean is the serial offset.
+
+    >>> shm = NtpShm(unit=78, key=NTP_SHM_KEY + 0x1001)
+    >>> publisher = TimePublisher(shm, serial_offset=0.1)
+    >>> publisher.add(b'$GPGGA,123519.00,4807.0380,N,01131.0000,E,1,08,0.9,545.4,M,46.9,M,,*69\\r\\n',
+    ...               receive_time=764426119.35)
+    True
+    >>> publisher.add(b'$GPRMC,123519.00,A,4807.0380,N,01131.0000,E,022.4,084.4,230394,,,A*52\\r\\n',
+    ...               receive_time=764426119.5)
+    False
+    >>> shm.read()['clock_time'], round(shm.read()['receive_time'], 6)
+    (764426119.0, 764426119.25)
+    >>> print(publisher.statistics)
+    1 samples, offset +0.250000 s, jitter 0.000000 s
+
+    The lines from common.read_lines are memoryviews:
+
+    >>> import io
+    >>> from common import read_lines
+    >>> publisher = TimePublisher(shm)
+    >>> publisher.run(read_lines(io.BytesIO(
+    ...     b'$GPGGA,123519.00,4807.0380,N,01131.0000,E,1,08,0.9,545.4,M,46.9,M,,*69\\r\\n'
+    ...     b'$GPGGA,123520.00,4807.0380,N,01131.0000,E,1,08,0.9,545.4,M,46.9,M,,*63\\r\\n'
+    ... )))
+    Traceback (most recent call last):
+    ...
+    TimeoutError: UART Timeout
+    >>> publisher.statistics.n
+    2
+    >>> shm.close(remove=True)
+    """
+
+    def __init__(self, shm, serial_offset=0.0):
+        """
+
+        :param NtpShm shm: Where to publish the samples.
+
+        :param serial_offset: Seconds from the top of the second to the arrival of the first sentence.
+
+        """
+        self.shm = shm
+        self.serial_offset = serial_offset
+        self.statistics = OffsetStatistics()
+        self._last_seconds = None
+
+    def run(self, lines):
+        """
+        :param lines: Lines straight from common.read_lines, so that they are timestamped as early as possible.
+        """
+        for line in lines:
+            receive_time = time.time()
+            if line[:1] == b'$':
+                self.add(line, receive_time)
+
+    def add(self, line, receive_time):
+        """
+        :return: Whether a sample was published.
+        """
+        if bytes(line[3:6]) not in time_sentences:
+            return False
+        fields = split_sentence(line)
+        if fields is None:
+            return False
+        i_status, good = time_sentences[fields[0][2:]]
+        if len(fields) <= i_status or fields[i_status] not in good:
+            return False
+        seconds = to_seconds(fields[1])
+        if seconds != seconds or seconds == self._last_seconds:
+            return False  # Not the first sentence of this epoch.
+        self._last_seconds = seconds
+
+        corrected = receive_time - self.serial_offset
+        t = clock_time(seconds, corrected)
+        self.shm.write(clock_time=t, receive_time=corrected)
+        self.statistics.add(corrected - t)
+        return True
@@ -1,21 +1,24 @@
 #!/usr/bin/env python3
 
+import argparse
 import serial
-import input_messages
-import time
+import profiling
 from common import port, baudrate
+from reconcile import reconcile, print_changes
 
-msgs = [
-    input_messages.QueryPositionPinningMessage(),
-    input_messages.ConfigurePositionPinningMessage(enable_position_pinning=False),
-    input_messages.QueryPositionPinningMessage(),
-]
+parser = argparse.ArgumentParser(description="Turn off position pinning, unless it already is off.")
+profiling.add_arguments(parser)
 
-with serial.Serial(
-    port=port,
-    baudrate=baudrate
-) as ser:
-    for msg in msgs:
-        print(msg)
-        ser.write(bytes(msg))
-        time.sleep(1)
+
+def main():
+    with serial.Serial(
+        port=port,
+        baudrate=baudrate,
+        timeout=1
+    ) as ser:
+        print_changes(reconcile(ser, {'position_pinning': False}, on_message=print))
+
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(main, args)
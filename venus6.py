@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+"""
+One command for everything. Each subcommand only imports what it needs, and the shell subcommand keeps the ports open
+and the modules loaded for a sequence of commands.
+
+Examples:
+
+    ./venus6.py watch
+    ./venus6.py --port /dev/ttyUSB0 --port /dev/ttyUSB1 configure-datum 0
+    ./venus6.py shell
+"""
+
+import argparse
+import shlex
+import sys
+
+import profiling
+from common import port as default_port, baudrate as default_baudrate
+
+
+def watch(sers, args):
+    import threading
+    import time
+    from common import interpret_messages, read_lines
+    from serialize import TEXT, MessageFormatter, BlockWriter
+
+    limit = args.frames
+    if limit is None and args.profile:
+        limit = args.profile_frames
+    stop = threading.Event()
+    writer = None if args.output_format == TEXT else BlockWriter(sys.stdout.buffer)
+
+    def watch_port(port, ser):
+        prefix = "{}: ".format(port) if len(sers) > 1 else ''
+        formatter = None if writer is None else MessageFormatter(args.output_format, port=port)
+        n_messages = 0
+        if args.hotplug:
+            from hotplug import HotplugPort
+            hotplug_port = HotplugPort(port, ser=ser, baudrate=ser.baudrate, max_timeouts=None)
+        while not stop.is_set():
+            try:
+                lines = hotplug_port.lines() if args.hotplug else read_lines(ser)
+                for msg in interpret_messages(lines, skip_nmea=not args.nmea):
+                    if writer is None:
+                        print("{}{}".format(prefix, msg))
+                    else:
+                        writer.write(formatter.format(msg, time.time()))
+                    n_messages += 1
+                    if n_messages == limit or stop.is_set():
+                        return
+            except TimeoutError:
+                continue
+
+    try:
+        if len(sers) == 1:
+            # In the main thread, so that it can be profiled.
+            watch_port(*next(iter(sers.items())))
+            return
+
+        threads = [
+            threading.Thread(target=watch_port, args=(port, ser), daemon=True)
+            for port, ser in sers.items()
+        ]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(0.1)
+        finally:
+            stop.set()
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def aggregate(sers, args):
+    import threading
+    from aggregate import WindowAggregator
+    from common import interpret_messages, read_lines_ignoring_timeouts
+
+    if args.workers:
+        aggregate_in_processes(sers, args)
+        return
+
+    def aggregate_port(port, ser):
+        prefix = "{}: ".format(port) if len(sers) > 1 else ''
+        aggregator = WindowAggregator(length=args.window, offset=args.offset)
+        messages = profiling.limit_frames(interpret_messages(read_lines_ignoring_timeouts(ser)), args)
+        for summary in aggregator.aggregate(messages):
+            print("{}{}".format(prefix, summary))
+
+    threads = [
+        threading.Thread(target=aggregate_port, args=(port, ser), daemon=True)
+        for port, ser in sers.items()
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        while thread.is_alive():
+            thread.join(0.1)
+
+
+def aggregate_in_processes(sers, args):
+    import functools
+    import parallel
+
+    def print_result(port, output):
+        print("{}{}".format("{}: ".format(port) if len(sers) > 1 else '', output))
+
+    def print_utilization(utilization):
+        print(utilization, file=sys.stderr)
+
+    baudrates = {port: ser.baudrate for port, ser in sers.items()}
+    # The reader processes open the ports themselves.
+    for ser in sers.values():
+        ser.close()
+    try:
+        totals = parallel.run(
+            sers, functools.partial(parallel.AggregatingProcessor, length=args.window, offset=args.offset),
+            n_workers=args.workers, baudrates=baudrates, report_interval=args.report_interval,
+            on_result=print_result, on_utilization=print_utilization)
+    finally:
+        for ser in sers.values():
+            ser.open()
+    for utilization in sorted(totals, key=lambda u: u.worker):
+        print_utilization(utilization)
+
+
+def query(sers, args):
+    import input_messages
+    from writer import BurstWriter
+
+    for port, ser in sers.items():
+        writer = BurstWriter(ser, on_message=print)
+        for msg in [
+            input_messages.QueryPositionPinningMessage(),
+            input_messages.QueryPositionUpdateRateMessage(),
+            input_messages.QuerySoftwareVersionMessage(software_type=0),
+            input_messages.QuerySoftwareCrcMessage(),
+            input_messages.QueryDatumMessage(),
+            input_messages.QueryNavigationModeMessage(),
+            input_messages.QueryPpsModeMessage(),
+            input_messages.QueryWaasStatusMessage(),
+        ]:
+            writer.queue(msg)
+        writer.flush()
+
+
+def configure(sers, desired, args):
+    from device_cache import DeviceCache, device_id
+    from reconcile import reconcile, print_changes
+
+    cache = DeviceCache(args.device_cache)
+    for port, ser in sers.items():
+        print("{}:".format(port))
+        changes = reconcile(ser, desired, permanent=not args.temporary, on_message=print)
+        print_changes(changes)
+        cache.update(device_id(port), configuration={name: new for name, (previous, new) in changes.items()})
+    cache.save()
+
+
+def configure_datum(sers, args):
+    configure(sers, {'datum': args.datum_index}, args)
+
+
+def configure_update_rate(sers, args):
+    from bandwidth import ensure_bandwidth
+
+    for ser in sers.values():
+        ensure_bandwidth(ser, args.rate, current_baudrate=ser.baudrate, permanent=not args.temporary,
+                         on_message=print)
+    configure(sers, {'update_rate': args.rate}, args)
+
+
+def position_pinning(sers, args):
+    configure(sers, {'position_pinning': args.state == 'on'}, args)
+
+
+def configure_uart(sers, args):
+    from client import Client
+    from common import look_for_ack
+    from input_messages import ConfigureSerialPortMessage
+
+    for port, ser in sers.items():
+        with Client(ser, skip_nmea=True) as client:
+            i_br, current_baudrate = client.detect_baudrate(look_for_ack_limit=50, retries=2)
+            if current_baudrate == args.rate:
+                print("{}: Baudrate is already set to the desired value of {} bps.".format(port, args.rate))
+                continue
+            print("{}: Setting baudrate from {} to {} bps...".format(port, current_baudrate, args.rate))
+            client.write(ConfigureSerialPortMessage(rate=args.rate, permanent=not args.temporary))
+            look_for_ack(messages=client, msg_id=ConfigureSerialPortMessage.msg_id, limit=25)
+        ser.baudrate = args.rate
+
+
+def rollout(sers, args):
+    from device_cache import DeviceCache, device_id
+    from rollout import OK, rollout, print_results
+
+    config = {}
+    if args.baudrate_setting is not None:
+        config['baudrate'] = args.baudrate_setting
+    if args.datum is not None:
+        config['datum'] = args.datum
+    if args.update_rate is not None:
+        config['update_rate'] = args.update_rate
+    if args.position_pinning is not None:
+        config['position_pinning'] = args.position_pinning == 'on'
+    if not config:
+        raise ValueError("Nothing to configure.")
+    cache = DeviceCache(args.device_cache)
+    last_baudrates = {}
+    for port in sers:
+        entry = cache.get(device_id(port))
+        if entry is not None:
+            last_baudrates[port] = entry['baudrate']
+    results = rollout(sers, config, concurrency=args.concurrency, retries=args.retries, permanent=not args.temporary,
+                      last_baudrates=last_baudrates)
+    print_results(results)
+    for r in results:
+        if r.status == OK:
+            cache.update(device_id(r.port), baudrate=r.baudrate, configuration={
+                name: new for name, (previous, new) in r.changes.items() if name != 'baudrate'})
+    cache.save()
+
+
+def identify(sers, args):
+    from device_cache import DeviceCache, device_id, discover, full_discovery, print_identity
+
+    cache = DeviceCache(args.device_cache)
+    for port, ser in sers.items():
+        if args.refresh:
+            cache.put(device_id(port), full_discovery(ser, last_baudrate=ser.baudrate))
+            entry = cache.get(device_id(port))
+        else:
+            entry = discover(ser, port, cache)
+        print_identity(port, entry)
+    cache.save()
+
+
+def discover_all(sers, args):
+    """
+    Set the baud rate of each port to that of its receiver, trusting the device cache after one query.
+    """
+    import concurrent.futures
+    from device_cache import DeviceCache, discover
+
+    cache = DeviceCache(args.device_cache)
+
+    def discover_port(port):
+        try:
+            discover(sers[port], port, cache)
+        except (RuntimeError, TimeoutError) as e:
+            print("{}: {} Using {} bps.".format(port, e, default_baudrate))
+            sers[port].baudrate = default_baudrate
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8, thread_name_prefix='venus6-discover') as pool:
+        list(pool.map(discover_port, sers))
+    cache.save()
+
+
+def use_cached_baudrates(sers, args):
+    """
+    Set the baud rate of each port to the one in the device cache, without sending anything, for the commands that
+    only listen.
+    """
+    from device_cache import DeviceCache, device_id
+
+    cache = DeviceCache(args.device_cache)
+    for port, ser in sers.items():
+        entry = cache.get(device_id(port))
+        if entry is not None:
+            ser.baudrate = entry['baudrate']
+
+
+def time_service(sers, args):
+    from common import read_lines_ignoring_timeouts
+    from timeservice import NtpShm, TimePublisher
+
+    if len(sers) != 1:
+        raise ValueError("The time service needs exactly one port.")
+    ser = next(iter(sers.values()))
+    if args.pps:
+        configure(sers, {'pps_mode': 1}, args)
+    shm = NtpShm(unit=args.unit)
+    publisher = TimePublisher(shm, serial_offset=args.serial_offset)
+    try:
+        publisher.run(profiling.limit_frames(read_lines_ignoring_timeouts(ser), args))
+    finally:
+        shm.close()
+        print(publisher.statistics)
+
+
+def gpsd(sers, args):
+    import asyncio
+    from common import interpret_messages, read_lines_ignoring_timeouts
+    from gpsd_server import GpsdServer
+
+    server = GpsdServer(sers.keys())
+    streams = {
+        port: profiling.limit_frames(interpret_messages(read_lines_ignoring_timeouts(ser)), args)
+        for port, ser in sers.items()
+    }
+    print("Serving gpsd JSON on {}:{}".format(args.host, args.listen_port))
+    asyncio.run(server.serve(streams, host=args.host, port=args.listen_port))
+
+
+def latest_fix(sers, args):
+    from common import interpret_messages, read_lines_ignoring_timeouts
+    from input_messages import QueryDatumMessage
+    from latest_fix import LatestFixPublisher
+
+    if len(sers) != 1:
+        raise ValueError("The latest fix publisher needs exactly one port.")
+    ser = next(iter(sers.values()))
+    publisher = LatestFixPublisher(name=args.name)
+    try:
+        ser.write(bytes(QueryDatumMessage()))
+        publisher.run(profiling.limit_frames(interpret_messages(read_lines_ignoring_timeouts(ser)), args))
+    finally:
+        publisher.close(unlink=True)
+
+
+def shell(sers, args):
+    parser = make_parser(in_shell=True)
+    discovered = args.baudrate is not None
+    while True:
+        try:
+            line = input('venus6> ')
+        except EOFError:
+            print()
+            return
+        words = shlex.split(line)
+        if not words:
+            continue
+        if words[0] in ('exit', 'quit'):
+            return
+        try:
+            command_args = parser.parse_args(words)
+        except SystemExit:
+            continue  # argparse already printed the problem.
+        command_args.device_cache = args.device_cache
+        try:
+            if getattr(command_args, 'discover', False) and not discovered:
+                discover_all(sers, args)
+                discovered = True
+            profiling.run(lambda: command_args.command(sers, command_args), command_args)
+        except KeyboardInterrupt:
+            print()
+        except Exception as e:
+            print("{}: {}".format(type(e).__name__, e))
+
+
+def make_parser(in_shell=False):
+    parser = argparse.ArgumentParser(
+        prog='venus6' if in_shell else None,
+        description=None if in_shell else "Talk to SkyTraq Venus 6 GPS receivers.",
+    )
+    if not in_shell:
+        parser.add_argument('--port', action='append', dest='ports', metavar='PORT',
+                            help="Serial port of a receiver. Repeat for several receivers. Default: {}".format(
+                                default_port))
+        parser.add_argument('--baudrate', type=int,
+                            help="Skip the discovery. By default, the baud rate of each receiver is taken from the "
+                                 "device cache. Commands that send messages to the receivers confirm it with one "
+                                 "query, or detect it if that fails.")
+        parser.add_argument('--device-cache', metavar='PATH',
+                            help="Default: venus6/devices.json in $XDG_CACHE_HOME or ~/.cache")
+    profiling.add_arguments(parser)
+    subparsers = parser.add_subparsers(metavar='COMMAND')
+    subparsers.required = True
+
+    p = subparsers.add_parser('watch', help="Print the messages from the receivers.")
+    p.add_argument('--nmea', action='store_true', help="Also print NMEA sentences.")
+    p.add_argument('--frames', type=int, metavar='N', help="Stop after N messages per receiver.")
+    p.add_argument('--hotplug', action='store_true',
+                   help="When a receiver is unplugged, wait for it to come back instead of timing out.")
+    p.add_argument('--format', choices=['text', 'jsonl', 'csv', 'raw'], default='text', dest='output_format',
+                   help="text is for people. jsonl, csv and raw are for other programs, and are written in blocks. "
+                        "Default: text")
+    p.set_defaults(command=watch)
+
+    p = subparsers.add_parser('aggregate', help="Print windowed averages of the fixes.")
+    p.add_argument('--window', type=float, default=1.0, metavar='SECONDS', help="Length of a window. Default: 1")
+    p.add_argument('--offset', type=float, default=0.0, metavar='SECONDS',
+                   help="Windows start at OFFSET + k * WINDOW seconds (POSIX time). Default: 0")
+    p.add_argument('--workers', type=int, default=0, metavar='N',
+                   help="Decode and aggregate in N worker processes, with a reader process per port, instead of in "
+                        "this process. Default: 0")
+    p.add_argument('--report-interval', type=float, default=10.0, metavar='SECONDS',
+                   help="With --workers, print how busy each worker is this often. Default: 10")
+    p.set_defaults(command=aggregate)
+
+    p = subparsers.add_parser('query', help="Send all query messages and print the answers.")
+    p.set_defaults(command=query, discover=True)
+
+    p = subparsers.add_parser('configure-datum', help="Set the datum, unless it is already set.")
+    p.add_argument('datum_index', type=int, nargs='?', default=0)
+    p.add_argument('--temporary', action='store_true', help="Only update SRAM, not FLASH.")
+    p.set_defaults(command=configure_datum, discover=True)
+
+    p = subparsers.add_parser('configure-update-rate', help="Set the position update rate, unless it is already set.")
+    p.add_argument('rate', type=int, nargs='?', default=20)
+    p.add_argument('--temporary', action='store_true', help="Only update SRAM, not FLASH.")
+    p.set_defaults(command=configure_update_rate, discover=True)
+
+    p = subparsers.add_parser('position-pinning', help="Turn position pinning on or off, unless it already is.")
+    p.add_argument('state', choices=['on', 'off'])
+    p.add_argument('--temporary', action='store_true', help="Only update SRAM, not FLASH.")
+    p.set_defaults(command=position_pinning, discover=True)
+
+    p = subparsers.add_parser('configure-uart', help="Detect the baud rate, and change it if it is not the given one.")
+    p.add_argument('rate', type=int, nargs='?', default=default_baudrate)
+    p.add_argument('--temporary', action='store_true', help="Only update SRAM, not FLASH.")
+    p.set_defaults(command=configure_uart)
+
+    p = subparsers.add_parser('rollout', help="Configure all receivers at once, and print a table of the results.")
+    p.add_argument('--set-baudrate', type=int, dest='baudrate_setting', metavar='RATE')
+    p.add_argument('--datum', type=int, metavar='INDEX')
+    p.add_argument('--update-rate', type=int, metavar='HZ')
+    p.add_argument('--position-pinning', choices=['on', 'off'])
+    p.add_argument('--concurrency', type=int, default=8, help="Maximum number of receivers at a time. Default: 8")
+    p.add_argument('--retries', type=int, default=2, help="Default: 2")
+    p.add_argument('--temporary', action='store_true', help="Only update SRAM, not FLASH.")
+    p.set_defaults(command=rollout)
+
+    p = subparsers.add_parser('identify', help="Print the software version, CRC, baud rate and settings.")
+    p.add_argument('--refresh', action='store_true', help="Query everything again, even if the cache is confirmed.")
+    p.set_defaults(command=identify)
+
+    p = subparsers.add_parser('time-service', help="Feed the NTP shared memory refclock of chrony or ntpd.")
+    p.add_argument('--unit', type=int, default=0, help="SHM unit number, as in the refclock configuration.")
+    p.add_argument('--serial-offset', type=float, default=0.0, metavar='SECONDS',
+                   help="Delay from the top of the second to the arrival of the first sentence.")
+    p.add_argument('--pps', action='store_true', help="Also turn on the 1PPS output, for a PPS refclock.")
+    p.add_argument('--temporary', action='store_true', help="Only update SRAM, not FLASH.")
+    p.set_defaults(command=time_service, discover=True)
+
+    p = subparsers.add_parser('gpsd', help="Serve the fixes to gpsd clients over TCP.")
+    p.add_argument('--host', default='127.0.0.1', help="Address to listen on. Default: 127.0.0.1")
+    p.add_argument('--listen-port', type=int, default=2947, help="TCP port to listen on. Default: 2947")
+    p.set_defaults(command=gpsd)
+
+    p = subparsers.add_parser('latest-fix', help="Keep the latest fix in shared memory for other processes.")
+    p.add_argument('--name', default='venus6-latest-fix', help="Name of the shared memory block.")
+    p.set_defaults(command=latest_fix, discover=True)
+
+    if not in_shell:
+        p = subparsers.add_parser('shell', help="Keep the ports open and read commands from stdin.")
+        p.set_defaults(command=shell)
+
+    return parser
+
+
+def main(argv=None):
+    args = make_parser().parse_args(argv)
+
+    import contextlib
+    import serial
+
+    with contextlib.ExitStack() as stack:
+        sers = {
+            port: stack.enter_context(serial.serial_for_url(
+                port, baudrate=args.baudrate if args.baudrate is not None else default_baudrate, timeout=1))
+            for port in (args.ports or [default_port])
+        }
+        if args.baudrate is None:
+            if getattr(args, 'discover', False):
+                discover_all(sers, args)
+            else:
+                use_cached_baudrates(sers, args)
+        if args.command is shell:
+            shell(sers, args)
+        else:
+            profiling.run(lambda: args.command(sers, args), args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,34 @@
 #!/usr/bin/env python3
 
+import argparse
+import sys
+import time
+
 import serial
+import profiling
 from common import port, baudrate, interpret_messages, read_lines
+from serialize import formats, TEXT, MessageFormatter, BlockWriter
+
+parser = argparse.ArgumentParser(description="Print the binary messages from the GPS unit.")
+parser.add_argument('--format', choices=formats, default=TEXT, dest='output_format',
+                    help="text is for people. jsonl, csv and raw are for other programs, and are written in blocks. "
+                         "Default: text")
+profiling.add_arguments(parser)
+
+
+def main():
+    with serial.Serial(port=port, baudrate=baudrate) as ser:
+        messages = profiling.limit_frames(interpret_messages(read_lines(ser), skip_nmea=True), args)
+        if args.output_format == TEXT:
+            for msg in messages:
+                print(msg)
+            return
+        formatter = MessageFormatter(args.output_format, port=port)
+        with BlockWriter(sys.stdout.buffer) as writer:
+            for msg in messages:
+                writer.write(formatter.format(msg, time.time()))
 
 
-with serial.Serial(port=port, baudrate=baudrate) as ser:
-    for msg in interpret_messages(read_lines(ser), skip_nmea=True):
-        print(msg)
+if __name__ == '__main__':
+    args = parser.parse_args()
+    profiling.run(main, args)
@@ -0,0 +1,164 @@
+import time
+
+from common import read_lines
+
+
+def read_messages(ser):
+    """
+    The binary messages from ser, with a None for every NMEA sentence, invalid frame and timeout of the port in between,
+    so that whoever waits for a message can check a deadline even while the receiver only sends NMEA or nothing at
+    all. Unlike interpret_messages(read_lines_ignoring_timeouts(ser)), it never gives up.
+
+    >>> import io
+    >>> messages = read_messages(io.BytesIO(b'$GPGGA,1*00\\r\\n' + bytes.fromhex('a0a100028339ba0d0a')))
+    >>> [type(next(messages)).__name__ for _ in range(4)]
+    ['NoneType', 'AckMessage', 'NoneType', 'NoneType']
+    """
+    from output_messages import Decoder, INVALID
+
+    decoder = Decoder()
+    while True:
+        try:
+            for line in read_lines(ser):
+                if line[:1] == b'$':
+                    yield None
+                    continue
+                result = decoder.decode(line)
+                yield None if result.kind is INVALID else result.message
+        except TimeoutError:
+            yield None
+
+
+class BurstWriter:
+    """
+    Writes queued InputMessages to the GPS unit, packing several frames into each write, and waits for their ACKs
+    instead of sleeping a fixed time between messages.
+
+    The number of frames per write (the window) adapts to the observed ACK timing: as long as the time per frame from
+    write to ACK stays close to the best time seen so far, the receiver keeps up and the window grows. When it gets
+    slower, the receiver is queueing, and the window shrinks. A missing ACK halves the window and the unacknowledged
+    frames are sent again.
+
+    >>> import io
+    >>> from input_messages import ConfigurePositionPinningMessage
+    >>> class FakeSerial(io.BytesIO):
+    ...     def write(self, b):
+    ...         print(b.hex())
+    >>> ser = FakeSerial(bytes.fromhex('a0a100028339ba0d0a' * 2))
+    >>> writer = BurstWriter(ser, initial_window=2)
+    >>> writer.queue(ConfigurePositionPinningMessage(False))
+    >>> writer.queue(ConfigurePositionPinningMessage(False))
+    >>> len(writer.flush())
+    a0a100023900390d0aa0a100023900390d0a
+    2
+    """
+
+    def __init__(self, ser, messages=None, max_burst_bytes=128, initial_window=1, max_window=8, ack_timeout=2.0,
+                 retries=2, on_message=None):
+        """
+
+        :param Serial ser: The serial interface. Has to have a write method which accepts bytes.
+
+        :param messages: Iterable of interpreted messages from the GPS unit, used to look for ACKs. It may yield None
+        to let the writer check the ACK timeout without a message. By default, read_messages(ser).
+
+        :param max_burst_bytes: Never write more than this number of bytes at once (unless a single frame is longer),
+        so that the input buffer of the receiver does not overflow.
+
+        :param initial_window: Number of frames in the first write.
+
+        :param max_window: Maximum number of frames in one write.
+
+        :param ack_timeout: Seconds to wait for the ACK of each frame in a write.
+
+        :param retries: Number of times to send a frame again if it is not acknowledged in time.
+
+        :param on_message: Called with every message that is read while waiting for ACKs, e.g. print.
+
+        """
+        self.ser = ser
+        if messages is None:
+            messages = read_messages(ser)
+        self.messages = iter(messages)
+        self.max_burst_bytes = max_burst_bytes
+        self.window = initial_window
+        self.max_window = max_window
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self.on_message = on_message
+        self.best_frame_time = None
+        self.pending = []
+
+    def queue(self, msg):
+        self.pending.append([msg, 0])
+
+    def flush(self):
+        """
+        Write all queued messages.
+
+        :return: A list of (message, seconds from write to ACK) tuples, in the order the ACKs arrived.
+        """
+        acknowledged = []
+        while self.pending:
+            burst = self._take_burst()
+            acked, elapsed = self._write_burst(burst)
+            acknowledged += acked
+            unacked = [entry for entry in burst if entry[0] not in [msg for msg, _ in acked]]
+            if unacked:
+                self.window = max(1, self.window // 2)
+                for entry in unacked:
+                    entry[1] += 1
+                    if entry[1] > self.retries:
+                        raise TimeoutError("No ACK for '{}' after {} attempts.".format(entry[0].name, entry[1]))
+                self.pending = unacked + self.pending
+            else:
+                self._adapt_window(elapsed / len(burst))
+        return acknowledged
+
+    def _take_burst(self):
+        burst = [self.pending.pop(0)]
+        n_bytes = len(bytes(burst[0][0]))
+        while self.pending and len(burst) < self.window:
+            n = len(bytes(self.pending[0][0]))
+            if n_bytes + n > self.max_burst_bytes:
+                break
+            burst.append(self.pending.pop(0))
+            n_bytes += n
+        return burst
+
+    def _write_burst(self, burst):
+        from output_messages import AckMessage, NackMessage
+
+        waiting = [msg for msg, _ in burst]
+        acked = []
+        t_sent = time.monotonic()
+        deadline = t_sent + self.ack_timeout * len(burst)
+        self.ser.write(b''.join(bytes(msg) for msg in waiting))
+        elapsed = 0
+        while waiting and time.monotonic() < deadline:
+            try:
+                m = next(self.messages)
+            except StopIteration:
+                break
+            if m is None:
+                continue
+            if self.on_message is not None:
+                self.on_message(m)
+            if type(m) is NackMessage:
+                raise RuntimeError("Got NACK: {}".format(m))
+            if type(m) is AckMessage:
+                for msg in waiting:
+                    if msg.msg_id == m.values[0].value:
+                        elapsed = time.monotonic() - t_sent
+                        waiting.remove(msg)
+                        acked.append((msg, elapsed))
+                        break
+        return acked, elapsed
+
+    def _adapt_window(self, frame_time):
+        if self.best_frame_time is None or frame_time < self.best_frame_time:
+            self.best_frame_time = frame_time
+        if frame_time <= 1.5 * self.best_frame_time:
+            self.window = min(self.max_window, self.window + 1)
+        else:
+            self.window = max(1, self.window - 1)